@@ -1,6 +1,7 @@
 # app/models/auth.py
 from pydantic import BaseModel, EmailStr
 from datetime import datetime
+from typing import List, Optional
 
 class RegisterRequest(BaseModel):
     email: str
@@ -20,6 +21,33 @@ class LoginRequest(BaseModel):
 class LoginResponse(BaseModel):
     access_token: str
     expires_in: int
+    refresh_token: Optional[str] = None
+    refresh_expires_in: Optional[int] = None
+
+class RefreshRequest(BaseModel):
+    refresh_token: str
+
+class RevokedSession(BaseModel):
+    session_id: str
+    expires_at: int  # unix-время
+
+class RevocationsResponse(BaseModel):
+    sessions: List[RevokedSession]
+    cursor: int
+    has_more: bool
+
+class ImportConflict(BaseModel):
+    record: int
+    email: Optional[str] = None
+    reason: str
+
+class UserImportResponse(BaseModel):
+    import_id: str
+    status: str
+    processed: int
+    inserted: int
+    conflicts: int
+    conflict_rows: List[ImportConflict]  # первые IMPORT_CONFLICTS_SHOWN
 
 class BaseResponse(BaseModel):
     text: str
\ No newline at end of file
@@ -1,12 +1,28 @@
-from fastapi import APIRouter, HTTPException
+import hmac
+import os
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, Response
+from fastapi.responses import JSONResponse
 
 from app.auth.auth import LoginRequest, LoginResponse, BaseResponse
 from app.auth.auth import RegisterRequest, RegisterResponse
+from app.auth.auth import RefreshRequest, RevocationsResponse, UserImportResponse
 from app.auth.auth_service import AuthService
+from app.auth.passwords import HashingOverloaded
+from app.auth.user_import_service import FORMAT_CSV, FORMAT_NDJSON, UserImportService
+
+# без токена административные ручки отключены
+ADMIN_API_TOKEN = os.getenv("ADMIN_API_TOKEN", "")
 
 auth_router = APIRouter(tags=["Authentication"])
 
 
+def require_admin(x_admin_token: str = Header("")):
+    if not ADMIN_API_TOKEN or not hmac.compare_digest(x_admin_token.encode("utf-8"), ADMIN_API_TOKEN.encode("utf-8")):
+        raise HTTPException(status_code=403, detail="Forbidden")
+
+
 @auth_router.get("/", response_model=BaseResponse)
 async def test():
     return BaseResponse(text="Hellow")
@@ -17,6 +33,8 @@ async def register_user(request: RegisterRequest):
     service = AuthService()
     try:
         return await service.register(request)
+    except HashingOverloaded as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
@@ -27,7 +45,83 @@ async def login_user(request: LoginRequest):
     service = AuthService()
     try:
         return await service.login(request)
+    except HashingOverloaded as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    except ValueError as e:
+        raise HTTPException(status_code=401, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail="Internal Server Error: " + str(e))
+
+
+@auth_router.post("/refresh", response_model=LoginResponse)
+async def refresh_tokens(request: RefreshRequest):
+    service = AuthService()
+    try:
+        return await service.refresh(request)
     except ValueError as e:
         raise HTTPException(status_code=401, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail="Internal Server Error: " + str(e))
+
+
+@auth_router.post("/logout", status_code=204)
+async def logout_user(request: RefreshRequest):
+    service = AuthService()
+    try:
+        await service.logout(request)
+        return Response(status_code=204)
+    except ValueError as e:
+        raise HTTPException(status_code=401, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail="Internal Server Error: " + str(e))
+
+
+@auth_router.get("/.well-known/jwks.json")
+async def get_jwks():
+    service = AuthService()
+    try:
+        # сервисы и так перечитывают ключи в фоне; кэш снимает нагрузку с внешних клиентов
+        return JSONResponse(await service.get_jwks(), headers={"Cache-Control": "public, max-age=300"})
+    except Exception as e:
+        raise HTTPException(status_code=500, detail="Internal Server Error: " + str(e))
+
+
+@auth_router.get("/revocations", response_model=RevocationsResponse)
+async def get_revocations(since: int = Query(0, ge=0)):
+    service = AuthService()
+    try:
+        return await service.get_revocations(since)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail="Internal Server Error: " + str(e))
+
+
+@auth_router.post("/admin/users/bulk", response_model=UserImportResponse, dependencies=[Depends(require_admin)])
+async def bulk_import_users(request: Request, import_id: Optional[str] = Query(None)):
+    """
+    Streams users as NDJSON or CSV (Content-Type: text/csv) with email,
+    full_name and password or password_hash. An interrupted upload is resumed
+    by sending the same body again with the returned import_id.
+    """
+    fmt = FORMAT_CSV if request.headers.get("content-type", "").startswith("text/csv") else FORMAT_NDJSON
+    service = UserImportService()
+    try:
+        return await service.run(import_id, request.stream(), fmt)
+    except HashingOverloaded as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail="Internal Server Error: " + str(e))
+
+
+@auth_router.get(
+    "/admin/users/bulk/{import_id}", response_model=UserImportResponse, dependencies=[Depends(require_admin)]
+)
+async def get_bulk_import(import_id: str):
+    service = UserImportService()
+    try:
+        return await service.get_import(import_id)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail="Internal Server Error: " + str(e))
\ No newline at end of file
@@ -1,76 +1,274 @@
+import asyncio
+import hashlib
+import logging
+import os
+import secrets
 import time
-from datetime import datetime, timedelta
+import uuid
+from datetime import datetime, timedelta, timezone
 
-from sqlalchemy import select
-from sqlalchemy.exc import IntegrityError
+from sqlalchemy import DateTime, select, update, delete, literal, or_
+from sqlalchemy.dialects.postgresql import insert
 
 from app.auth.auth import RegisterRequest, RegisterResponse, LoginRequest, LoginResponse
+from app.auth.auth import RefreshRequest, RevocationsResponse, RevokedSession
 from app.auth.db import SessionLocal
+from app.auth.passwords import get_passwords
 from app.auth.profile_db import ProfileDB
+from app.auth.refresh_token_db import RefreshTokenDB, RevokedSessionDB
+from app.auth.signing_keys import get_key_ring
 from app.auth.subscription_db import SubscriptionDB
 from app.auth.user_db import UserDB
 
-import jwt
+ACCESS_TOKEN_TTL = int(os.getenv("ACCESS_TOKEN_TTL", 600))
+REFRESH_TOKEN_TTL = int(os.getenv("REFRESH_TOKEN_TTL", 30 * 24 * 3600))
+# запас на расхождение часов: столько отозванная сессия держится в списке после истечения access-токенов
+CLOCK_SKEW = 60
+REVOCATION_PAGE_SIZE = int(os.getenv("REVOCATION_PAGE_SIZE", 1000))
+TOKEN_PRUNE_INTERVAL = int(os.getenv("TOKEN_PRUNE_INTERVAL", 3600))
+DEFAULT_STORAGE_LIMIT = 2147483647  # лимит по ТЗ, можно заменить
+DEFAULT_PLAN = "basic"
+DEFAULT_PLAN_DAYS = 30
+
+logger = logging.getLogger(__name__)
+
+
+def insert_users(users: list):
+    """
+    One statement that inserts users together with their profiles and default
+    subscriptions. Users whose email is already taken are skipped; the result
+    rows (id, email, created_at) are the users actually created.
+    """
+    new_users = (
+        insert(UserDB)
+        .values(users)
+        .on_conflict_do_nothing(index_elements=[UserDB.email])
+        .returning(UserDB.id, UserDB.email, UserDB.created_at)
+        .cte("new_users")
+    )
+    profiles = insert(ProfileDB).from_select(
+        ["user_id", "storage_used", "storage_limit"],
+        select(new_users.c.id, literal(0), literal(DEFAULT_STORAGE_LIMIT)),
+    ).cte("new_profiles")
+    subscriptions = insert(SubscriptionDB).from_select(
+        ["user_id", "plan", "renewal_date"],
+        select(
+            new_users.c.id,
+            literal(DEFAULT_PLAN),
+            literal(datetime.utcnow() + timedelta(days=DEFAULT_PLAN_DAYS), DateTime),
+        ),
+    ).cte("new_subscriptions")
+    return select(new_users.c.id, new_users.c.email, new_users.c.created_at).add_cte(profiles, subscriptions)
+
+
+def hash_token(token: str) -> str:
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
 
-SECRET_KEY = "supersecret"  # пример для учебного кейса
 
 class AuthService:
+    def __init__(self, passwords=None, keys=None):
+        self.passwords = passwords or get_passwords()
+        self.keys = keys or get_key_ring()
+
     async def register(self, data: RegisterRequest) -> RegisterResponse:
+        password_hash = await self.passwords.hash(data.password)
+        user = dict(
+            id=uuid.uuid4(),
+            email=data.email,
+            full_name=data.full_name,
+            password=password_hash,
+            created_at=datetime.utcnow(),
+        )
         async with SessionLocal() as session:
-            db_user = UserDB(
-                email=data.email,
-                password=data.password,
-                full_name=data.full_name,
-            )
-            session.add(db_user)
-            try:
-                await session.commit()
-                await session.refresh(db_user)
-            except IntegrityError:
+            result = await session.execute(insert_users([user]))
+            created = result.one_or_none()
+            if created is None:
                 raise ValueError("Пользователь с таким email уже существует")
+            await session.commit()
+        return RegisterResponse(
+            id=str(created.id),
+            email=created.email,
+            full_name=data.full_name,
+            created_at=created.created_at,
+        )
 
-            # Создаём профиль пользователя
-            db_profile = ProfileDB(
-                user_id=db_user.id,
-                storage_used=0,
-                storage_limit=2147483647  # лимит по ТЗ, можно заменить
-            )
-            session.add(db_profile)
+    async def login(self, data: LoginRequest) -> LoginResponse:
+        async with SessionLocal() as session:
+            result = await session.execute(select(UserDB).where(UserDB.email == data.email))
+            user = result.scalar_one_or_none()
+        # соединение с БД не держим, пока запрос ждёт своей очереди на KDF
+        valid, new_hash = await self.passwords.verify(user.password if user else None, data.password)
+        if not valid:
+            raise ValueError("Неверный email или пароль")
+        async with SessionLocal() as session:
+            if new_hash is not None:
+                # открытый пароль или хэш со старыми параметрами заменяем при первом успешном входе
+                await session.execute(
+                    update(UserDB)
+                    .where(UserDB.id == user.id, UserDB.password == user.password)
+                    .values(password=new_hash)
+                )
+            response = await self._issue(session, user.id, user.email, uuid.uuid4())
+            await session.commit()
+        return response
+
+    async def _issue(self, session, user_id, email: str, session_id) -> LoginResponse:
+        """
+        Adds a new refresh token of the session to the caller's transaction and
+        returns it with a fresh access token.
+        """
+        refresh_token = secrets.token_urlsafe(32)
+        session.add(RefreshTokenDB(
+            token_hash=hash_token(refresh_token),
+            user_id=user_id,
+            session_id=session_id,
+            expires_at=datetime.utcnow() + timedelta(seconds=REFRESH_TOKEN_TTL),
+        ))
+        access_token = await self.keys.sign({
+            "sub": str(user_id),
+            "email": email,
+            "sid": str(session_id),
+            "exp": int(time.time()) + ACCESS_TOKEN_TTL,
+        })
+        return LoginResponse(
+            access_token=access_token,
+            expires_in=ACCESS_TOKEN_TTL,
+            refresh_token=refresh_token,
+            refresh_expires_in=REFRESH_TOKEN_TTL,
+        )
+
+    async def _revoke_sessions(self, session, session_ids) -> None:
+        now = datetime.utcnow()
+        await session.execute(
+            update(RefreshTokenDB)
+            .where(RefreshTokenDB.session_id.in_(session_ids), RefreshTokenDB.revoked_at.is_(None))
+            .values(revoked_at=now)
+        )
+        # access-токены сессии ещё живы до ACCESS_TOKEN_TTL — их отсекают сервисы по этому списку
+        expires_at = now + timedelta(seconds=ACCESS_TOKEN_TTL + CLOCK_SKEW)
+        await session.execute(
+            insert(RevokedSessionDB)
+            .values([dict(session_id=session_id, expires_at=expires_at) for session_id in session_ids])
+            .on_conflict_do_nothing(index_elements=[RevokedSessionDB.session_id])
+        )
 
-            # Создаём дефолтную подписку
-            subscription = SubscriptionDB(
-                user_id=db_user.id,
-                plan="basic",
-                renewal_date=datetime.utcnow() + timedelta(days=30)
+    async def refresh(self, data: RefreshRequest) -> LoginResponse:
+        """
+        Exchanges a refresh token for a new pair. Each refresh token works once;
+        presenting an already exchanged one revokes the whole session.
+        """
+        token_hash = hash_token(data.refresh_token)
+        now = datetime.utcnow()
+        async with SessionLocal() as session:
+            # одно UPDATE и забирает токен, и отсекает гонку двух обменов одного токена
+            result = await session.execute(
+                update(RefreshTokenDB)
+                .where(
+                    RefreshTokenDB.token_hash == token_hash,
+                    RefreshTokenDB.used_at.is_(None),
+                    RefreshTokenDB.revoked_at.is_(None),
+                    RefreshTokenDB.expires_at > now,
+                )
+                .values(used_at=now)
+                .returning(RefreshTokenDB.user_id, RefreshTokenDB.session_id)
             )
-            session.add(subscription)
+            row = result.one_or_none()
+            if row is None:
+                result = await session.execute(
+                    select(RefreshTokenDB.session_id)
+                    .where(RefreshTokenDB.token_hash == token_hash, RefreshTokenDB.used_at.is_not(None))
+                )
+                reused = result.scalar_one_or_none()
+                if reused is not None:
+                    # обменянный токен предъявлен повторно — он утёк, закрываем сессию целиком
+                    await self._revoke_sessions(session, [reused])
+                    await session.commit()
+                raise ValueError("Недействительный refresh-токен")
+            result = await session.execute(select(UserDB.email).where(UserDB.id == row.user_id))
+            response = await self._issue(session, row.user_id, result.scalar_one(), row.session_id)
+            await session.commit()
+        return response
 
-            # Коммитим одну транзакцию с профилем и подпиской
+    async def logout(self, data: RefreshRequest) -> None:
+        async with SessionLocal() as session:
+            result = await session.execute(
+                select(RefreshTokenDB.session_id).where(RefreshTokenDB.token_hash == hash_token(data.refresh_token))
+            )
+            session_id = result.scalar_one_or_none()
+            if session_id is None:
+                raise ValueError("Недействительный refresh-токен")
+            await self._revoke_sessions(session, [session_id])
             await session.commit()
-            await session.refresh(db_profile)
 
-            return RegisterResponse(
-                id=str(db_user.id),
-                email=db_user.email,
-                full_name=db_user.full_name,
-                created_at=db_user.created_at,
+    async def revoke_user_sessions(self, user_id) -> int:
+        """
+        Ends every session of the user, e.g. after a password leak.
+        """
+        async with SessionLocal() as session:
+            result = await session.execute(
+                select(RefreshTokenDB.session_id)
+                .where(
+                    RefreshTokenDB.user_id == user_id,
+                    RefreshTokenDB.revoked_at.is_(None),
+                    RefreshTokenDB.expires_at > datetime.utcnow(),
+                )
+                .distinct()
             )
+            session_ids = result.scalars().all()
+            if session_ids:
+                await self._revoke_sessions(session, session_ids)
+                await session.commit()
+        return len(session_ids)
 
-    async def login(self, data: LoginRequest) -> LoginResponse:
+    async def get_jwks(self) -> dict:
+        return await self.keys.jwks()
+
+    async def get_revocations(self, since: int, limit: int = REVOCATION_PAGE_SIZE) -> RevocationsResponse:
+        """
+        Revoked sessions recorded after the cursor, oldest first. Services keep
+        the returned cursor and next time ask from a little before it, since
+        seq is taken at insert and a later seq may commit first.
+        """
         async with SessionLocal() as session:
             result = await session.execute(
-                select(UserDB).where(
-                    UserDB.email == data.email,
-                    UserDB.password == data.password
+                select(RevokedSessionDB)
+                .where(RevokedSessionDB.seq > since)
+                .order_by(RevokedSessionDB.seq)
+                .limit(limit)
+            )
+            rows = result.scalars().all()
+        return RevocationsResponse(
+            sessions=[
+                RevokedSession(
+                    session_id=str(row.session_id),
+                    # в БД наивное UTC-время
+                    expires_at=int(row.expires_at.replace(tzinfo=timezone.utc).timestamp()),
                 )
+                for row in rows
+            ],
+            cursor=rows[-1].seq if rows else since,
+            has_more=len(rows) == limit,
+        )
+
+    async def prune_tokens(self) -> int:
+        """
+        Deletes refresh tokens and revocation entries that can no longer matter.
+        """
+        now = datetime.utcnow()
+        async with SessionLocal() as session:
+            tokens = await session.execute(
+                delete(RefreshTokenDB)
+                .where(or_(RefreshTokenDB.expires_at <= now, RefreshTokenDB.revoked_at.is_not(None)))
             )
-            user = result.scalar_one_or_none()
-            if user is None:
-                raise ValueError("Неверный email или пароль")
-            payload = {
-                "sub": str(user.id),
-                "email": user.email,
-                "exp": int(time.time()) + 3600*24,
-            }
-            token = jwt.encode(payload, SECRET_KEY, algorithm="HS256")
-            return LoginResponse(access_token=token, expires_in=3600*24)
+            revoked = await session.execute(delete(RevokedSessionDB).where(RevokedSessionDB.expires_at <= now))
+            await session.commit()
+        return tokens.rowcount + revoked.rowcount
+
+
+async def run_token_prune_loop(service: AuthService, interval: int = TOKEN_PRUNE_INTERVAL):
+    while True:
+        try:
+            await service.prune_tokens()
+        except Exception:
+            logger.exception("Token pruning failed")
+        await asyncio.sleep(interval)
@@ -1,7 +1,9 @@
 # app/main.py
+import asyncio
 import logging
 import os
 import sys
+from contextlib import asynccontextmanager
 
 from fastapi import FastAPI
 from prometheus_fastapi_instrumentator import Instrumentator
@@ -13,6 +15,8 @@ from opentelemetry.sdk.trace.export import BatchSpanProcessor
 from opentelemetry.instrumentation.fastapi import FastAPIInstrumentor
 
 from app.auth.auth_router import auth_router
+from app.auth.auth_service import AuthService, run_token_prune_loop
+from app.auth.signing_keys import get_key_ring, run_key_rotation_loop
 
 
 def configure_logging(service_name: str) -> None:
@@ -51,7 +55,19 @@ service_name = os.getenv("SERVICE_NAME", "auth-service")
 configure_logging(service_name)
 tracer_provider = configure_tracing(service_name)
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    tasks = [
+        asyncio.create_task(run_token_prune_loop(AuthService())),
+        asyncio.create_task(run_key_rotation_loop(get_key_ring())),
+    ]
+    yield
+    for task in tasks:
+        task.cancel()
+
+
+app = FastAPI(lifespan=lifespan)
 
 # Instrument FastAPI with OpenTelemetry and Prometheus
 FastAPIInstrumentor.instrument_app(app, tracer_provider=tracer_provider)
@@ -0,0 +1,137 @@
+# app/auth/passwords.py
+import asyncio
+import hmac
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from argon2 import PasswordHasher
+from argon2.exceptions import InvalidHashError, VerificationError
+from prometheus_client import Counter, Gauge, Histogram
+
+PASSWORD_TIME_COST = int(os.getenv("PASSWORD_TIME_COST", 3))
+PASSWORD_MEMORY_COST = int(os.getenv("PASSWORD_MEMORY_COST", 64 * 1024))  # KiB
+PASSWORD_PARALLELISM = int(os.getenv("PASSWORD_PARALLELISM", 1))
+# у входа и регистрации свои потоки и очереди: утренний наплыв логинов не забирает мощность у /register
+LOGIN_HASH_WORKERS = int(os.getenv("LOGIN_HASH_WORKERS", 4))
+LOGIN_HASH_QUEUE = int(os.getenv("LOGIN_HASH_QUEUE", 32))
+REGISTER_HASH_WORKERS = int(os.getenv("REGISTER_HASH_WORKERS", 2))
+REGISTER_HASH_QUEUE = int(os.getenv("REGISTER_HASH_QUEUE", 16))
+# массовый импорт хэширует в своих потоках и не отнимает их у входа и регистрации
+IMPORT_HASH_WORKERS = int(os.getenv("IMPORT_HASH_WORKERS", 2))
+HASH_PREFIX = "$argon2"
+
+PASSWORD_HASH_SECONDS = Histogram(
+    "password_hash_duration_seconds", "Time spent in the password KDF", ["operation"]
+)
+PASSWORD_HASH_WAIT_SECONDS = Histogram(
+    "password_hash_wait_seconds", "Time a password KDF call waited for a free thread", ["pool"]
+)
+PASSWORD_HASH_PENDING = Gauge("password_hash_pending", "Password KDF calls running or waiting", ["pool"])
+PASSWORD_HASH_REJECTED = Counter(
+    "password_hash_rejected_total", "Password KDF calls rejected because the pool was full", ["pool"]
+)
+
+
+class HashingOverloaded(Exception):
+    def __init__(self):
+        super().__init__("Сервис перегружен, повторите попытку позже")
+
+
+class HashingPool:
+    """
+    Runs KDF calls on a fixed set of threads (argon2 releases the GIL). Calls
+    beyond workers + max_queue are rejected at once instead of piling up.
+    """
+
+    def __init__(self, name: str, workers: int, max_queue: int):
+        self.name = name
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="kdf-" + name)
+        self.limit = workers + max_queue
+        self.pending = 0
+
+    async def run(self, operation: str, fn, *args):
+        if self.pending >= self.limit:
+            PASSWORD_HASH_REJECTED.labels(self.name).inc()
+            raise HashingOverloaded()
+        queued_at = time.monotonic()
+
+        def timed():
+            started = time.monotonic()
+            PASSWORD_HASH_WAIT_SECONDS.labels(self.name).observe(started - queued_at)
+            try:
+                return fn(*args)
+            finally:
+                PASSWORD_HASH_SECONDS.labels(operation).observe(time.monotonic() - started)
+
+        self.pending += 1
+        PASSWORD_HASH_PENDING.labels(self.name).set(self.pending)
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, timed)
+        finally:
+            self.pending -= 1
+            PASSWORD_HASH_PENDING.labels(self.name).set(self.pending)
+
+
+class Passwords:
+    def __init__(self, hasher: Optional[PasswordHasher] = None, login_pool: Optional[HashingPool] = None,
+                 register_pool: Optional[HashingPool] = None, import_pool: Optional[HashingPool] = None):
+        self.hasher = hasher or PasswordHasher(
+            time_cost=PASSWORD_TIME_COST,
+            memory_cost=PASSWORD_MEMORY_COST,
+            parallelism=PASSWORD_PARALLELISM,
+        )
+        self.login_pool = login_pool or HashingPool("login", LOGIN_HASH_WORKERS, LOGIN_HASH_QUEUE)
+        self.register_pool = register_pool or HashingPool("register", REGISTER_HASH_WORKERS, REGISTER_HASH_QUEUE)
+        self.import_pool = import_pool or HashingPool("import", IMPORT_HASH_WORKERS, IMPORT_HASH_WORKERS)
+        self.dummy_hash = None
+
+    async def hash(self, password: str) -> str:
+        return await self.register_pool.run("hash", self.hasher.hash, password)
+
+    async def hash_many(self, passwords: list) -> list:
+        """
+        Hashes a batch on the import pool, never submitting more than the pool
+        accepts at once.
+        """
+        hashes = []
+        for start in range(0, len(passwords), self.import_pool.limit):
+            chunk = passwords[start:start + self.import_pool.limit]
+            hashes += await asyncio.gather(*[self.import_pool.run("hash", self.hasher.hash, p) for p in chunk])
+        return hashes
+
+    def _verify(self, stored: Optional[str], password: str):
+        if stored is None:
+            # пользователя нет, но KDF всё равно считаем — по времени ответа не понять, есть ли email
+            self.dummy_hash = self.dummy_hash or self.hasher.hash("")
+            stored = self.dummy_hash
+            password = password + "\0"
+        if not stored.startswith(HASH_PREFIX):
+            # строка из времён, когда пароли хранились открытым текстом
+            if not hmac.compare_digest(stored.encode("utf-8"), password.encode("utf-8")):
+                return False, None
+            return True, self.hasher.hash(password)
+        try:
+            self.hasher.verify(stored, password)
+        except (VerificationError, InvalidHashError):
+            return False, None
+        return True, self.hasher.hash(password) if self.hasher.check_needs_rehash(stored) else None
+
+    async def verify(self, stored: Optional[str], password: str):
+        """
+        Checks the password against the stored value (None when the user does not exist).
+        Returns (valid, new_hash); new_hash is set when the stored value is plaintext
+        or uses outdated parameters and should be replaced.
+        """
+        return await self.login_pool.run("verify", self._verify, stored, password)
+
+
+_passwords: Optional[Passwords] = None
+
+
+def get_passwords() -> Passwords:
+    global _passwords
+    if _passwords is None:
+        _passwords = Passwords()
+    return _passwords
@@ -0,0 +1,30 @@
+# app/auth/refresh_token_db.py
+from sqlalchemy import Column, String, BigInteger, DateTime, ForeignKey
+from sqlalchemy.dialects.postgresql import UUID
+import uuid
+from datetime import datetime
+
+from app.auth.db import Base
+
+
+class RefreshTokenDB(Base):
+    __tablename__ = "refresh_tokens"
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    # хранится только sha256 токена: утечка таблицы не даёт войти
+    token_hash = Column(String(64), unique=True, nullable=False)
+    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=False)
+    # все токены одной цепочки ротации, от входа до выхода
+    session_id = Column(UUID(as_uuid=True), nullable=False, index=True)
+    expires_at = Column(DateTime, nullable=False, index=True)
+    used_at = Column(DateTime, nullable=True)  # обменян на новую пару
+    revoked_at = Column(DateTime, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class RevokedSessionDB(Base):
+    __tablename__ = "revoked_sessions"
+    # монотонный номер записи — курсор, по которому сервисы догружают список
+    seq = Column(BigInteger, primary_key=True, autoincrement=True)
+    session_id = Column(UUID(as_uuid=True), unique=True, nullable=False)
+    # после этого момента у сессии не остаётся живых access-токенов и запись не нужна
+    expires_at = Column(DateTime, nullable=False, index=True)
@@ -0,0 +1,13 @@
+# app/auth/signing_key_db.py
+from sqlalchemy import Column, String, Text, DateTime
+from datetime import datetime
+
+from app.auth.db import Base
+
+
+class SigningKeyDB(Base):
+    __tablename__ = "signing_keys"
+    kid = Column(String, primary_key=True)
+    algorithm = Column(String, nullable=False)
+    private_key = Column(Text, nullable=False)  # PEM, зашифрован JWT_SECRET, если он задан
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
@@ -0,0 +1,169 @@
+# app/auth/signing_keys.py
+import asyncio
+import logging
+import os
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Optional
+
+import jwt
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec, ed25519, rsa
+from jwt.algorithms import get_default_algorithms
+from sqlalchemy import select, delete
+from sqlalchemy.dialects.postgresql import insert
+
+from app.auth.db import SessionLocal
+from app.auth.signing_key_db import SigningKeyDB
+
+# токены проверяют все сервисы, а подписывает только auth, поэтому по умолчанию алгоритм
+# с самой дешёвой проверкой (python -m app.auth.benchmark_jwt)
+JWT_ALGORITHM = os.getenv("JWT_ALGORITHM", "RS256")
+# пароль, которым зашифрованы закрытые ключи в таблице signing_keys
+JWT_SECRET = os.getenv("JWT_SECRET", "")
+JWT_KEY_ROTATION_INTERVAL = int(os.getenv("JWT_KEY_ROTATION_INTERVAL", 7 * 24 * 3600))
+# новый ключ сначала только публикуется в JWKS и начинает подписывать, когда сервисы его уже скачали
+JWT_KEY_PUBLISH_DELAY = int(os.getenv("JWT_KEY_PUBLISH_DELAY", 15 * 60))
+# сколько прежний ключ остаётся в JWKS после смены; должно быть больше срока жизни access-токена
+JWT_KEY_RETIRE_AFTER = int(os.getenv("JWT_KEY_RETIRE_AFTER", 3600))
+JWT_KEY_CHECK_INTERVAL = int(os.getenv("JWT_KEY_CHECK_INTERVAL", 60))
+
+ALGORITHMS = get_default_algorithms()
+
+logger = logging.getLogger(__name__)
+
+
+def generate_private_key(algorithm: str):
+    if algorithm == "RS256":
+        return rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    if algorithm == "ES256":
+        return ec.generate_private_key(ec.SECP256R1())
+    if algorithm == "EdDSA":
+        return ed25519.Ed25519PrivateKey.generate()
+    raise ValueError(f"Неподдерживаемый алгоритм подписи: {algorithm}")
+
+
+def dump_private_key(private_key) -> str:
+    encryption = serialization.NoEncryption()
+    if JWT_SECRET:
+        encryption = serialization.BestAvailableEncryption(JWT_SECRET.encode("utf-8"))
+    return private_key.private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, encryption
+    ).decode("ascii")
+
+
+def load_private_key(pem: str):
+    return serialization.load_pem_private_key(pem.encode("ascii"), JWT_SECRET.encode("utf-8") or None)
+
+
+@dataclass
+class SigningKey:
+    kid: str
+    algorithm: str
+    private_key: object
+    created_at: datetime
+
+    def jwk(self) -> dict:
+        public = ALGORITHMS[self.algorithm].to_jwk(self.private_key.public_key(), as_dict=True)
+        return {**public, "kid": self.kid, "alg": self.algorithm, "use": "sig"}
+
+
+class KeyRing:
+    """
+    Token signing keys shared by all auth replicas through the signing_keys
+    table. A key is created per rotation interval, published in the JWKS at
+    once and used for signing after JWT_KEY_PUBLISH_DELAY; the previous key
+    stays published for JWT_KEY_RETIRE_AFTER so its tokens still verify.
+    """
+
+    def __init__(self, algorithm: str = JWT_ALGORITHM):
+        self.algorithm = algorithm
+        self.keys: list = []  # от новых к старым
+        self.lock = asyncio.Lock()
+
+    async def load(self) -> None:
+        async with SessionLocal() as session:
+            result = await session.execute(select(SigningKeyDB).order_by(SigningKeyDB.created_at.desc()))
+            rows = result.scalars().all()
+        # расшифровка PEM дорогая — уже загруженные ключи не разбираем заново
+        known = {key.kid: key for key in self.keys}
+        self.keys = [
+            known.get(row.kid) or SigningKey(row.kid, row.algorithm, load_private_key(row.private_key), row.created_at)
+            for row in rows
+        ]
+
+    def signing_key(self, now: Optional[datetime] = None) -> SigningKey:
+        ready = (now or datetime.utcnow()) - timedelta(seconds=JWT_KEY_PUBLISH_DELAY)
+        for key in self.keys:
+            if key.created_at <= ready:
+                return key
+        # опубликованных достаточно давно ключей нет (первый запуск) — берём самый старый
+        return self.keys[-1]
+
+    def retired(self, now: datetime) -> list:
+        signing = self.signing_key(now)
+        took_over = signing.created_at + timedelta(seconds=JWT_KEY_PUBLISH_DELAY)
+        if took_over + timedelta(seconds=JWT_KEY_RETIRE_AFTER) > now:
+            return []
+        return [key.kid for key in self.keys if key.created_at < signing.created_at]
+
+    async def rotate(self) -> None:
+        """
+        Creates the key of the current rotation period unless another replica
+        already has, drops keys no live token can refer to and reloads the ring.
+        """
+        now = datetime.utcnow()
+        # kid выводится из номера периода, поэтому при гонке реплик ключ создаёт только одна
+        kid = f"{self.algorithm.lower()}-{int(time.time()) // JWT_KEY_ROTATION_INTERVAL}"
+        await self.load()
+        if all(key.kid != kid for key in self.keys):
+            private_key = await asyncio.to_thread(generate_private_key, self.algorithm)
+            async with SessionLocal() as session:
+                await session.execute(
+                    insert(SigningKeyDB)
+                    .values(kid=kid, algorithm=self.algorithm, private_key=dump_private_key(private_key), created_at=now)
+                    .on_conflict_do_nothing(index_elements=[SigningKeyDB.kid])
+                )
+                await session.commit()
+            await self.load()
+        retired = self.retired(now)
+        if retired:
+            async with SessionLocal() as session:
+                await session.execute(delete(SigningKeyDB).where(SigningKeyDB.kid.in_(retired)))
+                await session.commit()
+            self.keys = [key for key in self.keys if key.kid not in retired]
+
+    async def current(self) -> SigningKey:
+        if not self.keys:
+            async with self.lock:
+                if not self.keys:
+                    await self.rotate()
+        return self.signing_key()
+
+    async def sign(self, payload: dict) -> str:
+        key = await self.current()
+        return jwt.encode(payload, key.private_key, algorithm=key.algorithm, headers={"kid": key.kid})
+
+    async def jwks(self) -> dict:
+        await self.current()
+        return {"keys": [key.jwk() for key in self.keys]}
+
+
+async def run_key_rotation_loop(key_ring: KeyRing, interval: int = JWT_KEY_CHECK_INTERVAL):
+    while True:
+        try:
+            await key_ring.rotate()
+        except Exception:
+            logger.exception("Signing key rotation failed")
+        await asyncio.sleep(interval)
+
+
+_key_ring: Optional[KeyRing] = None
+
+
+def get_key_ring() -> KeyRing:
+    global _key_ring
+    if _key_ring is None:
+        _key_ring = KeyRing()
+    return _key_ring
@@ -1,11 +1,53 @@
 # test_auth_service.py
 from datetime import datetime, timedelta
-from unittest.mock import AsyncMock, patch
+import asyncio
+import time
+import uuid
+from unittest.mock import AsyncMock, MagicMock, patch
 
 import jwt
 import pytest
+from argon2 import PasswordHasher
 
 from app.auth.auth import RegisterRequest, LoginRequest
+from app.auth.auth_service import AuthService
+from app.auth.passwords import HashingOverloaded, HashingPool, Passwords
+from app.auth.signing_keys import KeyRing, SigningKey, generate_private_key
+from app.auth.user_db import UserDB
+
+TEST_KEY = generate_private_key("RS256")
+
+
+def make_session_context(session):
+    context_manager = AsyncMock()
+    context_manager.__aenter__ = AsyncMock(return_value=session)
+    context_manager.__aexit__ = AsyncMock(return_value=None)
+    return context_manager
+
+
+def make_passwords(**pools):
+    return Passwords(PasswordHasher(time_cost=1, memory_cost=8, parallelism=1), **pools)
+
+
+def make_key_ring():
+    key_ring = KeyRing("RS256")
+    key_ring.keys = [SigningKey("test-key", "RS256", TEST_KEY, datetime.utcnow() - timedelta(days=1))]
+    return key_ring
+
+
+def make_public_keys():
+    from app.common.auth_client import PublicKeys
+    public_keys = PublicKeys()
+    public_keys.load({"keys": [make_key_ring().keys[0].jwk()]})
+    return public_keys
+
+
+def make_token(claims):
+    return jwt.encode(claims, TEST_KEY, algorithm="RS256", headers={"kid": "test-key"})
+
+
+def decode_token(token):
+    return jwt.decode(token, TEST_KEY.public_key(), algorithms=["RS256"])
 
 
 class TestAuthRouter:
@@ -141,29 +183,26 @@ class TestAuthRouter:
 
 class TestDependencies:
     def test_get_current_user_valid_token(self):
-        from app.auth.dependencies import get_current_user
+        from app.common.auth_client import get_current_user
         from fastapi.security import HTTPAuthorizationCredentials
 
         test_user_id = "123e4567-e89b-12d3-a456-426614174000"
-        valid_token = jwt.encode(
-            {"sub": test_user_id, "exp": datetime.utcnow() + timedelta(hours=1)},
-            "supersecret",
-            algorithm="HS256"
-        )
+        valid_token = make_token({"sub": test_user_id, "exp": datetime.utcnow() + timedelta(hours=1)})
 
         credentials = HTTPAuthorizationCredentials(
             scheme="Bearer",
             credentials=valid_token
         )
 
-        with patch('app.auth.dependencies.jwt.decode') as mock_decode:
+        with patch('app.common.auth_client.public_keys', make_public_keys()), \
+                patch('app.common.auth_client.jwt.decode') as mock_decode:
             mock_decode.return_value = {"sub": test_user_id}
             user_id = get_current_user(credentials)
 
         assert user_id == test_user_id
 
     def test_get_current_user_invalid_token(self):
-        from app.auth.dependencies import get_current_user
+        from app.common.auth_client import get_current_user
         from fastapi.security import HTTPAuthorizationCredentials
         from fastapi import HTTPException
 
@@ -179,19 +218,498 @@ class TestDependencies:
         assert "Invalid credentials" in str(exc_info.value.detail)
 
     def test_get_current_user_missing_sub(self):
-        from app.auth.dependencies import get_current_user
+        from app.common.auth_client import get_current_user
         from fastapi.security import HTTPAuthorizationCredentials
         from fastapi import HTTPException
 
         credentials = HTTPAuthorizationCredentials(
             scheme="Bearer",
-            credentials="test_token"
+            credentials=make_token({"email": "test@example.com"})
         )
 
-        with patch('app.auth.dependencies.jwt.decode') as mock_decode:
+        with patch('app.common.auth_client.public_keys', make_public_keys()), \
+                patch('app.common.auth_client.jwt.decode') as mock_decode:
             mock_decode.return_value = {"email": "test@example.com"}  # нет sub
             with pytest.raises(HTTPException) as exc_info:
                 get_current_user(credentials)
 
             assert exc_info.value.status_code == 401
-            assert "Invalid token" in str(exc_info.value.detail)
\ No newline at end of file
+            assert "Invalid token" in str(exc_info.value.detail)
+
+    def test_get_current_user_caches_verified_token(self):
+        from app.common.auth_client import TokenCache, get_current_user
+        from fastapi.security import HTTPAuthorizationCredentials
+
+        token = make_token({"sub": "user-1", "exp": datetime.utcnow() + timedelta(hours=1)})
+        credentials = HTTPAuthorizationCredentials(scheme="Bearer", credentials=token)
+
+        with patch('app.common.auth_client.token_cache', TokenCache()), \
+                patch('app.common.auth_client.public_keys', make_public_keys()), \
+                patch('app.common.auth_client.jwt.decode', wraps=jwt.decode) as mock_decode:
+            assert get_current_user(credentials) == "user-1"
+            assert get_current_user(credentials) == "user-1"
+
+        assert mock_decode.call_count == 1
+
+    def test_token_cache_honours_exp_and_capacity(self):
+        from app.common.auth_client import TokenCache
+
+        cache = TokenCache(capacity=2, ttl=300)
+        cache.put(b"expired", {"sub": "user-1", "exp": time.time() - 1})
+        cache.put(b"a", {"sub": "user-2"})
+        cache.put(b"b", {"sub": "user-3"})
+        cache.put(b"c", {"sub": "user-4"})
+
+        assert cache.get(b"expired") is None
+        assert cache.get(b"a") is None
+        assert cache.get(b"b") == {"sub": "user-3"}
+        assert cache.get(b"c") == {"sub": "user-4"}
+
+
+class TestPasswords:
+    @pytest.mark.asyncio
+    async def test_hash_and_verify(self):
+        passwords = make_passwords()
+        stored = await passwords.hash("password123")
+
+        assert stored.startswith("$argon2id$")
+        assert await passwords.verify(stored, "password123") == (True, None)
+        assert await passwords.verify(stored, "wrong") == (False, None)
+        assert await passwords.verify(None, "password123") == (False, None)
+
+    @pytest.mark.asyncio
+    async def test_legacy_plaintext_is_rehashed(self):
+        passwords = make_passwords()
+
+        valid, new_hash = await passwords.verify("password123", "password123")
+
+        assert valid
+        assert new_hash.startswith("$argon2id$")
+        assert await passwords.verify("password123", "wrong") == (False, None)
+
+    @pytest.mark.asyncio
+    async def test_pool_rejects_calls_over_the_limit(self):
+        pool = HashingPool("test", workers=1, max_queue=1)
+        release = asyncio.Event()
+        loop = asyncio.get_running_loop()
+
+        def blocking():
+            asyncio.run_coroutine_threadsafe(release.wait(), loop).result()
+
+        running = [asyncio.create_task(pool.run("hash", blocking)) for _ in range(2)]
+        await asyncio.sleep(0)
+        with pytest.raises(HashingOverloaded):
+            await pool.run("hash", blocking)
+        release.set()
+        await asyncio.gather(*running)
+        assert pool.pending == 0
+
+    @pytest.mark.asyncio
+    async def test_login_rehashes_legacy_row(self):
+        user = UserDB(id=uuid.uuid4(), email="test@example.com", password="password123")
+        mock_session = AsyncMock()
+        mock_session.execute = AsyncMock(side_effect=[
+            MagicMock(scalar_one_or_none=MagicMock(return_value=user)),
+            MagicMock(),
+        ])
+
+        mock_session.add = MagicMock()
+
+        with patch('app.auth.auth_service.SessionLocal', return_value=make_session_context(mock_session)):
+            result = await AuthService(make_passwords(), make_key_ring()).login(
+                LoginRequest(email="test@example.com", password="password123")
+            )
+
+        assert result.access_token
+        update_stmt = mock_session.execute.await_args_list[1][0][0]
+        assert update_stmt.compile().params["password"].startswith("$argon2id$")
+        mock_session.commit.assert_awaited_once()
+
+    @pytest.mark.asyncio
+    async def test_overloaded_login_returns_503(self):
+        from app.auth.auth_router import login_user
+        from fastapi import HTTPException
+
+        mock_service = AsyncMock()
+        mock_service.login = AsyncMock(side_effect=HashingOverloaded())
+
+        with patch('app.auth.auth_router.AuthService', return_value=mock_service):
+            with pytest.raises(HTTPException) as exc_info:
+                await login_user(LoginRequest(email="test@example.com", password="password123"))
+
+        assert exc_info.value.status_code == 503
+
+
+class TestRefreshTokens:
+    @pytest.mark.asyncio
+    async def test_login_issues_short_access_token_and_refresh_token(self):
+        from app.auth.auth_service import ACCESS_TOKEN_TTL, hash_token
+        from app.auth.refresh_token_db import RefreshTokenDB
+
+        passwords = make_passwords()
+        user = UserDB(id=uuid.uuid4(), email="test@example.com", password=await passwords.hash("password123"))
+        mock_session = AsyncMock()
+        mock_session.execute = AsyncMock(return_value=MagicMock(scalar_one_or_none=MagicMock(return_value=user)))
+        mock_session.add = MagicMock()
+
+        with patch('app.auth.auth_service.SessionLocal', return_value=make_session_context(mock_session)):
+            result = await AuthService(passwords, make_key_ring()).login(
+                LoginRequest(email="test@example.com", password="password123")
+            )
+
+        claims = decode_token(result.access_token)
+        assert claims["sub"] == str(user.id)
+        assert claims["exp"] - time.time() <= ACCESS_TOKEN_TTL
+        assert result.expires_in == ACCESS_TOKEN_TTL
+        stored = mock_session.add.call_args[0][0]
+        assert isinstance(stored, RefreshTokenDB)
+        assert stored.token_hash == hash_token(result.refresh_token)
+        assert str(stored.session_id) == claims["sid"]
+
+    @pytest.mark.asyncio
+    async def test_refresh_rotates_token(self):
+        from app.auth.auth import RefreshRequest
+
+        user_id, session_id = uuid.uuid4(), uuid.uuid4()
+        mock_session = AsyncMock()
+        mock_session.execute = AsyncMock(side_effect=[
+            MagicMock(one_or_none=MagicMock(return_value=MagicMock(user_id=user_id, session_id=session_id))),
+            MagicMock(scalar_one=MagicMock(return_value="test@example.com")),
+        ])
+        mock_session.add = MagicMock()
+
+        with patch('app.auth.auth_service.SessionLocal', return_value=make_session_context(mock_session)):
+            result = await AuthService(make_passwords(), make_key_ring()).refresh(RefreshRequest(refresh_token="old"))
+
+        assert result.refresh_token != "old"
+        assert decode_token(result.access_token)["sid"] == str(session_id)
+        mock_session.commit.assert_awaited_once()
+
+    @pytest.mark.asyncio
+    async def test_reused_refresh_token_revokes_session(self):
+        from app.auth.auth import RefreshRequest
+
+        session_id = uuid.uuid4()
+        mock_session = AsyncMock()
+        mock_session.execute = AsyncMock(side_effect=[
+            MagicMock(one_or_none=MagicMock(return_value=None)),
+            MagicMock(scalar_one_or_none=MagicMock(return_value=session_id)),
+            MagicMock(),
+            MagicMock(),
+        ])
+
+        with patch('app.auth.auth_service.SessionLocal', return_value=make_session_context(mock_session)):
+            with pytest.raises(ValueError):
+                await AuthService(make_passwords(), make_key_ring()).refresh(RefreshRequest(refresh_token="stolen"))
+
+        revoke_stmt = mock_session.execute.await_args_list[3][0][0]
+        assert revoke_stmt.compile().params["session_id_m0"] == session_id
+        mock_session.commit.assert_awaited_once()
+
+    def test_revoked_session_is_rejected(self):
+        from app.common.auth_client import RevocationList, TokenCache, get_current_user
+        from fastapi.security import HTTPAuthorizationCredentials
+        from fastapi import HTTPException
+
+        token = make_token({"sub": "user-1", "sid": "session-1", "exp": int(time.time()) + 600})
+        credentials = HTTPAuthorizationCredentials(scheme="Bearer", credentials=token)
+        revocations = RevocationList()
+
+        with patch('app.common.auth_client.token_cache', TokenCache()), \
+                patch('app.common.auth_client.public_keys', make_public_keys()), \
+                patch('app.common.auth_client.revocations', revocations):
+            assert get_current_user(credentials) == "user-1"
+            revocations.sessions = {"session-1": time.time() + 600}
+            with pytest.raises(HTTPException) as exc_info:
+                get_current_user(credentials)
+
+        assert exc_info.value.status_code == 401
+
+    @pytest.mark.asyncio
+    async def test_revocation_list_syncs_incrementally(self):
+        import httpx
+        from app.common.auth_client import RevocationList
+
+        now = int(time.time())
+        entries = [
+            {"session_id": "s1", "expires_at": now + 600},
+            {"session_id": "s2", "expires_at": now - 1},
+            {"session_id": "s3", "expires_at": now + 600},
+        ]
+        requested = []
+
+        def handler(request):
+            since = int(request.url.params["since"])
+            requested.append(since)
+            page = entries[since:since + 2]
+            return httpx.Response(200, json={"sessions": page, "cursor": since + len(page), "has_more": len(page) == 2})
+
+        revocations = RevocationList(base_url="http://auth", transport=httpx.MockTransport(handler), lookback=0)
+        await revocations.sync()
+        await revocations.sync()
+
+        assert requested == [0, 2, 3]
+        assert revocations.cursor == 3
+        assert set(revocations.sessions) == {"s1", "s3"}
+        assert revocations.is_revoked("s1")
+        assert not revocations.is_revoked("s2")
+
+    @pytest.mark.asyncio
+    async def test_revocation_committed_late_is_picked_up(self):
+        import httpx
+        from app.common.auth_client import RevocationList
+
+        expires_at = int(time.time()) + 600
+        # seq 1 вставлен раньше seq 2, но закоммичен только после первой синхронизации
+        committed = {2: "s2"}
+        requested = []
+
+        def handler(request):
+            since = int(request.url.params["since"])
+            requested.append(since)
+            seqs = sorted(seq for seq in committed if seq > since)
+            sessions = [{"session_id": committed[seq], "expires_at": expires_at} for seq in seqs]
+            return httpx.Response(200, json={"sessions": sessions, "cursor": seqs[-1] if seqs else since,
+                                             "has_more": False})
+
+        revocations = RevocationList(base_url="http://auth", transport=httpx.MockTransport(handler), lookback=5)
+        await revocations.sync()
+        committed[1] = "s1"
+        await revocations.sync()
+
+        assert requested == [0, 0]
+        assert revocations.cursor == 2
+        assert revocations.is_revoked("s1") and revocations.is_revoked("s2")
+
+    @pytest.mark.asyncio
+    async def test_revocations_report_utc_expiry(self):
+        from app.auth.refresh_token_db import RevokedSessionDB
+
+        session_id = uuid.uuid4()
+        row = RevokedSessionDB(seq=7, session_id=session_id, expires_at=datetime(2024, 1, 1, 12, 0, 0))
+        mock_session = AsyncMock()
+        mock_session.execute = AsyncMock(return_value=MagicMock(
+            scalars=MagicMock(return_value=MagicMock(all=MagicMock(return_value=[row])))
+        ))
+
+        with patch('app.auth.auth_service.SessionLocal', return_value=make_session_context(mock_session)):
+            response = await AuthService(passwords=make_passwords(), keys=make_key_ring()).get_revocations(5)
+
+        assert response.sessions[0].session_id == str(session_id)
+        assert response.sessions[0].expires_at == 1704110400
+        assert response.cursor == 7
+
+
+class TestSigningKeys:
+    def test_new_key_signs_only_after_publish_delay(self):
+        from app.auth.signing_keys import JWT_KEY_PUBLISH_DELAY, JWT_KEY_RETIRE_AFTER
+
+        now = datetime.utcnow()
+        old = SigningKey("old", "RS256", TEST_KEY, now - timedelta(days=7))
+        new = SigningKey("new", "RS256", TEST_KEY, now - timedelta(seconds=JWT_KEY_PUBLISH_DELAY // 2))
+        key_ring = KeyRing("RS256")
+        key_ring.keys = [new, old]
+
+        assert key_ring.signing_key(now).kid == "old"
+        assert key_ring.retired(now) == []
+
+        later = now + timedelta(seconds=JWT_KEY_PUBLISH_DELAY)
+        assert key_ring.signing_key(later).kid == "new"
+        assert key_ring.retired(later) == []
+        assert key_ring.retired(later + timedelta(seconds=JWT_KEY_RETIRE_AFTER)) == ["old"]
+
+    @pytest.mark.asyncio
+    async def test_jwks_verifies_signed_token(self):
+        key_ring = make_key_ring()
+        token = await key_ring.sign({"sub": "user-1"})
+
+        jwks = await key_ring.jwks()
+        jwk = jwks["keys"][0]
+
+        assert jwt.get_unverified_header(token)["kid"] == jwk["kid"] == "test-key"
+        assert jwk["alg"] == "RS256" and "d" not in jwk
+        assert jwt.decode(token, jwt.PyJWK(jwk).key, algorithms=["RS256"])["sub"] == "user-1"
+
+    def test_unknown_kid_is_rejected(self):
+        from app.common.auth_client import TokenCache, get_current_user
+        from fastapi.security import HTTPAuthorizationCredentials
+        from fastapi import HTTPException
+
+        token = jwt.encode({"sub": "user-1"}, TEST_KEY, algorithm="RS256", headers={"kid": "other-key"})
+        credentials = HTTPAuthorizationCredentials(scheme="Bearer", credentials=token)
+
+        with patch('app.common.auth_client.token_cache', TokenCache()), \
+                patch('app.common.auth_client.public_keys', make_public_keys()):
+            with pytest.raises(HTTPException) as exc_info:
+                get_current_user(credentials)
+
+        assert exc_info.value.status_code == 401
+
+    @pytest.mark.asyncio
+    async def test_key_fetch_is_retried_quickly_after_failed_start(self):
+        import httpx
+        from app.common.auth_client import PublicKeys, run_key_refresh
+
+        jwks = {"keys": [make_key_ring().keys[0].jwk()]}
+        calls = []
+
+        def handler(request):
+            calls.append(request.url.path)
+            if len(calls) < 3:
+                return httpx.Response(503)
+            return httpx.Response(200, json=jwks)
+
+        public_keys = PublicKeys(base_url="http://auth", transport=httpx.MockTransport(handler))
+        task = asyncio.create_task(run_key_refresh(public_keys, interval=60, min_interval=60, retry_delay=0.01))
+        try:
+            for _ in range(100):
+                if public_keys.get("test-key"):
+                    break
+                await asyncio.sleep(0.01)
+        finally:
+            task.cancel()
+
+        assert public_keys.get("test-key") is not None
+        assert len(calls) == 3
+
+    @pytest.mark.asyncio
+    async def test_unknown_kid_triggers_rate_limited_refresh(self):
+        import httpx
+        from app.common.auth_client import PublicKeys, run_key_refresh
+
+        calls = []
+
+        def handler(request):
+            calls.append(request.url.path)
+            return httpx.Response(200, json={"keys": [make_key_ring().keys[0].jwk()]})
+
+        public_keys = PublicKeys(base_url="http://auth", transport=httpx.MockTransport(handler))
+        public_keys.keys = {"old-key": ("RS256", TEST_KEY.public_key())}
+        task = asyncio.create_task(run_key_refresh(public_keys, interval=60, min_interval=60, retry_delay=60))
+        try:
+            await asyncio.sleep(0)
+            # запрос приходит из потока пула, как синхронная зависимость FastAPI
+            await asyncio.to_thread(public_keys.request_refresh)
+            for _ in range(100):
+                if calls:
+                    break
+                await asyncio.sleep(0.01)
+            for _ in range(5):
+                await asyncio.to_thread(public_keys.request_refresh)
+            await asyncio.sleep(0.05)
+        finally:
+            task.cancel()
+
+        assert public_keys.get("test-key") is not None
+        assert len(calls) == 1
+
+    def test_shared_secret_token_is_rejected(self):
+        from app.common.auth_client import TokenCache, get_current_user
+        from fastapi.security import HTTPAuthorizationCredentials
+        from fastapi import HTTPException
+
+        token = jwt.encode({"sub": "user-1"}, "supersecret", algorithm="HS256", headers={"kid": "test-key"})
+        credentials = HTTPAuthorizationCredentials(scheme="Bearer", credentials=token)
+
+        with patch('app.common.auth_client.token_cache', TokenCache()), \
+                patch('app.common.auth_client.public_keys', make_public_keys()):
+            with pytest.raises(HTTPException) as exc_info:
+                get_current_user(credentials)
+
+        assert exc_info.value.status_code == 401
+
+
+class TestUserImport:
+    @pytest.mark.asyncio
+    async def test_register_is_one_statement(self):
+        created = MagicMock(id=uuid.uuid4(), email="test@example.com", created_at=datetime.utcnow())
+        mock_session = AsyncMock()
+        mock_session.execute = AsyncMock(return_value=MagicMock(one_or_none=MagicMock(return_value=created)))
+
+        with patch('app.auth.auth_service.SessionLocal', return_value=make_session_context(mock_session)):
+            result = await AuthService(make_passwords(), make_key_ring()).register(
+                RegisterRequest(email="test@example.com", password="password123", full_name="Test User")
+            )
+
+        assert result.id == str(created.id)
+        assert result.full_name == "Test User"
+        mock_session.execute.assert_awaited_once()
+        sql = str(mock_session.execute.await_args[0][0])
+        assert "INSERT INTO users" in sql and "INSERT INTO profiles" in sql and "INSERT INTO subscriptions" in sql
+        mock_session.commit.assert_awaited_once()
+        mock_session.refresh.assert_not_awaited()
+
+    @pytest.mark.asyncio
+    async def test_register_duplicate_email(self):
+        mock_session = AsyncMock()
+        mock_session.execute = AsyncMock(return_value=MagicMock(one_or_none=MagicMock(return_value=None)))
+
+        with patch('app.auth.auth_service.SessionLocal', return_value=make_session_context(mock_session)):
+            with pytest.raises(ValueError):
+                await AuthService(make_passwords(), make_key_ring()).register(
+                    RegisterRequest(email="test@example.com", password="password123", full_name="Test User")
+                )
+
+        mock_session.commit.assert_not_awaited()
+
+    @pytest.mark.asyncio
+    async def test_parse_records_across_chunks(self):
+        from app.auth.user_import_service import FORMAT_CSV, FORMAT_NDJSON, parse_records
+
+        async def chunks(*parts):
+            for part in parts:
+                yield part
+
+        data = "email,full_name,password\r\na@x.io,Анна,p1\r\n\r\nb@x.io,Борис\n".encode("utf-8")
+        csv_records = [r async for r in parse_records(chunks(*[data[i:i + 7] for i in range(0, len(data), 7)]), FORMAT_CSV)]
+        ndjson_records = [r async for r in parse_records(chunks(b'{"email": "a@x.io"}\n[1]\nnot json'), FORMAT_NDJSON)]
+
+        assert csv_records[0] == ({"email": "a@x.io", "full_name": "Анна", "password": "p1"}, None)
+        assert csv_records[1][0] is None
+        assert len(csv_records) == 2
+        assert ndjson_records[0] == ({"email": "a@x.io"}, None)
+        assert ndjson_records[1][0] is None and ndjson_records[2][0] is None
+
+    @pytest.mark.asyncio
+    async def test_resumed_import_skips_processed_records(self):
+        from app.auth.user_import_db import UserImportDB
+        from app.auth.user_import_service import EMAIL_REPEATED, EMAIL_TAKEN, FORMAT_NDJSON, UserImportService
+
+        import_id = uuid.uuid4()
+        state = UserImportDB(id=import_id, status="running", processed=2, inserted=2, conflicts=0)
+        lines = [
+            '{"email": "a@x.io", "full_name": "A", "password": "p"}',
+            '{"email": "b@x.io", "full_name": "B", "password": "p"}',
+            '{"email": "c@x.io", "full_name": "C", "password": "p"}',
+            'not json',
+            '{"email": "c@x.io", "full_name": "C", "password": "p"}',
+            '{"email": "d@x.io", "full_name": "D", "password_hash": "$argon2id$v=19$m=8,t=1,p=1$c2FsdA$aGFzaA"}',
+        ]
+
+        async def chunks():
+            yield "\n".join(lines).encode("utf-8")
+
+        mock_session = AsyncMock()
+        mock_session.execute = AsyncMock(side_effect=[
+            MagicMock(scalar_one_or_none=MagicMock(return_value=state)),
+            MagicMock(all=MagicMock(return_value=[MagicMock(email="c@x.io")])),
+            MagicMock(),
+            MagicMock(rowcount=1),
+            MagicMock(),
+            MagicMock(scalar_one_or_none=MagicMock(return_value=state)),
+            MagicMock(scalars=MagicMock(return_value=MagicMock(all=MagicMock(return_value=[])))),
+        ])
+
+        with patch('app.auth.user_import_service.SessionLocal', return_value=make_session_context(mock_session)):
+            await UserImportService(make_passwords()).run(str(import_id), chunks(), FORMAT_NDJSON)
+
+        calls = mock_session.execute.await_args_list
+        users_params = calls[1][0][0].compile().params
+        assert {users_params["email_m0"], users_params["email_m1"]} == {"c@x.io", "d@x.io"}
+        assert users_params["password_m0"].startswith("$argon2id$")
+        conflicts = calls[2][0][0].compile().params
+        assert [(conflicts[f"record_m{i}"], conflicts[f"reason_m{i}"]) for i in range(3)] == [
+            (4, "Строка не является JSON"), (5, EMAIL_REPEATED), (6, EMAIL_TAKEN),
+        ]
+        progress = calls[3][0][0].compile().params
+        assert progress["processed"] == 6 and progress["processed_1"] == 2
@@ -0,0 +1,27 @@
+# app/auth/user_import_db.py
+from sqlalchemy import Column, String, Integer, DateTime, ForeignKey
+from sqlalchemy.dialects.postgresql import UUID
+import uuid
+from datetime import datetime
+
+from app.auth.db import Base
+
+
+class UserImportDB(Base):
+    __tablename__ = "user_imports"
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    status = Column(String, nullable=False, default="running")  # running | completed
+    # сколько записей входного потока уже разобрано: повторная загрузка пропускает их
+    processed = Column(Integer, nullable=False, default=0)
+    inserted = Column(Integer, nullable=False, default=0)
+    conflicts = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+
+class UserImportConflictDB(Base):
+    __tablename__ = "user_import_conflicts"
+    import_id = Column(UUID(as_uuid=True), ForeignKey("user_imports.id", ondelete="CASCADE"), primary_key=True)
+    record = Column(Integer, primary_key=True)  # номер записи во входном потоке, с 1
+    email = Column(String, nullable=True)
+    reason = Column(String, nullable=False)
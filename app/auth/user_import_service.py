@@ -0,0 +1,216 @@
+# app/auth/user_import_service.py
+import codecs
+import csv
+import json
+import os
+import uuid
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import select, update
+from sqlalchemy.dialects.postgresql import insert
+
+from app.auth.auth import ImportConflict, UserImportResponse
+from app.auth.auth_service import insert_users
+from app.auth.db import SessionLocal
+from app.auth.passwords import HASH_PREFIX, get_passwords
+from app.auth.user_import_db import UserImportConflictDB, UserImportDB
+
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", 1000))
+IMPORT_CONFLICTS_SHOWN = int(os.getenv("IMPORT_CONFLICTS_SHOWN", 1000))
+MAX_LINE_LENGTH = 64 * 1024
+
+FORMAT_CSV = "csv"
+FORMAT_NDJSON = "ndjson"
+
+EMAIL_TAKEN = "Пользователь с таким email уже существует"
+EMAIL_REPEATED = "Email уже встречался в этом импорте"
+
+
+async def iter_lines(chunks):
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    buffer = ""
+    async for chunk in chunks:
+        buffer += decoder.decode(chunk)
+        *lines, buffer = buffer.split("\n")
+        if len(buffer) > MAX_LINE_LENGTH:
+            raise ValueError("Слишком длинная строка во входном потоке")
+        for line in lines:
+            yield line.rstrip("\r")
+    buffer += decoder.decode(b"", final=True)
+    if buffer:
+        yield buffer.rstrip("\r")
+
+
+async def parse_records(chunks, fmt: str):
+    """
+    Yields (fields, error) per non-blank line of an NDJSON or CSV stream; CSV
+    takes column names from its first line. A malformed line yields an error
+    instead of stopping the import.
+    """
+    header = None
+    async for line in iter_lines(chunks):
+        if not line.strip():
+            continue
+        if fmt == FORMAT_CSV:
+            values = next(csv.reader([line]))
+            if header is None:
+                header = [name.strip() for name in values]
+                continue
+            if len(values) != len(header):
+                yield None, "Число полей не совпадает с заголовком"
+                continue
+            yield dict(zip(header, values)), None
+        else:
+            try:
+                fields = json.loads(line)
+            except ValueError:
+                yield None, "Строка не является JSON"
+                continue
+            if not isinstance(fields, dict):
+                yield None, "Строка не является JSON-объектом"
+                continue
+            yield fields, None
+
+
+def validate(fields: dict) -> Optional[str]:
+    if not fields.get("email") or not fields.get("full_name"):
+        return "Не заполнены email или full_name"
+    if bool(fields.get("password")) == bool(fields.get("password_hash")):
+        return "Нужно указать ровно одно из полей password и password_hash"
+    if fields.get("password_hash") and not str(fields["password_hash"]).startswith(HASH_PREFIX):
+        return "password_hash должен быть хэшем argon2"
+    return None
+
+
+class UserImportService:
+    """
+    Bulk user import. Each batch of records is loaded with one multi-row
+    statement and committed together with the import's progress, so an
+    interrupted upload is resumed by sending the same stream with the import id.
+    """
+
+    def __init__(self, passwords=None, batch_size: int = IMPORT_BATCH_SIZE):
+        self.passwords = passwords or get_passwords()
+        self.batch_size = batch_size
+
+    async def _start(self, import_id: Optional[str]) -> UserImportDB:
+        async with SessionLocal() as session:
+            if import_id is None:
+                state = UserImportDB(id=uuid.uuid4(), status="running", processed=0, inserted=0, conflicts=0)
+                session.add(state)
+                await session.commit()
+                return state
+            result = await session.execute(select(UserImportDB).where(UserImportDB.id == uuid.UUID(import_id)))
+            state = result.scalar_one_or_none()
+        if state is None:
+            raise ValueError("Импорт не найден")
+        if state.status == "completed":
+            raise ValueError("Импорт уже завершён")
+        return state
+
+    async def _load_batch(self, import_id, processed: int, batch: list) -> None:
+        conflicts = []
+        users = {}
+        plaintext = []
+        for record, fields, error in batch:
+            error = error or validate(fields)
+            email = str(fields.get("email") or "").strip() if fields else None
+            if error is None and email in users:
+                error = EMAIL_REPEATED
+            if error is not None:
+                conflicts.append(dict(import_id=import_id, record=record, email=email or None, reason=error))
+                continue
+            users[email] = (record, dict(
+                id=uuid.uuid4(),
+                email=email,
+                full_name=str(fields["full_name"]).strip(),
+                password=str(fields["password_hash"]) if fields.get("password_hash") else None,
+                created_at=datetime.utcnow(),
+            ))
+            if fields.get("password"):
+                plaintext.append((email, str(fields["password"])))
+
+        # хэшируем до открытия транзакции: соединение с БД не ждёт KDF
+        hashes = await self.passwords.hash_many([password for _, password in plaintext])
+        for (email, _), password_hash in zip(plaintext, hashes):
+            users[email][1]["password"] = password_hash
+
+        async with SessionLocal() as session:
+            created = set()
+            if users:
+                result = await session.execute(insert_users([user for _, user in users.values()]))
+                created = {row.email for row in result.all()}
+            for email, (record, _) in users.items():
+                if email not in created:
+                    conflicts.append(dict(import_id=import_id, record=record, email=email, reason=EMAIL_TAKEN))
+            if conflicts:
+                await session.execute(insert(UserImportConflictDB).values(conflicts).on_conflict_do_nothing())
+            # прогресс коммитится вместе с пачкой; условие на processed отсекает второй запрос с тем же импортом
+            result = await session.execute(
+                update(UserImportDB)
+                .where(UserImportDB.id == import_id, UserImportDB.processed == processed)
+                .values(
+                    processed=processed + len(batch),
+                    inserted=UserImportDB.inserted + len(created),
+                    conflicts=UserImportDB.conflicts + len(conflicts),
+                    updated_at=datetime.utcnow(),
+                )
+            )
+            if result.rowcount != 1:
+                await session.rollback()
+                raise ValueError("Импорт уже продолжается другим запросом")
+            await session.commit()
+
+    async def run(self, import_id: Optional[str], chunks, fmt: str) -> UserImportResponse:
+        """
+        Loads users from the stream. With import_id the records already
+        processed by earlier attempts are skipped.
+        """
+        state = await self._start(import_id)
+        processed = state.processed
+        batch = []
+        record = 0
+        async for fields, error in parse_records(chunks, fmt):
+            record += 1
+            if record <= state.processed:
+                continue
+            batch.append((record, fields, error))
+            if len(batch) >= self.batch_size:
+                await self._load_batch(state.id, processed, batch)
+                processed += len(batch)
+                batch = []
+        if batch:
+            await self._load_batch(state.id, processed, batch)
+        async with SessionLocal() as session:
+            await session.execute(
+                update(UserImportDB)
+                .where(UserImportDB.id == state.id)
+                .values(status="completed", updated_at=datetime.utcnow())
+            )
+            await session.commit()
+        return await self.get_import(str(state.id))
+
+    async def get_import(self, import_id: str) -> UserImportResponse:
+        async with SessionLocal() as session:
+            result = await session.execute(select(UserImportDB).where(UserImportDB.id == uuid.UUID(import_id)))
+            state = result.scalar_one_or_none()
+            if state is None:
+                raise ValueError("Импорт не найден")
+            result = await session.execute(
+                select(UserImportConflictDB)
+                .where(UserImportConflictDB.import_id == state.id)
+                .order_by(UserImportConflictDB.record)
+                .limit(IMPORT_CONFLICTS_SHOWN)
+            )
+            conflicts = result.scalars().all()
+        return UserImportResponse(
+            import_id=str(state.id),
+            status=state.status,
+            processed=state.processed,
+            inserted=state.inserted,
+            conflicts=state.conflicts,
+            conflict_rows=[
+                ImportConflict(record=row.record, email=row.email, reason=row.reason) for row in conflicts
+            ],
+        )
@@ -0,0 +1,247 @@
+# app/common/auth_client.py
+# проверка access-токенов, общая для всех сервисов: ключи и список отзывов берутся у auth
+import asyncio
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from fastapi import Depends, HTTPException, status
+from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+import httpx
+import jwt
+from prometheus_client import Counter, Gauge, Histogram
+
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", 10000))
+# верхняя граница жизни записи, даже если exp в токене дальше
+TOKEN_CACHE_TTL = float(os.getenv("TOKEN_CACHE_TTL", 300))
+AUTH_SERVICE_URL = os.getenv("AUTH_SERVICE_URL", "http://auth-service:8002")
+# за столько секунд отзыв сессии доходит до сервиса
+REVOCATION_SYNC_INTERVAL = float(os.getenv("REVOCATION_SYNC_INTERVAL", 5))
+# столько последних записей перечитывается при каждой синхронизации: seq раздаётся при вставке,
+# и отзыв из транзакции, закоммиченной позже соседних, появляется уже за курсором
+REVOCATION_LOOKBACK = int(os.getenv("REVOCATION_LOOKBACK", 100))
+# должно быть заметно меньше JWT_KEY_PUBLISH_DELAY сервиса auth
+JWKS_REFRESH_INTERVAL = float(os.getenv("JWKS_REFRESH_INTERVAL", 60))
+# внеплановые загрузки JWKS (токен с неизвестным kid) — не чаще раза в столько секунд
+JWKS_MIN_REFRESH_INTERVAL = float(os.getenv("JWKS_MIN_REFRESH_INTERVAL", 5))
+# первая пауза перед повтором, пока ключей нет совсем; дальше удваивается до JWKS_REFRESH_INTERVAL
+JWKS_RETRY_DELAY = float(os.getenv("JWKS_RETRY_DELAY", 1))
+security = HTTPBearer()
+
+TOKEN_CACHE_REQUESTS = Counter(
+    "auth_token_cache_requests_total", "Bearer token lookups by cache outcome", ["result"]
+)
+TOKEN_VERIFY_SECONDS = Histogram(
+    "auth_token_verify_duration_seconds", "Time spent decoding and verifying a bearer token"
+)
+REVOKED_SESSIONS = Gauge("auth_revoked_sessions", "Revoked sessions held in the local revocation list")
+SIGNING_KEYS = Gauge("auth_signing_keys", "Token signing keys known from the auth service JWKS")
+
+logger = logging.getLogger(__name__)
+
+
+class TokenCache:
+    """
+    Bounded LRU of verified token claims keyed by the sha256 of the token.
+    An entry lives until the token's exp or the TTL, whichever comes first.
+    """
+
+    def __init__(self, capacity: int = TOKEN_CACHE_SIZE, ttl: float = TOKEN_CACHE_TTL):
+        self.capacity = capacity
+        self.ttl = ttl
+        self.entries: OrderedDict = OrderedDict()
+        # синхронные зависимости FastAPI выполняются в пуле потоков
+        self.lock = threading.Lock()
+
+    def get(self, digest: bytes) -> Optional[dict]:
+        with self.lock:
+            entry = self.entries.get(digest)
+            if entry is None:
+                return None
+            claims, expires_at = entry
+            if expires_at <= time.time():
+                del self.entries[digest]
+                return None
+            self.entries.move_to_end(digest)
+            return claims
+
+    def put(self, digest: bytes, claims: dict) -> None:
+        expires_at = time.time() + self.ttl
+        if isinstance(claims.get("exp"), (int, float)):
+            expires_at = min(expires_at, claims["exp"])
+        with self.lock:
+            self.entries[digest] = (claims, expires_at)
+            self.entries.move_to_end(digest)
+            while len(self.entries) > self.capacity:
+                self.entries.popitem(last=False)
+
+
+class PublicKeys:
+    """
+    Token verification keys from the auth service JWKS, selected by kid. The
+    algorithm comes from the key, never from the token header. When the auth
+    service is unreachable the last known keys keep being used. A token with an
+    unknown kid asks the refresh loop for an early fetch.
+    """
+
+    def __init__(self, base_url: str = AUTH_SERVICE_URL, transport=None):
+        self.client = httpx.AsyncClient(base_url=base_url, timeout=5.0, transport=transport)
+        self.keys: dict = {}  # kid -> (алгоритм, открытый ключ)
+        self.stale = asyncio.Event()
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def load(self, jwks: dict) -> None:
+        keys = {}
+        for jwk in jwks["keys"]:
+            key = jwt.PyJWK(jwk)
+            keys[key.key_id] = (jwk["alg"], key.key)
+        self.keys = keys
+        SIGNING_KEYS.set(len(keys))
+
+    async def refresh(self) -> None:
+        response = await self.client.get("/.well-known/jwks.json")
+        response.raise_for_status()
+        self.load(response.json())
+
+    def get(self, kid: Optional[str]):
+        return self.keys.get(kid)
+
+    def request_refresh(self) -> None:
+        # вызывается из потоков пула, где выполняются синхронные зависимости
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.stale.set)
+
+
+class RevocationList:
+    """
+    Local copy of the sessions revoked by the auth service, pulled incrementally
+    by cursor. Each sync re-reads the last `lookback` entries before the cursor,
+    so a revocation committed out of order is still picked up; the dict keyed by
+    session id absorbs the repeats. An entry is dropped once every access token
+    of its session has expired, so the set stays as small as the number of recent
+    logouts. When the auth service is unreachable the last known copy keeps being used.
+    """
+
+    def __init__(self, base_url: str = AUTH_SERVICE_URL, transport=None, lookback: int = REVOCATION_LOOKBACK):
+        self.client = httpx.AsyncClient(base_url=base_url, timeout=5.0, transport=transport)
+        self.sessions: dict = {}
+        self.cursor = 0
+        self.lookback = lookback
+
+    def is_revoked(self, session_id: Optional[str]) -> bool:
+        expires_at = self.sessions.get(session_id)
+        return expires_at is not None and expires_at > time.time()
+
+    async def sync(self) -> None:
+        now = time.time()
+        # новый словарь подменяется целиком: проверки из потоков пула не видят его недостроенным
+        sessions = {session_id: expires_at for session_id, expires_at in self.sessions.items() if expires_at > now}
+        cursor = max(0, self.cursor - self.lookback)
+        while True:
+            response = await self.client.get("/revocations", params={"since": cursor})
+            response.raise_for_status()
+            page = response.json()
+            for entry in page["sessions"]:
+                if entry["expires_at"] > now:
+                    sessions[entry["session_id"]] = entry["expires_at"]
+            cursor = page["cursor"]
+            if not page["has_more"]:
+                break
+        self.sessions = sessions
+        self.cursor = max(self.cursor, cursor)
+        REVOKED_SESSIONS.set(len(sessions))
+
+
+token_cache = TokenCache()
+public_keys = PublicKeys()
+revocations = RevocationList()
+
+
+async def run_key_refresh(keys: PublicKeys, interval: float = JWKS_REFRESH_INTERVAL,
+                          min_interval: float = JWKS_MIN_REFRESH_INTERVAL, retry_delay: float = JWKS_RETRY_DELAY):
+    keys.loop = asyncio.get_running_loop()
+    delay = retry_delay
+    while True:
+        if keys.keys:
+            # плановое обновление или раньше, если пришёл токен с неизвестным kid
+            try:
+                await asyncio.wait_for(keys.stale.wait(), interval)
+            except asyncio.TimeoutError:
+                pass
+        else:
+            # ключей нет (auth был недоступен при старте) — каждый запрос сейчас получает 401,
+            # поэтому повторяем с короткой нарастающей паузой, а не через полный интервал
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, interval)
+        keys.stale.clear()
+        try:
+            await keys.refresh()
+            delay = retry_delay
+        except Exception:
+            logger.exception("JWKS refresh failed")
+        if keys.keys:
+            # поток токенов с чужим kid не должен превращаться в поток запросов к auth
+            await asyncio.sleep(min_interval)
+
+
+async def run_revocation_sync(revocation_list: RevocationList, interval: float = REVOCATION_SYNC_INTERVAL):
+    while True:
+        try:
+            await revocation_list.sync()
+        except Exception:
+            logger.exception("Revocation list sync failed")
+        await asyncio.sleep(interval)
+
+
+async def start_auth_sync() -> list:
+    """
+    Fetches the signing keys before the service starts taking requests, then
+    keeps the keys and the revocation list fresh in background tasks.
+    """
+    try:
+        await public_keys.refresh()
+    except Exception:
+        logger.exception("JWKS fetch failed")
+    return [
+        asyncio.create_task(run_key_refresh(public_keys)),
+        asyncio.create_task(run_revocation_sync(revocations)),
+    ]
+
+
+def verify_token(token: str) -> dict:
+    started = time.perf_counter()
+    try:
+        key = public_keys.get(jwt.get_unverified_header(token).get("kid"))
+        if key is None:
+            # ключ мог появиться в JWKS после последней загрузки
+            public_keys.request_refresh()
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid credentials")
+        algorithm, public_key = key
+        payload = jwt.decode(token, public_key, algorithms=[algorithm])
+    except jwt.PyJWTError:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid credentials")
+    finally:
+        TOKEN_VERIFY_SECONDS.observe(time.perf_counter() - started)
+    if payload.get("sub") is None:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
+    return payload
+
+
+def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    token = credentials.credentials
+    digest = hashlib.sha256(token.encode("utf-8")).digest()
+    claims = token_cache.get(digest)
+    if claims is not None:
+        TOKEN_CACHE_REQUESTS.labels("hit").inc()
+    else:
+        TOKEN_CACHE_REQUESTS.labels("miss").inc()
+        claims = verify_token(token)
+        token_cache.put(digest, claims)
+    # отзыв проверяется и для закэшированных токенов
+    if revocations.is_revoked(claims.get("sid")):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Token revoked")
+    return claims["sub"]
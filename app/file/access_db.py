@@ -0,0 +1,19 @@
+# app/models/access_db.py
+from sqlalchemy import Column, Integer, String, ForeignKey, Index
+from sqlalchemy.dialects.postgresql import UUID
+
+from app.file.db import Base
+
+
+class AccessDB(Base):
+    __tablename__ = "access"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    file_id = Column(String, ForeignKey("files.id"), nullable=False)
+    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=False)
+    permission = Column(String, nullable=False)  # 'read' или 'write'
+
+    __table_args__ = (
+        # "что расшарено со мной" — поиск файлов в file-service идёт от пользователя к файлам
+        Index("ix_access_user_file", "user_id", "file_id"),
+        Index("ix_access_file", "file_id"),
+    )
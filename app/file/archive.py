@@ -0,0 +1,222 @@
+# app/file/archive.py
+import asyncio
+import struct
+import tarfile
+import zlib
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import AsyncIterator, Callable
+
+ZIP64_LIMIT = 0xFFFFFFFF
+# запас на случай, если deflate чуть раздует почти 4-гигабайтный файл
+ZIP64_SIZE_THRESHOLD = 0xFFFF0000
+ZIP_STORED = 0
+ZIP_DEFLATED = 8
+ZIP_FLAGS = 0x08 | 0x800  # размеры и CRC в data descriptor, имена в UTF-8
+
+
+@dataclass
+class ArchiveMember:
+    name: str
+    size: int
+    modified: datetime
+    segments: list
+    compress: bool  # deflate для сжимаемого содержимого, store для уже сжатого
+
+
+def _dos_datetime(value: datetime):
+    value = max(value, datetime(1980, 1, 1))
+    dos_date = (value.year - 1980) << 9 | value.month << 5 | value.day
+    dos_time = value.hour << 11 | value.minute << 5 | value.second // 2
+    return dos_time, dos_date
+
+
+async def _read_member(member: ArchiveMember, read_segment: Callable) -> AsyncIterator[bytes]:
+    for segment in member.segments:
+        async for chunk in read_segment(*segment):
+            yield chunk
+
+
+async def stream_zip(members: list, read_segment: Callable) -> AsyncIterator[bytes]:
+    """
+    Generates a ZIP archive on the fly. Every member is followed by a data
+    descriptor, so nothing is buffered beyond one chunk; ZIP64 records are
+    emitted for large members, offsets and entry counts.
+    """
+    offset = 0
+    central_directory = []
+    for member in members:
+        name = member.name.encode("utf-8")
+        method = ZIP_DEFLATED if member.compress else ZIP_STORED
+        zip64 = member.size >= ZIP64_SIZE_THRESHOLD
+        version = 45 if zip64 else 20
+        dos_time, dos_date = _dos_datetime(member.modified)
+        extra = struct.pack("<HHQQ", 1, 16, 0, 0) if zip64 else b""
+        size_field = ZIP64_LIMIT if zip64 else 0
+        header = struct.pack(
+            "<IHHHHHIIIHH", 0x04034B50, version, ZIP_FLAGS, method, dos_time, dos_date,
+            0, size_field, size_field, len(name), len(extra),
+        ) + name + extra
+        header_offset = offset
+        yield header
+        offset += len(header)
+
+        crc = 0
+        compressed_size = 0
+        compressor = zlib.compressobj(6, zlib.DEFLATED, -15) if member.compress else None
+        async for chunk in _read_member(member, read_segment):
+            crc = zlib.crc32(chunk, crc)
+            if compressor:
+                chunk = await asyncio.to_thread(compressor.compress, chunk)
+            if chunk:
+                compressed_size += len(chunk)
+                yield chunk
+        if compressor:
+            tail = compressor.flush()
+            compressed_size += len(tail)
+            yield tail
+        offset += compressed_size
+
+        if zip64:
+            descriptor = struct.pack("<IIQQ", 0x08074B50, crc, compressed_size, member.size)
+        else:
+            descriptor = struct.pack("<IIII", 0x08074B50, crc, compressed_size, member.size)
+        yield descriptor
+        offset += len(descriptor)
+        central_directory.append(
+            (name, version, method, dos_time, dos_date, crc, compressed_size, member.size, header_offset)
+        )
+
+    cd_offset = offset
+    for name, version, method, dos_time, dos_date, crc, compressed_size, size, header_offset in central_directory:
+        zip64_fields = []
+        if size >= ZIP64_LIMIT or compressed_size >= ZIP64_LIMIT or version == 45:
+            zip64_fields += [size, compressed_size]
+            size = compressed_size = ZIP64_LIMIT
+        if header_offset >= ZIP64_LIMIT:
+            zip64_fields.append(header_offset)
+            header_offset = ZIP64_LIMIT
+        extra = b""
+        if zip64_fields:
+            version = 45
+            extra = struct.pack("<HH" + "Q" * len(zip64_fields), 1, 8 * len(zip64_fields), *zip64_fields)
+        entry = struct.pack(
+            "<IHHHHHHIIIHHHHHII", 0x02014B50, version, version, ZIP_FLAGS, method, dos_time, dos_date,
+            crc, compressed_size, size, len(name), len(extra), 0, 0, 0, 0o100644 << 16, header_offset,
+        ) + name + extra
+        yield entry
+        offset += len(entry)
+
+    cd_size = offset - cd_offset
+    count = len(central_directory)
+    if count >= 0xFFFF or cd_size >= ZIP64_LIMIT or cd_offset >= ZIP64_LIMIT:
+        yield struct.pack("<IQHHIIQQQQ", 0x06064B50, 44, 45, 45, 0, 0, count, count, cd_size, cd_offset)
+        yield struct.pack("<IIQI", 0x07064B50, 0, offset, 1)
+        yield struct.pack("<IHHHHIIH", 0x06054B50, 0, 0, 0xFFFF, 0xFFFF, ZIP64_LIMIT, ZIP64_LIMIT, 0)
+    else:
+        yield struct.pack("<IHHHHIIH", 0x06054B50, 0, 0, count, count, cd_size, cd_offset, 0)
+
+
+async def stream_tar(members: list, read_segment: Callable) -> AsyncIterator[bytes]:
+    """
+    Generates a POSIX (pax) tar archive on the fly; long names and sizes over
+    8 GiB go into pax headers.
+    """
+    for member in members:
+        info = tarfile.TarInfo(member.name)
+        info.size = member.size
+        info.mtime = int(member.modified.replace(tzinfo=timezone.utc).timestamp())
+        info.mode = 0o644
+        yield info.tobuf(format=tarfile.PAX_FORMAT, encoding="utf-8")
+        async for chunk in _read_member(member, read_segment):
+            yield chunk
+        padding = -member.size % tarfile.BLOCKSIZE
+        if padding:
+            yield b"\0" * padding
+    yield b"\0" * (tarfile.BLOCKSIZE * 2)
+
+
+class _StreamReader:
+    def __init__(self, chunks):
+        self.chunks = chunks.__aiter__()
+        self.buffer = bytearray()
+
+    async def _fill(self) -> bool:
+        chunk = await anext(self.chunks, None)
+        if chunk is None:
+            return False
+        self.buffer += chunk
+        return True
+
+    async def read(self, size: int) -> bytes:
+        while len(self.buffer) < size and await self._fill():
+            pass
+        data = bytes(self.buffer[:size])
+        del self.buffer[:size]
+        return data
+
+    async def iter_exact(self, size: int) -> AsyncIterator[bytes]:
+        remaining = size
+        while remaining:
+            if not self.buffer and not await self._fill():
+                raise ValueError("Архив обрезан")
+            data = bytes(self.buffer[:remaining])
+            del self.buffer[:len(data)]
+            remaining -= len(data)
+            yield data
+
+
+def _parse_pax(data: bytes) -> dict:
+    fields = {}
+    position = 0
+    while position < len(data) and data[position:position + 1] != b"\0":
+        length, _, _ = data[position:].partition(b" ")
+        record = data[position:position + int(length)]
+        key, _, value = record[len(length) + 1:-1].partition(b"=")
+        fields[key.decode("utf-8")] = value.decode("utf-8", "surrogateescape")
+        position += int(length)
+    return fields
+
+
+async def read_tar(chunks) -> AsyncIterator[tuple]:
+    """
+    Parses a tar stream on the fly and yields (name, body) for regular files.
+    The body must be consumed (or abandoned) before the next entry is requested;
+    whatever is left of it is skipped.
+    """
+    reader = _StreamReader(chunks)
+    pax = {}
+    long_name = None
+    while True:
+        block = await reader.read(tarfile.BLOCKSIZE)
+        if not block.strip(b"\0"):
+            # два нулевых блока (или просто конец потока) — конец архива
+            return
+        if len(block) < tarfile.BLOCKSIZE:
+            raise ValueError("Архив обрезан")
+        try:
+            info = tarfile.TarInfo.frombuf(block, "utf-8", "surrogateescape")
+            size = int(pax.get("size", info.size)) if info.type not in (tarfile.XHDTYPE, tarfile.XGLTYPE) else info.size
+        except (tarfile.HeaderError, ValueError):
+            raise ValueError("Некорректный tar-архив")
+        padding = -size % tarfile.BLOCKSIZE
+
+        if info.type in (tarfile.XHDTYPE, tarfile.XGLTYPE, tarfile.GNUTYPE_LONGNAME):
+            data = (await reader.read(size + padding))[:size]
+            try:
+                if info.type == tarfile.XHDTYPE:
+                    pax = _parse_pax(data)
+                elif info.type == tarfile.GNUTYPE_LONGNAME:
+                    long_name = data.rstrip(b"\0").decode("utf-8", "surrogateescape")
+            except ValueError:
+                raise ValueError("Некорректный tar-архив")
+            continue
+
+        name = pax.get("path") or long_name or info.name
+        pax, long_name = {}, None
+        body = reader.iter_exact(size)
+        if info.isreg():
+            yield name, body
+        async for _ in body:
+            pass
+        await reader.read(padding)
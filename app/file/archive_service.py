@@ -0,0 +1,121 @@
+# app/services/archive_service.py
+import os
+from collections import defaultdict
+from functools import partial
+
+from sqlalchemy import select
+from starlette.responses import StreamingResponse
+
+from app.file.archive import ArchiveMember, stream_zip, stream_tar
+from app.file.blob_db import BlobDB
+from app.file.blob_store import get_blob_store
+from app.file.compression import read_segment
+from app.file.db import SessionLocal
+from app.file.download import select_segments, content_disposition
+from app.file.file_db import FileDB, FileChunkDB
+from app.file.folder_service import ROOT_FOLDER, resolve_parent_path
+
+MAX_ARCHIVE_MEMBERS = int(os.getenv("MAX_ARCHIVE_MEMBERS", 10000))
+
+ARCHIVE_FORMATS = {
+    "zip": (stream_zip, "application/zip"),
+    "tar": (stream_tar, "application/x-tar"),
+}
+
+MEMBER_COLUMNS = (FileDB.id, FileDB.name, FileDB.size, FileDB.uploaded_at, FileDB.codec, FileDB.is_folder, FileDB.path)
+
+
+def _safe_name(name: str) -> str:
+    return name.replace("/", "_").replace("\\", "_") or "_"
+
+
+def _unique(name: str, taken: set) -> str:
+    candidate, counter = name, 1
+    while candidate in taken:
+        stem, dot, ext = name.rpartition(".")
+        candidate = f"{stem} ({counter}).{ext}" if dot and stem else f"{name} ({counter})"
+        counter += 1
+    taken.add(candidate)
+    return candidate
+
+
+class ArchiveService:
+    def __init__(self, blob_store=None):
+        self.blob_store = blob_store or get_blob_store()
+
+    async def _select_rows(self, session, user_id, file_ids, folder_id):
+        """
+        Returns (arcname, row) pairs of the files to pack, relative to the folder if one is given.
+        """
+        alive = (FileDB.user_id == user_id, FileDB.deleted_at.is_(None))
+        if folder_id is None:
+            result = await session.execute(
+                select(*MEMBER_COLUMNS)
+                .where(*alive, FileDB.id.in_(file_ids), FileDB.is_folder.is_(False))
+                .order_by(FileDB.name, FileDB.id)
+                .limit(MAX_ARCHIVE_MEMBERS + 1)
+            )
+            return [(_safe_name(row.name), row) for row in result.all()]
+
+        prefix = "/" if folder_id == ROOT_FOLDER else await resolve_parent_path(session, folder_id, user_id)
+        result = await session.execute(
+            select(*MEMBER_COLUMNS)
+            .where(*alive, FileDB.path.startswith(prefix, autoescape=True), FileDB.path != prefix)
+            .order_by(FileDB.path)
+        )
+        rows = result.all()
+        folder_names = {row.id: _safe_name(row.name) for row in rows if row.is_folder}
+        selected = []
+        for row in rows:
+            if row.is_folder:
+                continue
+            ancestors = row.path[len(prefix):].strip("/").split("/")[:-1]
+            parts = [folder_names.get(ancestor, ancestor) for ancestor in ancestors]
+            selected.append(("/".join(parts + [_safe_name(row.name)]), row))
+        return selected
+
+    async def collect_members(self, user_id: str, file_ids=None, folder_id=None) -> list:
+        async with SessionLocal() as session:
+            selected = await self._select_rows(session, user_id, file_ids or [], folder_id)
+            if not selected:
+                raise ValueError("Нет файлов для архива")
+            if len(selected) > MAX_ARCHIVE_MEMBERS:
+                raise ValueError(f"В архив можно поместить не больше {MAX_ARCHIVE_MEMBERS} файлов")
+            result = await session.execute(
+                select(
+                    FileChunkDB.file_id,
+                    FileChunkDB.storage_key,
+                    FileChunkDB.blob_offset,
+                    FileChunkDB.length,
+                    BlobDB.codec,
+                    BlobDB.frames,
+                )
+                .join(BlobDB, BlobDB.hash == FileChunkDB.storage_key, isouter=True)
+                .where(FileChunkDB.file_id.in_([row.id for _, row in selected]))
+                .order_by(FileChunkDB.file_id, FileChunkDB.seq)
+            )
+            chunks = defaultdict(list)
+            for chunk in result.all():
+                chunks[chunk.file_id].append(chunk)
+
+        taken = set()
+        return [
+            ArchiveMember(
+                name=_unique(name, taken),
+                size=row.size,
+                modified=row.uploaded_at,
+                segments=select_segments(chunks[row.id], 0, row.size - 1),
+                # сжимаемое содержимое уходит в deflate, уже сжатое — в store
+                compress=row.codec is not None,
+            )
+            for name, row in selected
+        ]
+
+    async def build_archive(self, user_id: str, file_ids=None, folder_id=None, fmt: str = "zip") -> StreamingResponse:
+        stream, media_type = ARCHIVE_FORMATS[fmt]
+        members = await self.collect_members(user_id, file_ids, folder_id)
+        return StreamingResponse(
+            stream(members, partial(read_segment, self.blob_store)),
+            media_type=media_type,
+            headers={"content-disposition": content_disposition("archive." + fmt)},
+        )
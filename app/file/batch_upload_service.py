@@ -0,0 +1,144 @@
+# app/services/batch_upload_service.py
+import os
+import posixpath
+from datetime import datetime
+
+from sqlalchemy import insert, update
+
+from app.file.archive import read_tar
+from app.file.blob_store import get_blob_store
+from app.file.content_store import ContentStore
+from app.file.db import SessionLocal
+from app.file.file import BatchUploadItem, BatchUploadResponse
+from app.file.file_db import FileDB, FileChunkDB, new_id, child_path
+from app.file.file_service import read_upload_file
+from app.file.folder_service import resolve_parent_path
+from app.file.preview_pipeline import get_preview_pipeline
+from app.file.upload_validation import FileTooLarge, FileTypeNotAllowed
+from app.file.versions import find_by_name, archive_current
+
+# на файл в INSERT уходит около десятка параметров, а у Postgres их не больше 32767 на запрос
+MAX_BATCH_FILES = int(os.getenv("MAX_BATCH_FILES", 1000))
+# сколько байт мелких файлов держим в памяти, прежде чем взять ссылки на их блобы
+BATCH_UPLOAD_BUFFER = int(os.getenv("BATCH_UPLOAD_BUFFER", 64 * 1024 * 1024))
+
+
+async def multipart_entries(files):
+    for file in files:
+        yield file.filename, read_upload_file(file)
+
+
+def tar_entries(chunks):
+    return read_tar(chunks)
+
+
+class BatchUploadService:
+    """
+    Uploads many files in one transaction: blobs are written in a single streaming
+    pass, references are taken with multi-row upserts and all new file rows go in
+    with one multi-row INSERT.
+    """
+
+    def __init__(self, blob_store=None):
+        self.blob_store = blob_store or get_blob_store()
+        self.content_store = ContentStore(self.blob_store)
+        self.previews = get_preview_pipeline()
+
+    async def upload_batch(self, entries, user_id, parent_id=None, policy=None) -> BatchUploadResponse:
+        items = []
+        accepted = []  # (индекс в items, имя)
+        pending = []
+        blobs = []
+        names = set()
+        async with SessionLocal() as session:
+            await resolve_parent_path(session, parent_id, user_id)
+            await session.commit()
+            try:
+                buffered = 0
+                async for name, chunks in entries:
+                    name = posixpath.basename((name or "").rstrip("/"))
+                    items.append(BatchUploadItem(name=name))
+                    if not name:
+                        items[-1].error = "Пустое имя файла"
+                        continue
+                    if name in names:
+                        items[-1].error = "Файл с таким именем уже есть в пакете"
+                        continue
+                    if len(accepted) >= MAX_BATCH_FILES:
+                        items[-1].error = f"В одном пакете можно загрузить не больше {MAX_BATCH_FILES} файлов"
+                        continue
+                    if policy is not None:
+                        chunks = policy.guard(chunks, name)
+                    try:
+                        staged = await self.content_store.stage(chunks)
+                    except (FileTooLarge, FileTypeNotAllowed) as e:
+                        items[-1].error = str(e)
+                        continue
+                    accepted.append((len(items) - 1, name))
+                    names.add(name)
+                    pending.append(staged)
+                    if staged.payload is not None:
+                        buffered += len(staged.payload)
+                    if buffered >= BATCH_UPLOAD_BUFFER:
+                        staged_blobs, pending, buffered = pending, [], 0
+                        blobs += await self.content_store.put_many(session, staged_blobs)
+                if pending:
+                    staged_blobs, pending = pending, []
+                    blobs += await self.content_store.put_many(session, staged_blobs)
+                if not accepted:
+                    return BatchUploadResponse(items=items)
+
+                # пока принимался пакет, папку могли перенести или удалить — путь берём заново под блокировкой
+                parent_path = await resolve_parent_path(session, parent_id, user_id, lock=True)
+                uploaded_at = datetime.utcnow()
+                # файлы с уже существующими в папке именами становятся их новыми версиями
+                existing = await find_by_name(session, user_id, parent_id, list(names))
+                files = []
+                versions = []
+                for (_, name), blob in zip(accepted, blobs):
+                    content = dict(
+                        size=blob.size,
+                        uploaded_at=uploaded_at,
+                        content_hash=blob.hash,
+                        stored_size=blob.stored_size,
+                        codec=blob.codec,
+                    )
+                    if name in existing:
+                        versions.append(dict(id=existing[name], **content))
+                        continue
+                    file_id = new_id("file")
+                    files.append(dict(
+                        id=file_id,
+                        name=name,
+                        user_id=user_id,
+                        parent_id=parent_id,
+                        is_folder=False,
+                        path=child_path(parent_path, file_id),
+                        **content,
+                    ))
+                if versions:
+                    await archive_current(session, [version["id"] for version in versions])
+                    await session.execute(update(FileDB), versions)
+                file_ids = dict(existing)
+                if files:
+                    result = await session.execute(insert(FileDB).values(files).returning(FileDB.name, FileDB.id))
+                    file_ids.update({row.name: row.id for row in result.all()})
+                await session.execute(insert(FileChunkDB).values([
+                    dict(file_id=file["id"], seq=0, storage_key=file["content_hash"], blob_offset=0, length=file["size"])
+                    for file in versions + files
+                ]))
+                await session.commit()
+            except BaseException:
+                for staged in pending:
+                    await self.content_store.drop(staged)
+                # транзакция откатилась — записанные этим пакетом блобы никому не нужны
+                for blob in blobs:
+                    await self.content_store.discard(blob)
+                raise
+
+        for (index, name), blob in zip(accepted, blobs):
+            items[index].id = file_ids[name]
+            items[index].size = blob.size
+            items[index].uploaded_at = uploaded_at
+            self.previews.enqueue_blob(name, blob)
+        return BatchUploadResponse(items=items)
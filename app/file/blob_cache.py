@@ -0,0 +1,101 @@
+# app/file/blob_cache.py
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional
+
+from prometheus_client import Counter, Gauge
+
+BLOB_CACHE_BYTES = int(os.getenv("BLOB_CACHE_BYTES", 256 * 1024 * 1024))
+# блобы до этого размера кэшируются целиком, у больших — только начало
+BLOB_CACHE_PREFIX_BYTES = int(os.getenv("BLOB_CACHE_PREFIX_BYTES", 4 * 1024 * 1024))
+# блоб может удалить и перезаписать другая реплика, поэтому запись в кэше живёт ограниченное время
+BLOB_CACHE_TTL = float(os.getenv("BLOB_CACHE_TTL", 600))
+# блоб попадает в кэш только со N-го промаха: разовые чтения (архивы, дельты) не вытесняют горячие файлы
+BLOB_CACHE_ADMIT_AFTER = int(os.getenv("BLOB_CACHE_ADMIT_AFTER", 2))
+GHOST_KEYS = 65536
+
+CACHE_REQUESTS = Counter(
+    "blob_cache_requests_total", "Blob reads by cache outcome", ["result"]
+)
+CACHE_HIT_BYTES = Counter(
+    "blob_cache_hit_bytes_total", "Bytes served from the blob cache"
+)
+CACHE_EVICTIONS = Counter(
+    "blob_cache_evictions_total", "Entries dropped from the blob cache", ["reason"]
+)
+CACHE_SIZE = Gauge("blob_cache_bytes", "Bytes held by the blob cache")
+CACHE_ENTRIES = Gauge("blob_cache_entries", "Blobs held by the blob cache")
+
+
+@dataclass
+class CacheEntry:
+    data: bytes
+    complete: bool  # data — весь блоб, а не только его начало
+    expires_at: float
+
+
+class BlobCache:
+    """
+    In-process LRU cache of stored blob bytes bounded by a byte budget. Holds
+    whole small blobs and leading ranges of large ones.
+    """
+
+    def __init__(self, capacity: int = BLOB_CACHE_BYTES, prefix_size: int = BLOB_CACHE_PREFIX_BYTES,
+                 ttl: float = BLOB_CACHE_TTL, admit_after: int = BLOB_CACHE_ADMIT_AFTER):
+        self.capacity = capacity
+        self.prefix_size = prefix_size
+        self.ttl = ttl
+        self.admit_after = admit_after
+        self.entries: OrderedDict[str, CacheEntry] = OrderedDict()
+        self.size = 0
+        # счётчики промахов по ключам, которых ещё нет в кэше
+        self.ghosts: OrderedDict[str, int] = OrderedDict()
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        if entry.expires_at <= time.monotonic():
+            self._remove(key, "expired")
+            return None
+        self.entries.move_to_end(key)
+        return entry
+
+    def admit(self, key: str) -> bool:
+        count = self.ghosts.pop(key, 0) + 1
+        if count >= self.admit_after:
+            return True
+        self.ghosts[key] = count
+        if len(self.ghosts) > GHOST_KEYS:
+            self.ghosts.popitem(last=False)
+        return False
+
+    def put(self, key: str, data: bytes, complete: bool) -> None:
+        if len(data) > self.capacity:
+            return
+        if key in self.entries:
+            self._remove(key, None)
+        while self.size + len(data) > self.capacity:
+            oldest = next(iter(self.entries))
+            self._remove(oldest, "capacity")
+        self.entries[key] = CacheEntry(data, complete, time.monotonic() + self.ttl)
+        self.size += len(data)
+        self._report()
+
+    def invalidate(self, key: str) -> None:
+        self.ghosts.pop(key, None)
+        if key in self.entries:
+            self._remove(key, "invalidated")
+
+    def _remove(self, key: str, reason: Optional[str]) -> None:
+        entry = self.entries.pop(key)
+        self.size -= len(entry.data)
+        if reason:
+            CACHE_EVICTIONS.labels(reason).inc()
+        self._report()
+
+    def _report(self) -> None:
+        CACHE_SIZE.set(self.size)
+        CACHE_ENTRIES.set(len(self.entries))
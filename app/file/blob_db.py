@@ -0,0 +1,21 @@
+# app/models/blob_db.py
+from sqlalchemy import Column, String, Integer, BigInteger, DateTime, Index, LargeBinary, text
+from datetime import datetime
+
+from app.file.db import Base
+
+
+class BlobDB(Base):
+    __tablename__ = "blobs"
+    hash = Column(String(64), primary_key=True)  # sha256 содержимого, он же ключ в BlobStore
+    size = Column(BigInteger, nullable=False)  # логический размер содержимого
+    stored_size = Column(BigInteger, nullable=True)  # физический размер на диске
+    codec = Column(String, nullable=True)  # "zstd" или NULL, если хранится как есть
+    # индекс независимых кадров zstd (compression.pack_frames); NULL у блобов, сжатых одним потоком
+    frames = Column(LargeBinary, nullable=True)
+    refcount = Column(Integer, nullable=False, default=0)  # число чанков и частей, ссылающихся на блоб
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index("ix_blobs_unreferenced", "hash", postgresql_where=text("refcount = 0")),
+    )
@@ -0,0 +1,542 @@
+# app/file/blob_store.py
+import asyncio
+import hashlib
+import itertools
+import os
+from collections import Counter, deque
+from dataclasses import dataclass
+from typing import AsyncIterator, Optional
+
+from app.file.blob_cache import BLOB_CACHE_BYTES, BlobCache, CACHE_HIT_BYTES, CACHE_REQUESTS
+from app.file.s3_client import S3Client
+
+BLOB_STORE_ROOT = os.getenv("BLOB_STORE_ROOT", "uploads")
+CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", 1024 * 1024))
+# несколько дисков для striped через запятую, по умолчанию — один BLOB_STORE_ROOT
+BLOB_STORE_ROOTS = [root for root in os.getenv("BLOB_STORE_ROOTS", BLOB_STORE_ROOT).split(",") if root]
+BLOB_STORE_REPLICAS = int(os.getenv("BLOB_STORE_REPLICAS", 1))
+# local, striped, s3 или memory (последний — только для тестов и одиночного процесса)
+BLOB_STORE_BACKEND = os.getenv("BLOB_STORE_BACKEND", "local")
+# части multipart-загрузки и диапазоны параллельного чтения; S3 требует части не меньше 5 MiB
+S3_PART_SIZE = int(os.getenv("S3_PART_SIZE", 8 * 1024 * 1024))
+S3_CONCURRENCY = int(os.getenv("S3_CONCURRENCY", 4))
+# больше этого CopyObject не копирует, крупные блобы копируются по частям
+S3_COPY_MAX = 5 * 1024 ** 3
+S3_COPY_PART_SIZE = int(os.getenv("S3_COPY_PART_SIZE", 512 * 1024 * 1024))
+
+
+class BlobStore:
+    """
+    Base interface of the blob backend: blobs are written and read as streams of chunks.
+    """
+
+    async def write(self, key: str, chunks: AsyncIterator[bytes]) -> int:
+        raise NotImplementedError
+
+    def read(self, key: str, offset: int = 0, length: Optional[int] = None) -> AsyncIterator[bytes]:
+        raise NotImplementedError
+
+    async def delete(self, key: str) -> None:
+        raise NotImplementedError
+
+    async def rename(self, key: str, new_key: str) -> None:
+        raise NotImplementedError
+
+    async def exists(self, key: str) -> bool:
+        raise NotImplementedError
+
+    def local_path(self, key: str) -> Optional[str]:
+        # путь на локальном диске, если блоб можно отдать через sendfile; может обращаться к диску,
+        # поэтому из async-кода вызывается через asyncio.to_thread
+        return None
+
+
+class LocalBlobStore(BlobStore):
+    def __init__(self, root: str = BLOB_STORE_ROOT, chunk_size: int = CHUNK_SIZE):
+        self.root = root
+        self.chunk_size = chunk_size
+
+    def path(self, key: str) -> str:
+        # раскладываем по подкаталогам, чтобы не держать миллионы файлов в одной папке
+        return os.path.join(self.root, key[-2:], key)
+
+    async def write(self, key: str, chunks: AsyncIterator[bytes]) -> int:
+        path = self.path(key)
+        tmp_path = path + ".part"
+        await asyncio.to_thread(os.makedirs, os.path.dirname(path), exist_ok=True)
+        f = await asyncio.to_thread(open, tmp_path, "wb")
+        size = 0
+        try:
+            async for chunk in chunks:
+                await asyncio.to_thread(f.write, chunk)
+                size += len(chunk)
+            await asyncio.to_thread(f.close)
+            await asyncio.to_thread(os.replace, tmp_path, path)
+        except BaseException:
+            f.close()
+            await asyncio.to_thread(_remove_silently, tmp_path)
+            raise
+        return size
+
+    async def read(self, key: str, offset: int = 0, length: Optional[int] = None) -> AsyncIterator[bytes]:
+        f = await asyncio.to_thread(open, self.path(key), "rb")
+        try:
+            if offset:
+                await asyncio.to_thread(f.seek, offset)
+            remaining = length
+            while remaining is None or remaining > 0:
+                size = self.chunk_size if remaining is None else min(self.chunk_size, remaining)
+                chunk = await asyncio.to_thread(f.read, size)
+                if not chunk:
+                    break
+                if remaining is not None:
+                    remaining -= len(chunk)
+                yield chunk
+        finally:
+            await asyncio.to_thread(f.close)
+
+    async def delete(self, key: str) -> None:
+        await asyncio.to_thread(_remove_silently, self.path(key))
+
+    async def rename(self, key: str, new_key: str) -> None:
+        new_path = self.path(new_key)
+        await asyncio.to_thread(os.makedirs, os.path.dirname(new_path), exist_ok=True)
+        await asyncio.to_thread(os.replace, self.path(key), new_path)
+
+    async def exists(self, key: str) -> bool:
+        return await asyncio.to_thread(os.path.exists, self.path(key))
+
+    def local_path(self, key: str) -> Optional[str]:
+        return self.path(key)
+
+
+@dataclass
+class RebalanceStats:
+    copied: int = 0
+    removed: int = 0
+    under_replicated: int = 0
+
+
+class StripedBlobStore(BlobStore):
+    """
+    Spreads blobs over several local roots (one per disk). Each blob lives on
+    `replicas` roots chosen by rendezvous hashing of its key, so adding a disk
+    only moves the blobs that now rank it higher. Reads go to the replica with
+    the fewest reads in flight.
+    """
+
+    def __init__(self, roots=None, replicas: int = BLOB_STORE_REPLICAS, chunk_size: int = CHUNK_SIZE):
+        roots = list(roots or BLOB_STORE_ROOTS)
+        if not 1 <= replicas <= len(roots):
+            raise ValueError("Число реплик должно быть от 1 до числа дисков")
+        self.stores = {root: LocalBlobStore(root, chunk_size) for root in roots}
+        self.replicas = replicas
+        self.load = Counter()
+
+    def placement(self, key: str) -> list:
+        ranked = sorted(
+            self.stores,
+            key=lambda root: hashlib.sha256((root + "\0" + key).encode("utf-8")).digest(),
+            reverse=True,
+        )
+        # временному блобу хватает одной копии: rename() всё равно разложит его по размещению итогового ключа
+        return ranked[:1] if key.startswith("tmp-") else ranked[:self.replicas]
+
+    def _holders(self, key: str) -> list:
+        return [root for root in self.stores if os.path.exists(self.stores[root].path(key))]
+
+    def _locate(self, key: str) -> list:
+        # блоб лежит на дисках своего размещения; остальные диски смотрим, только если там его нет
+        # (добавили диски, а rebalance ещё не перенёс блоб)
+        placement = self.placement(key)
+        found = [root for root in placement if os.path.exists(self.stores[root].path(key))]
+        if not found:
+            found = [root for root in self._holders(key) if root not in placement]
+        return sorted(found, key=lambda root: self.load[root])
+
+    async def write(self, key: str, chunks: AsyncIterator[bytes]) -> int:
+        paths = [self.stores[root].path(key) for root in self.placement(key)]
+        files = []
+        size = 0
+        try:
+            for path in paths:
+                await asyncio.to_thread(os.makedirs, os.path.dirname(path), exist_ok=True)
+                files.append(await asyncio.to_thread(open, path + ".part", "wb"))
+            async for chunk in chunks:
+                # реплики пишутся параллельно, каждая на свой диск
+                await asyncio.gather(*[asyncio.to_thread(f.write, chunk) for f in files])
+                size += len(chunk)
+            for f, path in zip(files, paths):
+                await asyncio.to_thread(f.close)
+                await asyncio.to_thread(os.replace, path + ".part", path)
+        except BaseException:
+            for f, path in zip(files, paths):
+                f.close()
+                await asyncio.to_thread(_remove_silently, path + ".part")
+            raise
+        return size
+
+    async def read(self, key: str, offset: int = 0, length: Optional[int] = None) -> AsyncIterator[bytes]:
+        roots = await asyncio.to_thread(self._locate, key)
+        if not roots:
+            raise FileNotFoundError(key)
+        root = roots[0]
+        self.load[root] += 1
+        try:
+            async for chunk in self.stores[root].read(key, offset, length):
+                yield chunk
+        finally:
+            self.load[root] -= 1
+
+    async def delete(self, key: str) -> None:
+        for store in self.stores.values():
+            await store.delete(key)
+
+    async def rename(self, key: str, new_key: str) -> None:
+        """
+        Moves the blob onto the roots new_key is placed on. The content hash is
+        known only after the upload streamed in, so the staging copy usually sits
+        elsewhere: it is renamed in place where it overlaps the placement and
+        copied to the other placed roots.
+        """
+        holders = await asyncio.to_thread(self._locate, key)
+        if not holders:
+            raise FileNotFoundError(key)
+        placement = self.placement(new_key)
+        for root in placement:
+            if root not in holders:
+                await self._copy(key, holders[0], root, new_key)
+        for root in holders:
+            if root in placement:
+                await self.stores[root].rename(key, new_key)
+            else:
+                await self.stores[root].delete(key)
+
+    async def exists(self, key: str) -> bool:
+        return bool(await asyncio.to_thread(self._locate, key))
+
+    def local_path(self, key: str) -> Optional[str]:
+        roots = self._locate(key)
+        return self.stores[roots[0]].path(key) if roots else None
+
+    def keys(self):
+        seen = set()
+        for store in self.stores.values():
+            if not os.path.isdir(store.root):
+                continue
+            for shard in os.scandir(store.root):
+                if not shard.is_dir():
+                    continue
+                for entry in os.scandir(shard.path):
+                    key = entry.name
+                    # недописанные и временные блобы не трогаем
+                    if key.endswith(".part") or key.startswith("tmp-") or key in seen:
+                        continue
+                    seen.add(key)
+                    yield key
+
+    async def _copy(self, key: str, source: str, target: str, new_key: Optional[str] = None) -> None:
+        await self.stores[target].write(new_key or key, self.stores[source].read(key))
+
+    async def rebalance(self, dry_run: bool = False) -> RebalanceStats:
+        """
+        Moves every blob to the roots its key is placed on now: copies missing
+        replicas (after adding a disk or losing one), then removes copies that
+        are no longer placed there. A blob is never left with fewer copies.
+        The caller holds the GC lock (content_store.GC_LOCK_ID), so no blob is
+        collected while it is being moved.
+        """
+        stats = RebalanceStats()
+        for key in await asyncio.to_thread(list, self.keys()):
+            holders = await asyncio.to_thread(self._holders, key)
+            if not holders:
+                continue  # блоб удалили, пока шёл обход
+            placement = self.placement(key)
+            for target in placement:
+                if target not in holders:
+                    if not dry_run:
+                        await self._copy(key, holders[0], target)
+                    stats.copied += 1
+            for root in holders:
+                if root not in placement:
+                    if not dry_run:
+                        await self.stores[root].delete(key)
+                    stats.removed += 1
+            if len(holders) < self.replicas:
+                stats.under_replicated += 1
+        return stats
+
+
+class MemoryBlobStore(BlobStore):
+    def __init__(self, chunk_size: int = CHUNK_SIZE):
+        self.blobs: dict[str, bytes] = {}
+        self.chunk_size = chunk_size
+
+    async def write(self, key: str, chunks: AsyncIterator[bytes]) -> int:
+        data = bytearray()
+        async for chunk in chunks:
+            data += chunk
+        self.blobs[key] = bytes(data)
+        return len(data)
+
+    async def read(self, key: str, offset: int = 0, length: Optional[int] = None) -> AsyncIterator[bytes]:
+        data = self.blobs[key]
+        end = len(data) if length is None else min(len(data), offset + length)
+        for start in range(offset, end, self.chunk_size):
+            yield data[start:min(start + self.chunk_size, end)]
+
+    async def delete(self, key: str) -> None:
+        self.blobs.pop(key, None)
+
+    async def rename(self, key: str, new_key: str) -> None:
+        self.blobs[new_key] = self.blobs.pop(key)
+
+    async def exists(self, key: str) -> bool:
+        return key in self.blobs
+
+
+class S3BlobStore(BlobStore):
+    """
+    S3-compatible backend. Large writes become multipart uploads whose parts go
+    out in parallel; reads fetch consecutive ranges in parallel and yield them in
+    order. At most `concurrency` parts per call are held in memory.
+    """
+
+    def __init__(self, client: Optional[S3Client] = None, part_size: int = S3_PART_SIZE,
+                 concurrency: int = S3_CONCURRENCY, chunk_size: int = CHUNK_SIZE,
+                 copy_part_size: int = S3_COPY_PART_SIZE):
+        self.client = client or S3Client()
+        self.part_size = part_size
+        self.concurrency = concurrency
+        self.chunk_size = chunk_size
+        self.copy_part_size = copy_part_size
+
+    async def write(self, key: str, chunks: AsyncIterator[bytes]) -> int:
+        buffer = bytearray()
+        size = 0
+        upload_id = None
+        in_flight = set()
+        etags = {}
+        number = 0
+
+        async def send_part(part_number: int, data: bytes):
+            etags[part_number] = await self.client.upload_part(key, upload_id, part_number, data)
+
+        async def submit(data: bytes):
+            nonlocal number, in_flight
+            number += 1
+            in_flight.add(asyncio.create_task(send_part(number, data)))
+            if len(in_flight) >= self.concurrency:
+                done, in_flight = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    task.result()
+
+        try:
+            async for chunk in chunks:
+                buffer += chunk
+                size += len(chunk)
+                while len(buffer) >= self.part_size:
+                    if upload_id is None:
+                        upload_id = await self.client.create_multipart_upload(key)
+                    await submit(bytes(buffer[:self.part_size]))
+                    del buffer[:self.part_size]
+            if upload_id is None:
+                await self.client.put_object(key, bytes(buffer))
+                return size
+            if buffer:
+                await submit(bytes(buffer))
+            for task in asyncio.as_completed(in_flight):
+                await task
+            in_flight = set()
+            await self.client.complete_multipart_upload(key, upload_id, etags)
+        except BaseException:
+            for task in in_flight:
+                task.cancel()
+            if upload_id is not None:
+                await asyncio.shield(self.client.abort_multipart_upload(key, upload_id))
+            raise
+        return size
+
+    def _slices(self, data: bytes):
+        for start in range(0, len(data), self.chunk_size):
+            yield data[start:start + self.chunk_size]
+
+    async def _fetch(self, key: str, start: int, end: int) -> bytes:
+        result = await self.client.get_range(key, start, end - 1)
+        return result[0] if result else b""
+
+    async def read(self, key: str, offset: int = 0, length: Optional[int] = None) -> AsyncIterator[bytes]:
+        if length == 0:
+            return
+        first_end = offset + (self.part_size if length is None else min(length, self.part_size))
+        result = await self.client.get_range(key, offset, first_end - 1)
+        if result is None:
+            return
+        data, total = result
+        end = total if length is None else min(total, offset + length)
+        for chunk in self._slices(data):
+            yield chunk
+
+        # остальные диапазоны читаем параллельно, но отдаём строго по порядку
+        ranges = iter([(start, min(start + self.part_size, end))
+                       for start in range(offset + len(data), end, self.part_size)])
+        pending = deque()
+        try:
+            for start, stop in itertools.islice(ranges, self.concurrency):
+                pending.append(asyncio.create_task(self._fetch(key, start, stop)))
+            while pending:
+                data = await pending.popleft()
+                for start, stop in itertools.islice(ranges, 1):
+                    pending.append(asyncio.create_task(self._fetch(key, start, stop)))
+                for chunk in self._slices(data):
+                    yield chunk
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def delete(self, key: str) -> None:
+        await self.client.delete_object(key)
+
+    async def rename(self, key: str, new_key: str) -> None:
+        # в S3 нет переименования: копия на стороне сервера и удаление исходного объекта
+        size = await self.client.head_object(key)
+        if size <= S3_COPY_MAX:
+            await self.client.copy_object(key, new_key)
+        else:
+            await self._copy_multipart(key, new_key, size)
+        await self.client.delete_object(key)
+
+    async def _copy_multipart(self, key: str, new_key: str, size: int) -> None:
+        upload_id = await self.client.create_multipart_upload(new_key)
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def copy_part(number: int, start: int):
+            async with semaphore:
+                end = min(start + self.copy_part_size, size) - 1
+                return number, await self.client.upload_part_copy(new_key, upload_id, number, key, start, end)
+
+        try:
+            parts = await asyncio.gather(*[
+                copy_part(number, start)
+                for number, start in enumerate(range(0, size, self.copy_part_size), start=1)
+            ])
+            await self.client.complete_multipart_upload(new_key, upload_id, dict(parts))
+        except BaseException:
+            await asyncio.shield(self.client.abort_multipart_upload(new_key, upload_id))
+            raise
+
+    async def exists(self, key: str) -> bool:
+        try:
+            await self.client.head_object(key)
+        except FileNotFoundError:
+            return False
+        return True
+
+
+class CachedBlobStore(BlobStore):
+    """
+    Serves hot blobs from an in-process BlobCache in front of another backend.
+    Blob keys are content hashes, so an entry only goes stale when the blob is
+    deleted. Uncompressed local blobs still go out via sendfile.
+    """
+
+    def __init__(self, backend: BlobStore, cache: Optional[BlobCache] = None, chunk_size: int = CHUNK_SIZE):
+        self.backend = backend
+        self.cache = cache or BlobCache()
+        self.chunk_size = chunk_size
+
+    async def write(self, key: str, chunks: AsyncIterator[bytes]) -> int:
+        self.cache.invalidate(key)
+        return await self.backend.write(key, chunks)
+
+    def _serve(self, data: bytes, start: int, end: int):
+        CACHE_HIT_BYTES.inc(max(0, end - start))
+        for position in range(start, end, self.chunk_size):
+            yield data[position:min(position + self.chunk_size, end)]
+
+    async def read(self, key: str, offset: int = 0, length: Optional[int] = None) -> AsyncIterator[bytes]:
+        end = None if length is None else offset + length
+        entry = self.cache.get(key)
+        if entry is not None:
+            cached = len(entry.data)
+            if entry.complete or (end is not None and end <= cached):
+                CACHE_REQUESTS.labels("hit").inc()
+                for chunk in self._serve(entry.data, offset, cached if end is None else min(cached, end)):
+                    yield chunk
+                return
+            if offset < cached:
+                # начало из кэша, остаток — из хранилища
+                CACHE_REQUESTS.labels("partial").inc()
+                for chunk in self._serve(entry.data, offset, cached):
+                    yield chunk
+                async for chunk in self.backend.read(key, cached, None if end is None else end - cached):
+                    yield chunk
+                return
+        CACHE_REQUESTS.labels("miss").inc()
+        if offset or not self.cache.admit(key):
+            async for chunk in self.backend.read(key, offset, length):
+                yield chunk
+            return
+
+        prefix_size = self.cache.prefix_size
+        buffer = bytearray()
+        received = 0
+        finished = False
+        try:
+            async for chunk in self.backend.read(key, 0, length):
+                if len(buffer) < prefix_size:
+                    buffer += chunk[:prefix_size - len(buffer)]
+                received += len(chunk)
+                yield chunk
+            finished = True
+        finally:
+            # конец блоба достигнут, только если чтение не было ограничено length или вернуло меньше
+            complete = finished and received <= prefix_size and (length is None or received < length)
+            if complete or len(buffer) >= prefix_size:
+                self.cache.put(key, bytes(buffer), complete)
+
+    async def delete(self, key: str) -> None:
+        self.cache.invalidate(key)
+        await self.backend.delete(key)
+
+    async def rename(self, key: str, new_key: str) -> None:
+        self.cache.invalidate(key)
+        self.cache.invalidate(new_key)
+        await self.backend.rename(key, new_key)
+
+    async def exists(self, key: str) -> bool:
+        return await self.backend.exists(key)
+
+    def local_path(self, key: str) -> Optional[str]:
+        return self.backend.local_path(key)
+
+
+def _remove_silently(path: str) -> None:
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+_blob_store: Optional[BlobStore] = None
+
+
+def create_blob_store(backend: str = BLOB_STORE_BACKEND) -> BlobStore:
+    if backend == "local":
+        return LocalBlobStore()
+    if backend == "striped":
+        return StripedBlobStore()
+    if backend == "s3":
+        return S3BlobStore()
+    if backend == "memory":
+        return MemoryBlobStore()
+    raise ValueError(f"Неизвестный тип хранилища блобов: {backend}")
+
+
+def get_blob_store() -> BlobStore:
+    global _blob_store
+    if _blob_store is None:
+        _blob_store = create_blob_store()
+        if BLOB_CACHE_BYTES > 0:
+            _blob_store = CachedBlobStore(_blob_store)
+    return _blob_store
@@ -0,0 +1,192 @@
+# app/services/cleanup_service.py
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+
+from prometheus_client import Counter, Gauge, Histogram
+from sqlalchemy import select, update, delete, func
+
+from app.file.config_client import get_config_client
+from app.file.db import SessionLocal, engine
+from app.file.file_db import FileDB
+from app.file.profile_db import ProfileDB
+from app.file.trash_service import TrashService, in_purge_window
+from app.file.upload_session_db import UploadSessionDB, UploadPartDB
+from app.file.version_db import FileVersionDB
+
+CLEANUP_INTERVAL = int(os.getenv("STORAGE_CLEANUP_INTERVAL", 600))
+CLEANUP_BATCH_SIZE = int(os.getenv("STORAGE_CLEANUP_BATCH_SIZE", 500))
+CLEANUP_PAUSE = float(os.getenv("STORAGE_CLEANUP_PAUSE", 1.0))
+# срок хранения, если storage_cleanup_days в конфигурации не задан: корзина должна чиститься всегда
+DEFAULT_CLEANUP_DAYS = 30
+# ключ advisory-блокировки: очисткой в каждый момент занимается только одна реплика
+CLEANUP_LOCK_ID = int(os.getenv("STORAGE_CLEANUP_LOCK_ID", 7_201_001))
+# profiles.storage_used — INTEGER, больше в него не поместится
+MAX_STORAGE_USED = 2 ** 31 - 1
+
+CLEANUP_RUNS = Counter(
+    "storage_cleanup_runs_total", "Storage cleanup runs by outcome", ["outcome"]
+)
+CLEANUP_DELETED = Counter(
+    "storage_cleanup_deleted_total", "Rows removed by the storage cleanup", ["kind"]
+)
+CLEANUP_FREED_BYTES = Counter(
+    "storage_cleanup_freed_bytes_total", "Logical bytes of files removed by the storage cleanup"
+)
+CLEANUP_BATCH_SECONDS = Histogram(
+    "storage_cleanup_batch_duration_seconds", "Duration of one storage cleanup batch", ["kind"]
+)
+CLEANUP_RUNNING = Gauge("storage_cleanup_running", "1 while this replica runs the storage cleanup")
+CLEANUP_LAST_SUCCESS = Gauge(
+    "storage_cleanup_last_success_timestamp_seconds", "Unix time of the last completed storage cleanup"
+)
+
+logger = logging.getLogger(__name__)
+
+
+class CleanupService:
+    """
+    Removes files that have been in the trash and upload sessions that were never
+    completed for config.storage_cleanup_days (DEFAULT_CLEANUP_DAYS when unset),
+    then recounts storage_used of every user.
+    """
+
+    def __init__(self, blob_store=None, config_client=None):
+        self.trash_service = TrashService(blob_store)
+        self.content_store = self.trash_service.content_store
+        self.config_client = config_client or get_config_client()
+
+    async def purge_trash_batch(self, cutoff: datetime, batch_size: int = CLEANUP_BATCH_SIZE) -> int:
+        purged = await self.trash_service.purge_batch(cutoff, batch_size)
+        if purged:
+            await self.update_storage_used({row.user_id for row in purged})
+            CLEANUP_FREED_BYTES.inc(sum(row.size or 0 for row in purged))
+        return len(purged)
+
+    async def purge_upload_sessions_batch(self, cutoff: datetime, batch_size: int = CLEANUP_BATCH_SIZE) -> int:
+        async with SessionLocal() as session:
+            result = await session.execute(
+                select(UploadSessionDB.id)
+                .where(UploadSessionDB.created_at < cutoff)
+                .limit(batch_size)
+                .with_for_update(skip_locked=True)
+            )
+            session_ids = result.scalars().all()
+            if not session_ids:
+                return 0
+            result = await session.execute(
+                delete(UploadPartDB).where(UploadPartDB.session_id.in_(session_ids)).returning(UploadPartDB.storage_key)
+            )
+            await self.content_store.release(session, result.scalars().all())
+            await session.execute(delete(UploadSessionDB).where(UploadSessionDB.id.in_(session_ids)))
+            await session.commit()
+        return len(session_ids)
+
+    async def update_storage_used(self, user_ids) -> None:
+        """
+        Recomputes storage_used of the given users from their files and versions,
+        so the counter heals itself instead of drifting.
+        """
+        files = (
+            select(func.coalesce(func.sum(FileDB.size), 0))
+            .where(FileDB.user_id == ProfileDB.user_id)
+            .scalar_subquery()
+        )
+        versions = (
+            select(func.coalesce(func.sum(FileVersionDB.size), 0))
+            .join(FileDB, FileDB.id == FileVersionDB.file_id)
+            .where(FileDB.user_id == ProfileDB.user_id)
+            .scalar_subquery()
+        )
+        async with SessionLocal() as session:
+            await session.execute(
+                update(ProfileDB)
+                .where(ProfileDB.user_id.in_(user_ids))
+                .values(storage_used=func.least(files + versions, MAX_STORAGE_USED))
+                .execution_options(synchronize_session=False)
+            )
+            await session.commit()
+
+    async def recount_storage_batch(self, after, batch_size: int = CLEANUP_BATCH_SIZE):
+        """
+        Recounts storage_used of the next batch of users after the given id and
+        returns the last id of the batch, or None when all users are done.
+        """
+        stmt = select(ProfileDB.user_id).order_by(ProfileDB.user_id).limit(batch_size)
+        if after is not None:
+            stmt = stmt.where(ProfileDB.user_id > after)
+        async with SessionLocal() as session:
+            result = await session.execute(stmt)
+            user_ids = result.scalars().all()
+        if not user_ids:
+            return None
+        await self.update_storage_used(user_ids)
+        return user_ids[-1]
+
+    async def recount_storage(self) -> None:
+        # загрузки и новые версии не трогают storage_used, поэтому счётчик пересчитывается
+        # каждым проходом, а не только после удаления файлов из корзины
+        after = None
+        while True:
+            after = await self.recount_storage_batch(after)
+            if after is None:
+                return
+            await asyncio.sleep(CLEANUP_PAUSE)
+
+    async def _drain(self, kind: str, purge_batch, cutoff: datetime) -> int:
+        total = 0
+        while True:
+            started = time.perf_counter()
+            count = await purge_batch(cutoff)
+            CLEANUP_BATCH_SECONDS.labels(kind).observe(time.perf_counter() - started)
+            CLEANUP_DELETED.labels(kind).inc(count)
+            total += count
+            if count == 0:
+                return total
+            # пауза между пачками, чтобы не мешать основной нагрузке на БД
+            await asyncio.sleep(CLEANUP_PAUSE)
+
+    async def run_once(self) -> bool:
+        """
+        Runs a full cleanup pass unless another replica holds the lock. Returns
+        whether this replica did the work.
+        """
+        now = datetime.utcnow()
+        # сессионная блокировка живёт на отдельном соединении до конца прохода
+        async with engine.connect() as conn:
+            result = await conn.execute(select(func.pg_try_advisory_lock(CLEANUP_LOCK_ID)))
+            if not result.scalar():
+                CLEANUP_RUNS.labels("locked").inc()
+                return False
+            CLEANUP_RUNNING.set(1)
+            try:
+                config = await self.config_client.get_config()
+                days = int(config.get("storage_cleanup_days") or 0)
+                if days <= 0:
+                    days = DEFAULT_CLEANUP_DAYS
+                cutoff = now - timedelta(days=days)
+                trashed = await self._drain("trashed_files", self.purge_trash_batch, cutoff)
+                sessions = await self._drain("upload_sessions", self.purge_upload_sessions_batch, cutoff)
+                await self.recount_storage()
+            finally:
+                CLEANUP_RUNNING.set(0)
+                await conn.execute(select(func.pg_advisory_unlock(CLEANUP_LOCK_ID)))
+                await conn.commit()
+        CLEANUP_RUNS.labels("completed").inc()
+        CLEANUP_LAST_SUCCESS.set_to_current_time()
+        if trashed or sessions:
+            logger.info("Storage cleanup removed %s trashed files and %s upload sessions", trashed, sessions)
+        return True
+
+
+async def run_cleanup_loop(cleanup_service: CleanupService, interval: int = CLEANUP_INTERVAL):
+    while True:
+        try:
+            if in_purge_window(datetime.utcnow()):
+                await cleanup_service.run_once()
+        except Exception:
+            CLEANUP_RUNS.labels("failed").inc()
+            logger.exception("Storage cleanup failed")
+        await asyncio.sleep(interval)
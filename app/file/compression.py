@@ -0,0 +1,161 @@
+# app/file/compression.py
+import asyncio
+import os
+import struct
+from typing import AsyncIterator, Optional
+
+import zstandard
+
+CODEC_ZSTD = "zstd"
+COMPRESSION_LEVEL = int(os.getenv("COMPRESSION_LEVEL", 3))
+# блоб сжимается, только если пробный кусок ужимается хотя бы во столько раз
+COMPRESSION_MIN_RATIO = float(os.getenv("COMPRESSION_MIN_RATIO", 1.2))
+SAMPLE_SIZE = 64 * 1024
+MIN_COMPRESSIBLE_SIZE = 512
+# блоб сжимается независимыми кадрами такого логического размера: чтение с любого смещения
+# декодирует не больше одного лишнего кадра, а не весь блоб с начала
+FRAME_SIZE = int(os.getenv("COMPRESSION_FRAME_SIZE", 1024 * 1024))
+
+# сигнатуры форматов, которые уже сжаты: архивы, изображения, видео, аудио
+COMPRESSED_SIGNATURES = (
+    b"\x1f\x8b",               # gzip
+    b"PK\x03\x04",             # zip, docx, xlsx, jar, apk
+    b"\x28\xb5\x2f\xfd",       # zstd
+    b"BZh",                    # bzip2
+    b"\xfd7zXZ\x00",           # xz
+    b"7z\xbc\xaf\x27\x1c",     # 7z
+    b"Rar!\x1a\x07",           # rar
+    b"\x89PNG\r\n\x1a\n",      # png
+    b"\xff\xd8\xff",           # jpeg
+    b"GIF87a",
+    b"GIF89a",
+    b"ID3",                    # mp3
+    b"OggS",
+    b"fLaC",
+    b"\x1aE\xdf\xa3",          # mkv, webm
+)
+
+
+def looks_compressed(head: bytes) -> bool:
+    if head.startswith(COMPRESSED_SIGNATURES):
+        return True
+    # mp4/mov/heic: "ftyp" на смещении 4, webp/avi: RIFF-контейнер
+    if head[4:8] == b"ftyp":
+        return True
+    if head.startswith(b"RIFF") and head[8:12] in (b"WEBP", b"AVI "):
+        return True
+    return False
+
+
+def choose_codec(sample: bytes) -> Optional[str]:
+    if len(sample) < MIN_COMPRESSIBLE_SIZE or looks_compressed(sample):
+        return None
+    sample = sample[:SAMPLE_SIZE]
+    compressed = zstandard.ZstdCompressor(level=COMPRESSION_LEVEL).compress(sample)
+    if len(sample) / len(compressed) < COMPRESSION_MIN_RATIO:
+        return None
+    return CODEC_ZSTD
+
+
+def pack_frames(ends: list, frame_size: int = FRAME_SIZE) -> bytes:
+    # индекс кадров в строке блоба: логический размер кадра и сжатый конец каждого кадра
+    return struct.pack(f">I{len(ends)}Q", frame_size, *ends)
+
+
+def unpack_frames(frames: bytes):
+    count = (len(frames) - 4) // 8
+    frame_size, *ends = struct.unpack(f">I{count}Q", frames)
+    return frame_size, ends
+
+
+async def compress_stream(chunks: AsyncIterator[bytes], ends: list,
+                          frame_size: int = FRAME_SIZE) -> AsyncIterator[bytes]:
+    """
+    Compresses the stream into independent zstd frames of frame_size logical
+    bytes, appending the compressed end offset of each frame to ends.
+    """
+    compressor = zstandard.ZstdCompressor(level=COMPRESSION_LEVEL)
+    buffer = bytearray()
+    position = 0
+    async for chunk in chunks:
+        buffer += chunk
+        while len(buffer) >= frame_size:
+            # zstd отпускает GIL, поэтому сжатие в потоке не тормозит event loop
+            frame = await asyncio.to_thread(compressor.compress, bytes(buffer[:frame_size]))
+            del buffer[:frame_size]
+            position += len(frame)
+            ends.append(position)
+            yield frame
+    if buffer or not ends:
+        frame = await asyncio.to_thread(compressor.compress, bytes(buffer))
+        ends.append(position + len(frame))
+        yield frame
+
+
+async def decompress_frames(blob_store, storage_key: str, offset: int, length: int,
+                            frames: bytes) -> AsyncIterator[bytes]:
+    """
+    Reads only the frames that cover the logical range and decodes them one by one.
+    """
+    frame_size, ends = unpack_frames(frames)
+    first, last = offset // frame_size, (offset + length - 1) // frame_size
+    start = ends[first - 1] if first else 0
+    decompressor = zstandard.ZstdDecompressor()
+    skip = offset - first * frame_size
+    remaining = length
+    frame = first
+    buffer = bytearray()
+    chunks = blob_store.read(storage_key, start, ends[last] - start)
+    try:
+        async for chunk in chunks:
+            buffer += chunk
+            while frame <= last and len(buffer) >= ends[frame] - start:
+                size = ends[frame] - start
+                data = await asyncio.to_thread(decompressor.decompress, bytes(buffer[:size]))
+                del buffer[:size]
+                start += size
+                frame += 1
+                data = data[skip:skip + remaining]
+                skip = 0
+                remaining -= len(data)
+                if data:
+                    yield data
+            if frame > last:
+                break
+    finally:
+        await chunks.aclose()
+
+
+async def decompress_range(chunks: AsyncIterator[bytes], offset: int = 0,
+                           length: Optional[int] = None) -> AsyncIterator[bytes]:
+    """
+    Decodes a blob compressed as a single stream (written before frames were
+    introduced) on the fly and yields only the requested logical range.
+    """
+    decompressor = zstandard.ZstdDecompressor().decompressobj()
+    remaining = length
+    try:
+        async for chunk in chunks:
+            data = await asyncio.to_thread(decompressor.decompress, chunk)
+            if offset:
+                skipped = min(offset, len(data))
+                data = data[skipped:]
+                offset -= skipped
+            if remaining is not None:
+                data = data[:remaining]
+                remaining -= len(data)
+            if data:
+                yield data
+            if remaining == 0:
+                break
+    finally:
+        await chunks.aclose()
+
+
+def read_segment(blob_store, storage_key: str, offset: int, length: int,
+                 codec: Optional[str] = None, frames: Optional[bytes] = None) -> AsyncIterator[bytes]:
+    if codec == CODEC_ZSTD and frames:
+        return decompress_frames(blob_store, storage_key, offset, length, frames)
+    if codec == CODEC_ZSTD:
+        return decompress_range(blob_store.read(storage_key), offset, length)
+    return blob_store.read(storage_key, offset, length)
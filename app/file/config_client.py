@@ -0,0 +1,57 @@
+# app/file/config_client.py
+import asyncio
+import logging
+import os
+import time
+from typing import Optional
+
+import httpx
+
+CONFIG_SERVICE_URL = os.getenv("CONFIG_SERVICE_URL", "http://config-service:8003")
+# сколько секунд доверяем локальной копии конфигурации
+CONFIG_CACHE_TTL = float(os.getenv("CONFIG_CACHE_TTL", 60))
+
+logger = logging.getLogger(__name__)
+
+
+class ConfigClient:
+    """
+    Reads the shared settings from the config service and keeps a local copy
+    for CONFIG_CACHE_TTL seconds. When the service is unreachable the last
+    known copy keeps being served.
+    """
+
+    def __init__(self, base_url: str = CONFIG_SERVICE_URL, ttl: float = CONFIG_CACHE_TTL, transport=None):
+        self.client = httpx.AsyncClient(base_url=base_url, timeout=5.0, transport=transport)
+        self.ttl = ttl
+        self._config: Optional[dict] = None
+        self._expires_at = 0.0
+        self._lock = asyncio.Lock()
+
+    async def get_config(self) -> dict:
+        if self._config is not None and time.monotonic() < self._expires_at:
+            return self._config
+        # одновременные запросы после истечения TTL ждут одного обращения к сервису
+        async with self._lock:
+            if self._config is not None and time.monotonic() < self._expires_at:
+                return self._config
+            try:
+                response = await self.client.get("/api/config/get")
+                response.raise_for_status()
+                self._config = response.json()
+            except httpx.HTTPError:
+                if self._config is None:
+                    raise
+                logger.warning("Config service is unavailable, using the cached config")
+            self._expires_at = time.monotonic() + self.ttl
+            return self._config
+
+
+_config_client: Optional[ConfigClient] = None
+
+
+def get_config_client() -> ConfigClient:
+    global _config_client
+    if _config_client is None:
+        _config_client = ConfigClient()
+    return _config_client
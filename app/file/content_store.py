@@ -0,0 +1,304 @@
+# app/file/content_store.py
+import asyncio
+import hashlib
+import logging
+import os
+import uuid
+from collections import Counter
+from dataclasses import dataclass
+from typing import Optional
+
+from sqlalchemy import select, delete, update, case, func
+from sqlalchemy.dialects.postgresql import insert
+
+from app.file.blob_db import BlobDB
+from app.file.blob_store import get_blob_store
+from app.file.compression import choose_codec, compress_stream, pack_frames
+from app.file.db import SessionLocal
+from app.file.preview_db import PreviewDB
+
+GC_BATCH_SIZE = int(os.getenv("BLOB_GC_BATCH_SIZE", 500))
+GC_INTERVAL = int(os.getenv("BLOB_GC_INTERVAL", 300))
+# ключ advisory-блокировки: сборщики берут её разделяемой, ребалансировка дисков — исключительной
+GC_LOCK_ID = int(os.getenv("BLOB_GC_LOCK_ID", 7_201_002))
+
+logger = logging.getLogger(__name__)
+
+
+class UploadStream:
+    """
+    Passes chunks through, counting the size and sha256 along the way.
+    """
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.size = 0
+        self.sha256 = hashlib.sha256()
+
+    async def __aiter__(self):
+        async for chunk in self.chunks:
+            self.size += len(chunk)
+            self.sha256.update(chunk)
+            yield chunk
+
+
+@dataclass
+class StoredBlob:
+    hash: str
+    size: int
+    created: bool  # блоб физически записан этим вызовом
+    stored_size: Optional[int] = None
+    codec: Optional[str] = None
+    frames: Optional[bytes] = None
+
+
+@dataclass
+class StagedBlob:
+    hash: str
+    size: int
+    stored_size: int
+    codec: Optional[str]
+    frames: Optional[bytes] = None
+    staging_key: Optional[str] = None  # крупное содержимое уже лежит во временном блобе
+    payload: Optional[bytes] = None  # мелкое — ждёт в памяти, пока не станет ясно, нужно ли его писать
+
+
+async def _iter_chunks(*chunks):
+    for chunk in chunks:
+        yield chunk
+
+
+async def _prepend(first, rest):
+    for chunk in first:
+        yield chunk
+    async for chunk in rest:
+        yield chunk
+
+
+def upsert_references(stmt, added):
+    """
+    ON CONFLICT clause of a blobs insert that adds references to existing rows.
+    A row at refcount 0 is revived: its file is written again by the caller, so
+    the row takes the codec, frame index and stored size of the new encoding.
+    """
+    revived = BlobDB.refcount == 0
+    return stmt.on_conflict_do_update(
+        index_elements=[BlobDB.hash],
+        set_={
+            "refcount": BlobDB.refcount + added,
+            "codec": case((revived, stmt.excluded.codec), else_=BlobDB.codec),
+            "frames": case((revived, stmt.excluded.frames), else_=BlobDB.frames),
+            "stored_size": case((revived, stmt.excluded.stored_size), else_=BlobDB.stored_size),
+        },
+    )
+
+
+class ContentStore:
+    """
+    Content-addressed layer over BlobStore: blobs are keyed by sha256, identical
+    content is stored once and the blobs table counts references to it.
+    """
+
+    def __init__(self, blob_store=None):
+        self.blob_store = blob_store or get_blob_store()
+
+    async def _acquire(self, session, staged: StagedBlob):
+        stmt = insert(BlobDB).values(
+            hash=staged.hash, size=staged.size, stored_size=staged.stored_size, codec=staged.codec,
+            frames=staged.frames, refcount=1,
+        )
+        stmt = upsert_references(stmt, 1).returning(BlobDB.refcount, BlobDB.stored_size, BlobDB.codec, BlobDB.frames)
+        result = await session.execute(stmt)
+        return result.one()
+
+    async def stage(self, chunks) -> StagedBlob:
+        """
+        Consumes the stream and prepares its blob without taking a reference.
+        Single-chunk content stays in memory, larger content goes to a staging key.
+        """
+        stream = UploadStream(chunks)
+        iterator = stream.__aiter__()
+        first = await anext(iterator, None)
+        second = await anext(iterator, None) if first is not None else None
+        codec = choose_codec(first or b"")
+
+        if second is None:
+            # содержимое уместилось в один чанк: хэш известен до записи,
+            # поэтому повторяющиеся мелкие файлы вообще не пишутся на диск
+            data = first or b""
+            payload = data
+            ends = []
+            if codec:
+                payload = b"".join([frame async for frame in compress_stream(_iter_chunks(data), ends)])
+            return StagedBlob(
+                stream.sha256.hexdigest(), len(data), len(payload), codec,
+                frames=pack_frames(ends) if codec else None, payload=payload,
+            )
+
+        staging_key = "tmp-" + str(uuid.uuid4())
+        content = _prepend([first, second], iterator)
+        ends = []
+        stored_size = await self.blob_store.write(staging_key, compress_stream(content, ends) if codec else content)
+        return StagedBlob(
+            stream.sha256.hexdigest(), stream.size, stored_size, codec,
+            frames=pack_frames(ends) if codec else None, staging_key=staging_key,
+        )
+
+    async def _settle(self, staged: StagedBlob, created: bool) -> None:
+        if staged.staging_key is None:
+            if created:
+                await self.blob_store.write(staged.hash, _iter_chunks(staged.payload))
+        elif created:
+            await self.blob_store.rename(staged.staging_key, staged.hash)
+        else:
+            await self.blob_store.delete(staged.staging_key)
+
+    async def drop(self, staged: StagedBlob) -> None:
+        if staged.staging_key is not None:
+            await self.blob_store.delete(staged.staging_key)
+
+    async def put(self, session, chunks) -> StoredBlob:
+        """
+        Stores the stream and takes one reference on its blob inside the caller's
+        transaction. The row lock on the blob is held until the caller commits.
+        Compressible content is stored zstd-encoded; the hash and size stay logical.
+        """
+        staged = await self.stage(chunks)
+        try:
+            row = await self._acquire(session, staged)
+        except BaseException:
+            await self.drop(staged)
+            raise
+        created = row.refcount == 1
+        await self._settle(staged, created)
+        return StoredBlob(staged.hash, staged.size, created, row.stored_size, row.codec, row.frames)
+
+    async def put_many(self, session, staged_blobs) -> list:
+        """
+        Takes references on a batch of staged blobs with one multi-row upsert.
+        Rows are locked in hash order, so concurrent batches cannot deadlock.
+        """
+        counts = Counter(staged.hash for staged in staged_blobs)
+        unique = {staged.hash: staged for staged in staged_blobs}
+        try:
+            stmt = insert(BlobDB).values([
+                dict(hash=digest, size=unique[digest].size, stored_size=unique[digest].stored_size,
+                     codec=unique[digest].codec, frames=unique[digest].frames, refcount=counts[digest])
+                for digest in sorted(unique)
+            ])
+            stmt = upsert_references(stmt, stmt.excluded.refcount).returning(
+                BlobDB.hash, BlobDB.refcount, BlobDB.stored_size, BlobDB.codec, BlobDB.frames
+            )
+            result = await session.execute(stmt)
+            rows = {row.hash: row for row in result.all()}
+        except BaseException:
+            for staged in staged_blobs:
+                await self.drop(staged)
+            raise
+
+        settled = set()
+        stored = []
+        try:
+            for staged in staged_blobs:
+                row = rows[staged.hash]
+                if staged.hash in settled:
+                    # дубликат внутри пакета: блоб уже записан или отброшен первым вхождением
+                    await self.drop(staged)
+                    created = False
+                else:
+                    settled.add(staged.hash)
+                    created = row.refcount == counts[staged.hash]
+                    await self._settle(staged, created)
+                stored.append(StoredBlob(staged.hash, staged.size, created, row.stored_size, row.codec, row.frames))
+        except BaseException:
+            for blob in stored:
+                await self.discard(blob)
+            for staged in staged_blobs[len(stored):]:
+                await self.drop(staged)
+            raise
+        return stored
+
+    async def describe(self, session, hashes):
+        """
+        Physical size and codec of content made of the given blobs ("mixed" when codecs differ).
+        """
+        result = await session.execute(
+            select(BlobDB.hash, BlobDB.stored_size, BlobDB.codec).where(BlobDB.hash.in_(set(hashes)))
+        )
+        blobs = {row.hash: row for row in result.all()}
+        stored_size = sum(blobs[digest].stored_size or 0 for digest in hashes if digest in blobs)
+        codecs = {blobs[digest].codec for digest in hashes if digest in blobs}
+        codec = codecs.pop() if len(codecs) == 1 else ("mixed" if codecs else None)
+        return stored_size, codec
+
+    async def discard(self, blob: StoredBlob) -> None:
+        # вызывается, если транзакция с put() не закоммитилась
+        if blob.created:
+            await self.blob_store.delete(blob.hash)
+
+    async def _add_references(self, session, hashes, sign: int) -> None:
+        by_count = {}
+        for digest, count in Counter(hashes).items():
+            by_count.setdefault(count, []).append(digest)
+        for count, digests in by_count.items():
+            await session.execute(
+                update(BlobDB)
+                .where(BlobDB.hash.in_(digests))
+                .values(refcount=BlobDB.refcount + sign * count)
+            )
+
+    async def retain(self, session, hashes) -> None:
+        """
+        Takes one more reference per occurrence of a hash on blobs that are
+        already referenced (e.g. chunks shared with another file).
+        """
+        await self._add_references(session, hashes, 1)
+
+    async def release(self, session, hashes) -> None:
+        """
+        Drops one reference per occurrence of a hash. Blobs that reach zero are
+        left for collect_garbage().
+        """
+        await self._add_references(session, hashes, -1)
+
+    async def collect_garbage(self, batch_size: int = GC_BATCH_SIZE) -> int:
+        """
+        Removes one batch of unreferenced blobs. Rows stay locked until the files
+        are gone, so a concurrent upload of the same content waits and re-creates it.
+        Does nothing while a rebalance holds GC_LOCK_ID.
+        """
+        async with SessionLocal() as session:
+            result = await session.execute(select(func.pg_try_advisory_xact_lock_shared(GC_LOCK_ID)))
+            if not result.scalar():
+                return 0
+            result = await session.execute(
+                select(BlobDB.hash)
+                .where(BlobDB.refcount == 0)
+                .limit(batch_size)
+                .with_for_update(skip_locked=True)
+            )
+            digests = result.scalars().all()
+            if not digests:
+                return 0
+            for digest in digests:
+                await self.blob_store.delete(digest)
+            await session.execute(delete(BlobDB).where(BlobDB.hash.in_(digests)))
+            # превью файлов из одного блоба ключуются тем же хэшем и уходят вместе с ним
+            result = await session.execute(
+                delete(PreviewDB).where(PreviewDB.content_hash.in_(digests)).returning(PreviewDB.storage_key)
+            )
+            for storage_key in result.scalars().all():
+                if storage_key is not None:
+                    await self.blob_store.delete(storage_key)
+            await session.commit()
+        return len(digests)
+
+
+async def run_gc_loop(content_store: ContentStore, interval: int = GC_INTERVAL):
+    while True:
+        try:
+            while await content_store.collect_garbage() > 0:
+                pass
+        except Exception:
+            logger.exception("Blob garbage collection failed")
+        await asyncio.sleep(interval)
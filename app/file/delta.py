@@ -0,0 +1,98 @@
+# app/file/delta.py
+import hashlib
+import json
+import os
+import zlib
+
+# размер блока по умолчанию: на 2 ГБ файла — 32768 подписей
+DELTA_BLOCK_SIZE = int(os.getenv("DELTA_BLOCK_SIZE", 64 * 1024))
+MIN_BLOCK_SIZE = 4 * 1024
+MAX_BLOCK_SIZE = 16 * 1024 * 1024
+
+
+class DeltaConflict(ValueError):
+    def __init__(self):
+        super().__init__("Файл изменился, запросите подписи блоков заново")
+
+
+def block_count(size: int, block_size: int) -> int:
+    return -(-size // block_size)
+
+
+def sign_blocks(data: bytes, block_size: int) -> list:
+    """
+    Signs whole blocks of data: the weak checksum is Adler-32, which the client
+    can roll byte by byte; the strong one is sha256.
+    """
+    return [
+        (zlib.adler32(data[start:start + block_size]), hashlib.sha256(data[start:start + block_size]).hexdigest())
+        for start in range(0, len(data), block_size)
+    ]
+
+
+def parse_block_map(raw: str, blocks: int) -> list:
+    """
+    Parses the client's block map: a JSON list of {"block": i, "count": n} (copy n
+    base blocks starting at i) and {"data": n} (take the next n bytes of the
+    uploaded data). Returns ("block", first, count) / ("data", length) tuples.
+    """
+    try:
+        items = json.loads(raw)
+    except ValueError:
+        raise ValueError("Некорректная карта блоков")
+    if not isinstance(items, list):
+        raise ValueError("Некорректная карта блоков")
+    ops = []
+    for item in items:
+        if not isinstance(item, dict):
+            raise ValueError("Некорректная карта блоков")
+        if "block" in item:
+            first, count = item["block"], item.get("count", 1)
+            if not isinstance(first, int) or not isinstance(count, int) or count < 1 \
+                    or first < 0 or first + count > blocks:
+                raise ValueError("Карта блоков ссылается на несуществующий блок")
+            ops.append(("block", first, count))
+        elif "data" in item:
+            length = item["data"]
+            if not isinstance(length, int) or length < 1:
+                raise ValueError("Некорректная карта блоков")
+            ops.append(("data", length))
+        else:
+            raise ValueError("Некорректная карта блоков")
+    return ops
+
+
+def literal_length(ops) -> int:
+    return sum(op[1] for op in ops if op[0] == "data")
+
+
+def block_range(first: int, count: int, base_size: int, block_size: int):
+    # включительный диапазон байт базового файла, который занимают блоки; последний может быть неполным
+    return first * block_size, min((first + count) * block_size, base_size) - 1
+
+
+def build_manifest(ops, base_segments, base_size: int, block_size: int, literal_key=None):
+    """
+    Turns a block map into (storage_key, blob_offset, length) chunks: copied blocks
+    point into the blobs of the base file, literal data into the freshly stored blob.
+    Adjacent ranges of the same blob are merged, so unchanged runs cost one row.
+    """
+    manifest = []
+
+    def append(storage_key, offset, length):
+        if manifest and manifest[-1][0] == storage_key and manifest[-1][1] + manifest[-1][2] == offset:
+            last = manifest[-1]
+            manifest[-1] = (storage_key, last[1], last[2] + length)
+        else:
+            manifest.append((storage_key, offset, length))
+
+    literal_offset = 0
+    for op in ops:
+        if op[0] == "data":
+            append(literal_key, literal_offset, op[1])
+            literal_offset += op[1]
+            continue
+        start, end = block_range(op[1], op[2], base_size, block_size)
+        for storage_key, offset, length, *_ in base_segments(start, end):
+            append(storage_key, offset, length)
+    return manifest
@@ -0,0 +1,180 @@
+# app/services/delta_service.py
+import asyncio
+import hashlib
+from datetime import datetime
+from functools import partial
+
+from sqlalchemy import select, update, insert
+
+from app.file.blob_db import BlobDB
+from app.file.blob_store import get_blob_store
+from app.file.compression import read_segment
+from app.file.content_store import ContentStore
+from app.file.db import SessionLocal
+from app.file.delta import DeltaConflict, block_count, sign_blocks, parse_block_map, literal_length
+from app.file.delta import block_range, build_manifest
+from app.file.download import select_segments
+from app.file.file import FileUploadResponse, FileSignatureResponse, BlockSignature
+from app.file.file_db import FileDB, FileChunkDB
+from app.file.file_service import FileService
+from app.file.versions import archive_current
+
+
+class DeltaService:
+    """
+    rsync-style sync: the client fetches block signatures of the stored file,
+    uploads only the blocks it could not match and a block map; the new content
+    is assembled from ranges of the blobs that are already stored.
+    """
+
+    def __init__(self, blob_store=None):
+        self.blob_store = blob_store or get_blob_store()
+        self.content_store = ContentStore(self.blob_store)
+        self.file_service = FileService(self.blob_store)
+
+    async def get_signature(self, file_id: str, user_id: str, block_size: int) -> FileSignatureResponse:
+        file, chunks = await self.file_service.get_file_chunks(file_id, user_id)
+        blocks = []
+        buffer = bytearray()
+        for segment in select_segments(chunks, 0, file.size - 1):
+            async for chunk in read_segment(self.blob_store, *segment):
+                buffer += chunk
+                whole = len(buffer) - len(buffer) % block_size
+                if whole:
+                    blocks += await asyncio.to_thread(sign_blocks, bytes(buffer[:whole]), block_size)
+                    del buffer[:whole]
+        if buffer:
+            blocks += sign_blocks(bytes(buffer), block_size)
+        return FileSignatureResponse(
+            id=file.id,
+            size=file.size,
+            block_size=block_size,
+            content_hash=file.content_hash,
+            blocks=[BlockSignature(weak=weak, strong=strong) for weak, strong in blocks],
+        )
+
+    async def _hash_content(self, digest, ops, base_chunks, base_size: int, block_size: int, data_chunks):
+        """
+        Feeds the new content to the digest in block-map order while the literal
+        data streams through: copied blocks are read from the base blobs, literal
+        bytes are hashed on their way to the blob store. Yields the literal data.
+        """
+        data = data_chunks.__aiter__() if data_chunks is not None else None
+        buffer = b""
+        for op in ops:
+            if op[0] == "block":
+                start, end = block_range(op[1], op[2], base_size, block_size)
+                for segment in select_segments(base_chunks, start, end):
+                    async for chunk in read_segment(self.blob_store, *segment):
+                        digest.update(chunk)
+                continue
+            remaining = op[1]
+            while remaining:
+                if not buffer:
+                    buffer = await anext(data, None) if data is not None else None
+                    if buffer is None:
+                        # данных меньше, чем в карте блоков — несовпадение размера поймает вызывающий
+                        return
+                piece, buffer = buffer[:remaining], buffer[remaining:]
+                digest.update(piece)
+                remaining -= len(piece)
+                yield piece
+        if data is not None:
+            async for chunk in data:
+                yield chunk
+
+    async def _get_chunks(self, session, file_id: str) -> list:
+        result = await session.execute(
+            select(
+                FileChunkDB.storage_key, FileChunkDB.blob_offset, FileChunkDB.length, BlobDB.codec, BlobDB.frames
+            )
+            .join(BlobDB, BlobDB.hash == FileChunkDB.storage_key, isouter=True)
+            .where(FileChunkDB.file_id == file_id)
+            .order_by(FileChunkDB.seq)
+        )
+        return result.all()
+
+    async def apply_delta(self, file_id: str, user_id: str, block_size: int, base_hash, block_map: str,
+                          data_chunks, policy=None) -> FileUploadResponse:
+        async with SessionLocal() as session:
+            file = await self._get_file(session, file_id, user_id)
+            ops = parse_block_map(block_map, block_count(file.size, block_size))
+            expected = literal_length(ops)
+            if expected and data_chunks is None:
+                raise ValueError("Размер данных не совпадает с картой блоков")
+            base_chunks = await self._get_chunks(session, file_id)
+            # не держим соединение с БД, пока принимаем изменённые блоки
+            await session.commit()
+            if file.content_hash != base_hash:
+                raise DeltaConflict()
+            if policy is not None and data_chunks is not None:
+                data_chunks = policy.guard(data_chunks, check_type=False)
+
+            # sha256 нового содержимого считается, пока принимаются изменённые блоки, а не под
+            # блокировкой файла: скопированные блоки читаются из базовой версии по пути
+            digest = hashlib.sha256()
+            content = self._hash_content(digest, ops, base_chunks, file.size, block_size, data_chunks)
+            if expected:
+                blob = await self.content_store.put(session, content)
+            else:
+                blob = None
+                async for _ in content:
+                    pass
+            try:
+                if (blob.size if blob else 0) != expected:
+                    raise ValueError("Размер данных не совпадает с картой блоков")
+                file = await self._get_file(session, file_id, user_id, lock=True)
+                # хэш посчитан по прочитанной раньше раскладке — она должна остаться прежней
+                if file.content_hash != base_hash or await self._get_chunks(session, file_id) != base_chunks:
+                    raise DeltaConflict()
+                manifest = build_manifest(
+                    ops, partial(select_segments, base_chunks), file.size, block_size, blob.hash if blob else None
+                )
+                size = sum(length for _, _, length in manifest)
+                if policy is not None:
+                    policy.check_size(size)
+                content_hash = digest.hexdigest()
+                # старое содержимое уходит в версию вместе со ссылками на блобы,
+                # новая раскладка берёт свои ссылки на общие с ней блобы
+                await archive_current(session, [file_id])
+                keys = [storage_key for storage_key, _, _ in manifest]
+                await self.content_store.retain(session, keys)
+                if blob:
+                    await self.content_store.release(session, [blob.hash])
+                if manifest:
+                    await session.execute(insert(FileChunkDB).values([
+                        dict(file_id=file_id, seq=seq, storage_key=storage_key, blob_offset=offset, length=length)
+                        for seq, (storage_key, offset, length) in enumerate(manifest)
+                    ]))
+                stored_size, codec = await self.content_store.describe(session, set(keys))
+                uploaded_at = datetime.utcnow()
+                await session.execute(
+                    update(FileDB).where(FileDB.id == file_id).values(
+                        size=size,
+                        content_hash=content_hash,
+                        stored_size=stored_size,
+                        codec=codec,
+                        uploaded_at=uploaded_at,
+                    )
+                )
+                await session.commit()
+            except Exception:
+                if blob:
+                    await self.content_store.discard(blob)
+                raise
+        return FileUploadResponse(id=file_id, name=file.name, size=size, uploaded_at=uploaded_at)
+
+    async def _get_file(self, session, file_id: str, user_id: str, lock: bool = False):
+        stmt = select(FileDB.id, FileDB.name, FileDB.size, FileDB.content_hash).where(
+            FileDB.id == file_id,
+            FileDB.user_id == user_id,
+            FileDB.is_folder.is_(False),
+            FileDB.deleted_at.is_(None),
+        )
+        if lock:
+            stmt = stmt.with_for_update()
+        result = await session.execute(stmt)
+        file = result.one_or_none()
+        if file is None:
+            raise ValueError("Файл не найден")
+        return file
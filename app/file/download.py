@@ -0,0 +1,181 @@
+# app/file/download.py
+import asyncio
+import mimetypes
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Optional
+from urllib.parse import quote
+
+from starlette.responses import Response
+
+from app.file.blob_store import BlobStore
+from app.file.compression import read_segment
+
+ZEROCOPY_EXTENSION = "http.response.zerocopysend"
+# обычная ссылка на файл может начать отдавать новую версию — клиент перепроверяет её по ETag,
+# а ссылка с хэшем содержимого не меняется никогда; private — файлы отдаются только после
+# проверки токена, общим кэшам (CDN, прокси) их хранить нельзя
+REVALIDATE_CACHE = "no-cache"
+IMMUTABLE_CACHE = "private, max-age=31536000, immutable"
+
+
+class RangeNotSatisfiable(ValueError):
+    def __init__(self, size: int):
+        super().__init__("Диапазон не может быть удовлетворён")
+        self.size = size
+
+
+def parse_range(header: Optional[str], size: int):
+    """
+    Parses a single-range "bytes=" header into an inclusive (start, end) pair.
+    Returns None when the header should be ignored and raises RangeNotSatisfiable when
+    the range cannot be satisfied.
+    """
+    if not header or not header.startswith("bytes="):
+        return None
+    spec = header[len("bytes="):].strip()
+    if "," in spec:
+        # несколько диапазонов не поддерживаем — отдаём файл целиком
+        return None
+    start, sep, end = spec.partition("-")
+    if not sep:
+        return None
+    if size == 0:
+        # у пустого файла нет ни одного байта, которым диапазон мог бы начаться
+        raise RangeNotSatisfiable(size)
+    try:
+        if start == "":
+            suffix = int(end)
+            if suffix <= 0:
+                raise RangeNotSatisfiable(size)
+            return max(0, size - suffix), size - 1
+        first = int(start)
+        last = int(end) if end else size - 1
+    except ValueError:
+        raise RangeNotSatisfiable(size)
+    if first >= size or last < first:
+        raise RangeNotSatisfiable(size)
+    return first, min(last, size - 1)
+
+
+def select_segments(chunks, start: int, end: int):
+    """
+    Maps the inclusive byte range of a file onto (storage_key, offset, length, codec,
+    frames) segments of the blobs that make up its chunk manifest.
+    """
+    segments = []
+    position = 0
+    for chunk in chunks:
+        chunk_start, chunk_end = position, position + chunk.length
+        position = chunk_end
+        if chunk_end <= start or chunk_start > end:
+            continue
+        first = max(start, chunk_start)
+        last = min(end + 1, chunk_end)
+        segments.append((
+            chunk.storage_key, chunk.blob_offset + first - chunk_start, last - first, chunk.codec, chunk.frames
+        ))
+    return segments
+
+
+def content_disposition(filename: str) -> str:
+    return "attachment; filename*=utf-8''" + quote(filename)
+
+
+def etag_for(content_hash: Optional[str]) -> Optional[str]:
+    return '"' + content_hash + '"' if content_hash else None
+
+
+def http_date(value: Optional[datetime]) -> Optional[str]:
+    if value is None:
+        return None
+    return format_datetime(value.replace(tzinfo=timezone.utc), usegmt=True)
+
+
+def if_range_matches(if_range: Optional[str], etag: Optional[str], last_modified: Optional[str]) -> bool:
+    if not if_range:
+        return True
+    if if_range.startswith("W/"):
+        return False
+    if if_range.startswith('"'):
+        return etag is not None and if_range == etag
+    return last_modified is not None and if_range == last_modified
+
+
+def content_url(file_id: str, content_hash: Optional[str]) -> Optional[str]:
+    return f"/api/files/{file_id}/content/{content_hash}" if content_hash else None
+
+
+def etag_matches(if_none_match: str, etag: Optional[str]) -> bool:
+    if if_none_match.strip() == "*":
+        return etag is not None
+    # для If-None-Match сравнение слабое: W/ не учитывается
+    candidates = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return etag is not None and etag in candidates
+
+
+def is_not_modified(if_none_match: Optional[str], if_modified_since: Optional[str], etag: Optional[str],
+                    modified: Optional[datetime]) -> bool:
+    """
+    Evaluates If-None-Match, or If-Modified-Since when there is no If-None-Match
+    (RFC 9110, 13.2.2).
+    """
+    if if_none_match:
+        return etag_matches(if_none_match, etag)
+    if not if_modified_since or modified is None:
+        return False
+    try:
+        since = parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+    if since.tzinfo is None:
+        since = since.replace(tzinfo=timezone.utc)
+    # Last-Modified отдаётся с точностью до секунды
+    return modified.replace(tzinfo=timezone.utc, microsecond=0) <= since
+
+
+def not_modified_response(headers: dict) -> Response:
+    return Response(status_code=304, headers=headers)
+
+
+def open_local(blob_store: BlobStore, storage_key: str):
+    # поиск блоба по дискам и open ходят в файловую систему — вызывается в пуле потоков
+    path = blob_store.local_path(storage_key)
+    return open(path, "rb") if path is not None else None
+
+
+class BlobResponse(Response):
+    """
+    Streams a list of blob segments. Uncompressed local-disk segments go through
+    the ASGI zero-copy extension (sendfile) when the server offers it.
+    """
+
+    def __init__(self, blob_store: BlobStore, segments, status_code: int = 200, headers=None,
+                 filename: Optional[str] = None):
+        self.blob_store = blob_store
+        self.segments = segments
+        media_type = None
+        if filename:
+            media_type = mimetypes.guess_type(filename)[0]
+        super().__init__(status_code=status_code, headers=headers, media_type=media_type or "application/octet-stream")
+        self.headers["content-length"] = str(sum(segment[2] for segment in segments))
+
+    async def __call__(self, scope, receive, send) -> None:
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        zerocopy = ZEROCOPY_EXTENSION in scope.get("extensions", {})
+        for storage_key, offset, length, codec, frames in self.segments:
+            # сжатые блобы приходится декодировать, sendfile для них невозможен
+            f = await asyncio.to_thread(open_local, self.blob_store, storage_key) if zerocopy and not codec else None
+            if f is not None:
+                with f:
+                    await send({
+                        "type": ZEROCOPY_EXTENSION,
+                        "file": f.fileno(),
+                        "offset": offset,
+                        "count": length,
+                        "more_body": True,
+                    })
+                continue
+            async for chunk in read_segment(self.blob_store, storage_key, offset, length, codec, frames):
+                await send({"type": "http.response.body", "body": chunk, "more_body": True})
+        await send({"type": "http.response.body", "body": b"", "more_body": False})
@@ -1,6 +1,7 @@
 # app/models/file.py
 from pydantic import BaseModel
 from datetime import datetime
+from typing import Literal, Optional
 
 class FileUploadResponse(BaseModel):
     id: str
@@ -8,5 +9,95 @@ class FileUploadResponse(BaseModel):
     size: int
     uploaded_at: datetime
 
-class FileDownloadResponse(BaseModel):
+class UploadSessionCreateRequest(BaseModel):
     name: str
+    parent_id: Optional[str] = None
+
+class UploadPartItem(BaseModel):
+    part_number: int
+    size: int
+    sha256: str
+
+class UploadSessionResponse(BaseModel):
+    session_id: str
+    name: str
+    parent_id: Optional[str] = None
+    created_at: datetime
+    parts: list[UploadPartItem]
+
+class FileItem(BaseModel):
+    id: str
+    name: str
+    size: int
+    uploaded_at: datetime
+    is_folder: bool
+    parent_id: Optional[str] = None
+
+class FileListResponse(BaseModel):
+    items: list[FileItem]
+    next_cursor: Optional[str] = None
+
+class FileSearchItem(FileItem):
+    shared: bool
+    rank: float
+
+class FileSearchResponse(BaseModel):
+    items: list[FileSearchItem]
+    next_cursor: Optional[str] = None
+
+class TrashItem(FileItem):
+    deleted_at: datetime
+
+class TrashListResponse(BaseModel):
+    items: list[TrashItem]
+    next_cursor: Optional[str] = None
+
+class FolderCreateRequest(BaseModel):
+    name: str
+    parent_id: Optional[str] = None
+
+class FolderSizeResponse(BaseModel):
+    id: str
+    size: int
+    files: int
+    folders: int
+
+class FileMoveRequest(BaseModel):
+    parent_id: Optional[str] = None
+
+class ArchiveRequest(BaseModel):
+    file_ids: list[str] = []
+    folder_id: Optional[str] = None
+    format: Literal["zip", "tar"] = "zip"
+
+class BatchUploadItem(BaseModel):
+    name: str
+    id: Optional[str] = None
+    size: Optional[int] = None
+    uploaded_at: Optional[datetime] = None
+    error: Optional[str] = None
+
+class BatchUploadResponse(BaseModel):
+    items: list[BatchUploadItem]
+
+class BlockSignature(BaseModel):
+    weak: int
+    strong: str
+
+class FileSignatureResponse(BaseModel):
+    id: str
+    size: int
+    block_size: int
+    content_hash: Optional[str] = None
+    blocks: list[BlockSignature]
+
+class FileVersionItem(BaseModel):
+    number: int
+    size: int
+    content_hash: Optional[str] = None
+    created_at: datetime
+
+class FileVersionListResponse(BaseModel):
+    id: str
+    current_version: int
+    items: list[FileVersionItem]
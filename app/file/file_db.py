@@ -1,17 +1,82 @@
 # app/models/file_db.py
-from sqlalchemy import Column, String, Integer, DateTime, ForeignKey
+from sqlalchemy import Column, String, Integer, BigInteger, Boolean, DateTime, ForeignKey, Index, func, text
+from sqlalchemy import DDL, event
 from sqlalchemy.dialects.postgresql import UUID
 import uuid
 from datetime import datetime
 
-from app.file.db import Base
+from app.file.db import Base, EXTENSIONS
+
+
+def new_id(prefix: str) -> str:
+    return prefix + "-" + str(uuid.uuid4())
+
+
+def child_path(parent_path: str, node_id: str) -> str:
+    return parent_path + node_id + "/"
+
+
+ALIVE = text("deleted_at IS NULL")
 
 
 class FileDB(Base):
     __tablename__ = "files"
-    id = Column(String, primary_key=True, default=lambda: "file-" + str(uuid.uuid4()))
+    id = Column(String, primary_key=True, default=lambda: new_id("file"))
     name = Column(String, nullable=False)
-    size = Column(Integer, nullable=False)
+    size = Column(BigInteger, nullable=False)
     uploaded_at = Column(DateTime, default=datetime.utcnow)
     user_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=False)
     parent_id = Column(String, nullable=True)
+    # sha256 содержимого, считается при загрузке; у файлов из multipart-сессий — sha256 от хэшей частей
+    content_hash = Column(String(64), nullable=True)
+    # size — логический размер; физический размер и кодек блобов храним отдельно для планирования ёмкости
+    stored_size = Column(BigInteger, nullable=True)
+    codec = Column(String, nullable=True)
+    is_folder = Column(Boolean, nullable=False, default=False)
+    # материализованный путь: "/<id предка>/.../<id самого узла>/", поддерево — префиксный поиск;
+    # collation "C" позволяет индексу обслуживать и LIKE 'префикс%', и сортировку по пути
+    path = Column(String(collation="C"), nullable=False)
+    # корзина: deleted_at ставится всему поддереву, trash_id — id узла, удаление которого его туда отправило
+    deleted_at = Column(DateTime, nullable=True)
+    trash_id = Column(String, nullable=True)
+    # номер текущей версии содержимого; прошлые лежат в file_versions
+    version = Column(Integer, nullable=False, default=1)
+
+    __table_args__ = (
+        Index("ix_files_user_path", "user_id", "path"),
+        Index("ix_files_user_parent_name", "user_id", "parent_id", "name", "id", postgresql_where=ALIVE),
+        # ключи keyset-пагинации списка файлов: сортировка по дате, имени и размеру
+        Index("ix_files_user_uploaded", "user_id", "uploaded_at", "id", postgresql_where=ALIVE),
+        Index("ix_files_user_parent_uploaded", "user_id", "parent_id", "uploaded_at", "id", postgresql_where=ALIVE),
+        Index("ix_files_user_name", "user_id", "name", "id", postgresql_where=ALIVE),
+        Index("ix_files_user_size", "user_id", "size", "id", postgresql_where=ALIVE),
+        Index("ix_files_user_name_prefix", "user_id", "name", postgresql_ops={"name": "text_pattern_ops"},
+              postgresql_where=ALIVE),
+        # поиск по имени: нормализованное имя (lower) — триграммный GIN для подстрок
+        # (нужны расширения pg_trgm и btree_gin) и btree с text_pattern_ops для коротких префиксов
+        Index("ix_files_user_search_trgm", "user_id", func.lower(name).label("search_name"),
+              postgresql_using="gin", postgresql_ops={"search_name": "gin_trgm_ops"}, postgresql_where=ALIVE),
+        Index("ix_files_user_search_prefix", "user_id", func.lower(name).label("search_name"),
+              postgresql_ops={"search_name": "text_pattern_ops"}, postgresql_where=ALIVE),
+        Index("ix_files_trash_id", "trash_id", postgresql_where=text("trash_id IS NOT NULL")),
+        Index("ix_files_deleted_at", "deleted_at", postgresql_where=text("deleted_at IS NOT NULL")),
+        Index("ix_files_user_trash", "user_id", "deleted_at", "id", postgresql_where=text("trash_id = id")),
+    )
+
+
+# индексы поиска по имени требуют расширений — create_all ставит их до создания таблицы
+for _extension in EXTENSIONS:
+    event.listen(
+        FileDB.__table__, "before_create",
+        DDL(f"CREATE EXTENSION IF NOT EXISTS {_extension}").execute_if(dialect="postgresql"),
+    )
+
+
+# Содержимое файла — конкатенация диапазонов блобов в порядке seq
+class FileChunkDB(Base):
+    __tablename__ = "file_chunks"
+    file_id = Column(String, ForeignKey("files.id", ondelete="CASCADE"), primary_key=True)
+    seq = Column(Integer, primary_key=True)
+    storage_key = Column(String, nullable=False)
+    blob_offset = Column(BigInteger, nullable=False, default=0)
+    length = Column(BigInteger, nullable=False)
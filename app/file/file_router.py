@@ -1,29 +1,410 @@
 # app/endpoints/file_router.py
-from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Depends
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Depends, Path, Request, Header, Query
+from fastapi.responses import JSONResponse
 
 from app.file.dependencies import get_current_user
-from app.file.file_service import FileService
-from app.file.file import FileUploadResponse, FileDownloadResponse
+from app.file.delta import DeltaConflict, DELTA_BLOCK_SIZE, MIN_BLOCK_SIZE, MAX_BLOCK_SIZE
+from app.file.delta_service import DeltaService
+from app.file.download import RangeNotSatisfiable
+from app.file.file_service import FileService, read_upload_file
+from app.file.file import FileUploadResponse
+from app.file.file import UploadSessionCreateRequest, UploadSessionResponse, UploadPartItem
+from app.file.file import FileItem, FileListResponse, FolderCreateRequest, FolderSizeResponse, FileMoveRequest
+from app.file.archive_service import ArchiveService
+from app.file.batch_upload_service import BatchUploadService, MAX_BATCH_FILES, multipart_entries, tar_entries
+from app.file.file import TrashListResponse, ArchiveRequest, BatchUploadResponse, FileSignatureResponse
+from app.file.file import FileVersionListResponse, FileSearchResponse
+from app.file.folder_service import FolderService, FolderNotFound
+from app.file.preview_service import PreviewService, PreviewPending, PreviewFailed
+from app.file.search_service import SearchService
+from app.file.trash_service import TrashService
+from app.file.upload_session_service import UploadSessionService
+from app.file.upload_validation import UploadPolicy, FileTooLarge, FileTypeNotAllowed, get_upload_policy
+from app.file.version_service import VersionService
 
 file_router = APIRouter(prefix="/api/files", tags=["Files"])
 
+@file_router.get("", response_model=FileListResponse)
+async def list_files(
+    sort: str = Query("date", pattern="^(date|name|size)$"),
+    order: str = Query("desc", pattern="^(asc|desc)$"),
+    parent_id: str = Query(None),
+    name_prefix: str = Query(None),
+    cursor: str = Query(None),
+    limit: int = Query(50, ge=1, le=500),
+    user_id: str = Depends(get_current_user)
+):
+    service = FileService()
+    try:
+        return await service.list_files(user_id, sort, order, parent_id, name_prefix, cursor, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception:
+        raise HTTPException(status_code=500, detail="Internal Server Error")
+
+@file_router.get("/search", response_model=FileSearchResponse)
+async def search_files(
+    q: str = Query(..., min_length=1, max_length=255),
+    cursor: str = Query(None),
+    limit: int = Query(20, ge=1, le=100),
+    user_id: str = Depends(get_current_user)
+):
+    service = SearchService()
+    try:
+        return await service.search(user_id, q, cursor, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception:
+        raise HTTPException(status_code=500, detail="Internal Server Error")
+
+@file_router.post("/archive")
+async def download_archive(data: ArchiveRequest, user_id: str = Depends(get_current_user)):
+    service = ArchiveService()
+    try:
+        return await service.build_archive(user_id, data.file_ids, data.folder_id, data.format)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception:
+        raise HTTPException(status_code=500, detail="Internal Server Error")
+
+@file_router.get("/trash", response_model=TrashListResponse)
+async def list_trash(
+    cursor: str = Query(None),
+    limit: int = Query(50, ge=1, le=500),
+    user_id: str = Depends(get_current_user)
+):
+    service = TrashService()
+    try:
+        return await service.list_trash(user_id, cursor, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception:
+        raise HTTPException(status_code=500, detail="Internal Server Error")
+
+@file_router.post("/{id}/restore")
+async def restore_file(id: str, user_id: str = Depends(get_current_user)):
+    service = TrashService()
+    try:
+        await service.restore(id, user_id)
+        return {"message": "File restored successfully"}
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception:
+        raise HTTPException(status_code=500, detail="Internal Server Error")
+
 @file_router.post("/upload", response_model=FileUploadResponse)
 async def upload_file(
     file: UploadFile = File(...),
     user_id: str = Depends(get_current_user),
-    parent_id: str = Form(None)
+    parent_id: str = Form(None),
+    policy: UploadPolicy = Depends(get_upload_policy)
 ):
     service = FileService()
     try:
-        return await service.upload_file(file, user_id, parent_id)
+        return await service.upload_file(file, user_id, parent_id, policy)
+    except FileTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except FileTypeNotAllowed as e:
+        raise HTTPException(status_code=415, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail="Internal Server Error")
 
-@file_router.get("/{id}/download", response_model=FileDownloadResponse)
-async def download_file(id: str):
+@file_router.post("/upload/batch", response_model=BatchUploadResponse)
+async def upload_batch(
+    request: Request,
+    parent_id: str = Query(None),
+    user_id: str = Depends(get_current_user),
+    policy: UploadPolicy = Depends(get_upload_policy)
+):
+    # multipart/form-data с полями "files" либо tar-поток в теле запроса
+    service = BatchUploadService()
+    form = None
+    if request.headers.get("content-type", "").startswith("multipart/form-data"):
+        form = await request.form(max_files=MAX_BATCH_FILES)
+    try:
+        if form is not None:
+            entries = multipart_entries(form.getlist("files"))
+        else:
+            entries = tar_entries(request.stream())
+        return await service.upload_batch(entries, user_id, parent_id, policy)
+    except FolderNotFound as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception:
+        raise HTTPException(status_code=500, detail="Internal Server Error")
+    finally:
+        if form is not None:
+            await form.close()
+
+@file_router.post("/uploads", response_model=UploadSessionResponse)
+async def create_upload_session(
+    data: UploadSessionCreateRequest,
+    user_id: str = Depends(get_current_user)
+):
+    service = UploadSessionService()
+    try:
+        return await service.create_session(user_id, data.name, data.parent_id)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception:
+        raise HTTPException(status_code=500, detail="Internal Server Error")
+
+@file_router.get("/uploads/{session}", response_model=UploadSessionResponse)
+async def get_upload_session(session: str, user_id: str = Depends(get_current_user)):
+    service = UploadSessionService()
+    try:
+        return await service.get_session(session, user_id)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception:
+        raise HTTPException(status_code=500, detail="Internal Server Error")
+
+@file_router.put("/uploads/{session}/parts/{part_number}", response_model=UploadPartItem)
+async def upload_part(
+    session: str,
+    request: Request,
+    part_number: int = Path(..., ge=1, le=10000),
+    user_id: str = Depends(get_current_user),
+    policy: UploadPolicy = Depends(get_upload_policy)
+):
+    service = UploadSessionService()
+    try:
+        return await service.upload_part(session, part_number, user_id, request.stream(), policy)
+    except FileTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except FileTypeNotAllowed as e:
+        raise HTTPException(status_code=415, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception:
+        raise HTTPException(status_code=500, detail="Internal Server Error")
+
+@file_router.post("/uploads/{session}/complete", response_model=FileUploadResponse)
+async def complete_upload_session(
+    session: str,
+    user_id: str = Depends(get_current_user),
+    policy: UploadPolicy = Depends(get_upload_policy)
+):
+    service = UploadSessionService()
+    try:
+        return await service.complete(session, user_id, policy)
+    except FileTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except FileTypeNotAllowed as e:
+        raise HTTPException(status_code=415, detail=str(e))
+    except FolderNotFound as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception:
+        raise HTTPException(status_code=500, detail="Internal Server Error")
+
+@file_router.delete("/uploads/{session}")
+async def abort_upload_session(session: str, user_id: str = Depends(get_current_user)):
+    service = UploadSessionService()
+    try:
+        await service.abort(session, user_id)
+        return {"message": "Upload session aborted"}
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception:
+        raise HTTPException(status_code=500, detail="Internal Server Error")
+
+@file_router.post("/folders", response_model=FileItem)
+async def create_folder(data: FolderCreateRequest, user_id: str = Depends(get_current_user)):
+    service = FolderService()
+    try:
+        return await service.create_folder(user_id, data.name, data.parent_id)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception:
+        raise HTTPException(status_code=500, detail="Internal Server Error")
+
+@file_router.get("/folders/{id}/children", response_model=FileListResponse)
+async def list_folder_children(
+    id: str,
+    cursor: str = Query(None),
+    limit: int = Query(50, ge=1, le=500),
+    user_id: str = Depends(get_current_user)
+):
+    service = FolderService()
+    try:
+        return await service.list_children(id, user_id, cursor, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception:
+        raise HTTPException(status_code=500, detail="Internal Server Error")
+
+@file_router.get("/folders/{id}/tree", response_model=FileListResponse)
+async def list_folder_tree(
+    id: str,
+    cursor: str = Query(None),
+    limit: int = Query(50, ge=1, le=500),
+    user_id: str = Depends(get_current_user)
+):
+    service = FolderService()
+    try:
+        return await service.list_tree(id, user_id, cursor, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception:
+        raise HTTPException(status_code=500, detail="Internal Server Error")
+
+@file_router.get("/folders/{id}/size", response_model=FolderSizeResponse)
+async def get_folder_size(id: str, user_id: str = Depends(get_current_user)):
+    service = FolderService()
+    try:
+        return await service.get_folder_size(id, user_id)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception:
+        raise HTTPException(status_code=500, detail="Internal Server Error")
+
+@file_router.patch("/{id}/move")
+async def move_file(id: str, data: FileMoveRequest, user_id: str = Depends(get_current_user)):
+    service = FolderService()
+    try:
+        await service.move(id, user_id, data.parent_id)
+        return {"message": "File moved successfully"}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception:
+        raise HTTPException(status_code=500, detail="Internal Server Error")
+
+@file_router.get("/{id}/signature", response_model=FileSignatureResponse)
+async def get_file_signature(
+    id: str,
+    block_size: int = Query(DELTA_BLOCK_SIZE, ge=MIN_BLOCK_SIZE, le=MAX_BLOCK_SIZE),
+    user_id: str = Depends(get_current_user)
+):
+    service = DeltaService()
+    try:
+        return await service.get_signature(id, user_id, block_size)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception:
+        raise HTTPException(status_code=500, detail="Internal Server Error")
+
+@file_router.post("/{id}/delta", response_model=FileUploadResponse)
+async def upload_delta(
+    id: str,
+    block_map: str = Form(...),
+    base_hash: str = Form(None),
+    block_size: int = Form(DELTA_BLOCK_SIZE, ge=MIN_BLOCK_SIZE, le=MAX_BLOCK_SIZE),
+    data: UploadFile = File(None),
+    user_id: str = Depends(get_current_user),
+    policy: UploadPolicy = Depends(get_upload_policy)
+):
+    service = DeltaService()
+    try:
+        chunks = read_upload_file(data) if data is not None else None
+        return await service.apply_delta(id, user_id, block_size, base_hash, block_map, chunks, policy)
+    except DeltaConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except FileTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except FileTypeNotAllowed as e:
+        raise HTTPException(status_code=415, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception:
+        raise HTTPException(status_code=500, detail="Internal Server Error")
+
+@file_router.get("/{id}/download")
+async def download_file(
+    id: str,
+    range: str = Header(None),
+    if_range: str = Header(None),
+    if_none_match: str = Header(None),
+    if_modified_since: str = Header(None),
+    user_id: str = Depends(get_current_user)
+):
     service = FileService()
     try:
-        return await service.get_file_name(id)
+        return await service.download_file(id, user_id, range, if_range, if_none_match, if_modified_since)
+    except RangeNotSatisfiable as e:
+        raise HTTPException(status_code=416, detail=str(e), headers={"Content-Range": f"bytes */{e.size}"})
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception:
+        raise HTTPException(status_code=500, detail="Internal Server Error")
+
+@file_router.get("/{id}/content/{content_hash}")
+async def download_file_content(
+    id: str,
+    content_hash: str = Path(..., pattern="^[0-9a-f]{64}$"),
+    range: str = Header(None),
+    if_range: str = Header(None),
+    if_none_match: str = Header(None),
+    if_modified_since: str = Header(None),
+    user_id: str = Depends(get_current_user)
+):
+    service = FileService()
+    try:
+        return await service.download_content(
+            id, content_hash, user_id, range, if_range, if_none_match, if_modified_since
+        )
+    except RangeNotSatisfiable as e:
+        raise HTTPException(status_code=416, detail=str(e), headers={"Content-Range": f"bytes */{e.size}"})
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception:
+        raise HTTPException(status_code=500, detail="Internal Server Error")
+
+@file_router.get("/{id}/preview")
+async def get_file_preview(id: str, user_id: str = Depends(get_current_user)):
+    service = PreviewService()
+    try:
+        return await service.get_preview(id, user_id)
+    except PreviewPending as e:
+        return JSONResponse(
+            status_code=202 if e.queued else 503,
+            content={"detail": str(e)},
+            headers={"Retry-After": "2" if e.queued else "10"},
+        )
+    except PreviewFailed as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception:
+        raise HTTPException(status_code=500, detail="Internal Server Error")
+
+@file_router.get("/{id}/versions", response_model=FileVersionListResponse)
+async def list_file_versions(id: str, user_id: str = Depends(get_current_user)):
+    service = VersionService()
+    try:
+        return await service.list_versions(id, user_id)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception:
+        raise HTTPException(status_code=500, detail="Internal Server Error")
+
+@file_router.get("/{id}/versions/{number}/download")
+async def download_file_version(
+    id: str,
+    number: int,
+    range: str = Header(None),
+    if_range: str = Header(None),
+    user_id: str = Depends(get_current_user)
+):
+    service = VersionService()
+    try:
+        return await service.download_version(id, number, user_id, range, if_range)
+    except RangeNotSatisfiable as e:
+        raise HTTPException(status_code=416, detail=str(e), headers={"Content-Range": f"bytes */{e.size}"})
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception:
+        raise HTTPException(status_code=500, detail="Internal Server Error")
+
+@file_router.post("/{id}/versions/{number}/restore", response_model=FileUploadResponse)
+async def restore_file_version(id: str, number: int, user_id: str = Depends(get_current_user)):
+    service = VersionService()
+    try:
+        return await service.restore_version(id, number, user_id)
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
     except Exception:
@@ -33,7 +414,7 @@ async def download_file(id: str):
 async def delete_file(id: str, user_id: str = Depends(get_current_user)):
     service = FileService()
     try:
-        await service.delete_file(id)
+        await service.delete_file(id, user_id)
         return {"message": "File deleted successfully"}
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
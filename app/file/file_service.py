@@ -1,29 +1,122 @@
 # app/services/file_service.py
-from sqlalchemy import select
+from datetime import datetime
 
+from sqlalchemy import select, update, or_
+
+from app.file.access_db import AccessDB
+from app.file.blob_db import BlobDB
+from app.file.blob_store import CHUNK_SIZE, get_blob_store
+from app.file.content_store import ContentStore
 from app.file.db import SessionLocal
-from app.file.file import FileUploadResponse, FileDownloadResponse
-from app.file.file_db import FileDB
+from app.file.download import BlobResponse, parse_range, select_segments, content_disposition
+from app.file.download import etag_for, http_date, if_range_matches, is_not_modified, not_modified_response
+from app.file.download import content_url, REVALIDATE_CACHE, IMMUTABLE_CACHE
+from app.file.file import FileUploadResponse, FileListResponse
+from app.file.file_db import FileDB, FileChunkDB, new_id, child_path
+from app.file.folder_service import resolve_parent_path, ITEM_COLUMNS, ROOT_FOLDER, to_item
+from app.file.pagination import decode_cursor, apply_keyset, split_page
+from app.file.preview_pipeline import get_preview_pipeline
+from app.file.version_db import FileVersionDB, FileVersionChunkDB
+from app.file.versions import find_by_name, archive_current
+
+
+async def read_upload_file(file, chunk_size: int = CHUNK_SIZE):
+    while True:
+        chunk = await file.read(chunk_size)
+        if not chunk:
+            break
+        yield chunk
+
+
+def chunk_query(model, *filters):
+    return (
+        select(model.storage_key, model.blob_offset, model.length, BlobDB.codec, BlobDB.frames)
+        .join(BlobDB, BlobDB.hash == model.storage_key, isouter=True)
+        .where(*filters)
+        .order_by(model.seq)
+    )
+
+
+def readable_by(user_id):
+    # владелец или пользователь, которому файл расшарен (права read и write оба разрешают чтение)
+    return or_(
+        FileDB.user_id == user_id,
+        FileDB.id.in_(select(AccessDB.file_id).where(AccessDB.user_id == user_id)),
+    )
+
+
+SORT_KEYS = {
+    "date": (FileDB.uploaded_at, FileDB.id),
+    "name": (FileDB.name, FileDB.id),
+    "size": (FileDB.size, FileDB.id),
+}
 
 
 class FileService:
-    async def upload_file(self, file, user_id, parent_id=None):
-        filename = file.filename
-        contents = await file.read()
-        size = len(contents)
-        # Можно сохранить физически: сэтимпу пути, если требуется
-        # with open(os.path.join("uploads", filename), "wb") as f:
-        #     f.write(contents)
-        new_file = FileDB(
-            name=filename,
-            size=size,
-            user_id=user_id,
-            parent_id=parent_id,
-        )
+    def __init__(self, blob_store=None):
+        self.blob_store = blob_store or get_blob_store()
+        self.content_store = ContentStore(self.blob_store)
+        self.previews = get_preview_pipeline()
+
+    async def upload_file(self, file, user_id, parent_id=None, policy=None):
+        chunks = read_upload_file(file)
+        if policy is not None:
+            policy.check_size(file.size)
+            chunks = policy.guard(chunks, file.filename)
         async with SessionLocal() as session:
-            session.add(new_file)
+            # проверяем папку до приёма тела, чтобы не принимать файл впустую
+            await resolve_parent_path(session, parent_id, user_id)
+            # не держим соединение с БД, пока принимаем тело файла
             await session.commit()
-            await session.refresh(new_file)
+
+            blob = await self.content_store.put(session, chunks)
+            try:
+                # пока принималось тело, папку могли перенести или удалить — путь берём заново под блокировкой
+                parent_path = await resolve_parent_path(session, parent_id, user_id, lock=True)
+                existing = await find_by_name(session, user_id, parent_id, [file.filename])
+                if file.filename in existing:
+                    # файл с таким именем уже есть в папке — загрузка становится его новой версией
+                    file_id = existing[file.filename]
+                    uploaded_at = datetime.utcnow()
+                    await archive_current(session, [file_id])
+                    await session.execute(
+                        update(FileDB).where(FileDB.id == file_id).values(
+                            size=blob.size,
+                            content_hash=blob.hash,
+                            stored_size=blob.stored_size,
+                            codec=blob.codec,
+                            uploaded_at=uploaded_at,
+                        )
+                    )
+                    session.add(
+                        FileChunkDB(file_id=file_id, seq=0, storage_key=blob.hash, blob_offset=0, length=blob.size)
+                    )
+                    await session.commit()
+                    self.previews.enqueue_blob(file.filename, blob)
+                    return FileUploadResponse(id=file_id, name=file.filename, size=blob.size, uploaded_at=uploaded_at)
+
+                file_id = new_id("file")
+                new_file = FileDB(
+                    id=file_id,
+                    name=file.filename,
+                    size=blob.size,
+                    user_id=user_id,
+                    parent_id=parent_id,
+                    content_hash=blob.hash,
+                    stored_size=blob.stored_size,
+                    codec=blob.codec,
+                    path=child_path(parent_path, file_id),
+                )
+                chunk = FileChunkDB(file_id=new_file.id, seq=0, storage_key=blob.hash, blob_offset=0, length=blob.size)
+                session.add(new_file)
+                session.add(chunk)
+                await session.commit()
+                await session.refresh(new_file)
+            except Exception:
+                # строка в БД не создалась — блоб никому не нужен
+                await self.content_store.discard(blob)
+                raise
+        self.previews.enqueue_blob(file.filename, blob)
         return FileUploadResponse(
             id=new_file.id,
             name=new_file.name,
@@ -31,23 +124,155 @@ class FileService:
             uploaded_at=new_file.uploaded_at,
         )
 
-    async def get_file_name(self, file_id: str):
+    async def list_files(self, user_id: str, sort: str = "date", order: str = "desc", parent_id=None,
+                         name_prefix=None, cursor=None, limit: int = 50) -> FileListResponse:
+        key = SORT_KEYS[sort]
+        after = decode_cursor(cursor)
+        # выбираем только нужные колонки, без сборки ORM-объектов
+        stmt = select(*ITEM_COLUMNS).where(FileDB.user_id == user_id, FileDB.deleted_at.is_(None))
+        if parent_id == ROOT_FOLDER:
+            stmt = stmt.where(FileDB.parent_id.is_(None))
+        elif parent_id is not None:
+            stmt = stmt.where(FileDB.parent_id == parent_id)
+        if name_prefix:
+            stmt = stmt.where(FileDB.name.startswith(name_prefix, autoescape=True))
+        stmt = apply_keyset(stmt, key, after, descending=order == "desc", limit=limit)
         async with SessionLocal() as session:
-            result = await session.execute(
-                select(FileDB).where(FileDB.id == file_id)
-            )
+            result = await session.execute(stmt)
+            rows, next_cursor = split_page(result.all(), key, limit)
+        return FileListResponse(items=[to_item(row) for row in rows], next_cursor=next_cursor)
+
+    async def get_file_chunks(self, file_id: str, user_id=None, fresh=None, shared: bool = False):
+        """
+        Loads the file row and its chunk manifest. When fresh(file) says the
+        client's copy is current, the manifest is not loaded and None is returned for it.
+        With shared=True files shared with the user are found as well as owned ones.
+        """
+        async with SessionLocal() as session:
+            stmt = select(FileDB).where(FileDB.id == file_id, FileDB.deleted_at.is_(None))
+            if user_id is not None:
+                stmt = stmt.where(readable_by(user_id) if shared else FileDB.user_id == user_id)
+            result = await session.execute(stmt)
             file = result.scalar_one_or_none()
             if file is None:
                 raise ValueError("Файл не найден")
-            return FileDownloadResponse(name=file.name)
+            if file.is_folder:
+                raise ValueError("Это папка, а не файл")
+            if fresh is not None and fresh(file):
+                return file, None
+            result = await session.execute(chunk_query(FileChunkDB, FileChunkDB.file_id == file_id))
+            return file, result.all()
+
+    async def download_file(self, file_id: str, user_id: str, range_header=None, if_range=None, if_none_match=None,
+                            if_modified_since=None):
+        def fresh(file):
+            return is_not_modified(if_none_match, if_modified_since, etag_for(file.content_hash), file.uploaded_at)
+
+        file, chunks = await self.get_file_chunks(file_id, user_id, fresh=fresh, shared=True)
+        location = content_url(file_id, file.content_hash)
+        if chunks is None:
+            return not_modified_response(self.cache_headers(file.content_hash, file.uploaded_at, location=location))
+        return self.build_download(
+            chunks, file.name, file.size, file.content_hash, file.uploaded_at, range_header, if_range,
+            location=location,
+        )
 
-    async def delete_file(self, file_id: str):
+    async def download_content(self, file_id: str, content_hash: str, user_id: str, range_header=None,
+                               if_range=None, if_none_match=None, if_modified_since=None):
+        """
+        Serves a file by the hash of its content: the current content or an older
+        version with that hash. The URL never changes meaning, so it is cached as
+        immutable, but only by the user's own cache.
+        """
         async with SessionLocal() as session:
             result = await session.execute(
-                select(FileDB).where(FileDB.id == file_id)
+                select(FileDB.name, FileDB.size, FileDB.content_hash, FileDB.uploaded_at, FileDB.is_folder)
+                .where(FileDB.id == file_id, FileDB.deleted_at.is_(None), readable_by(user_id))
             )
-            file = result.scalar_one_or_none()
-            if file is None:
+            file = result.one_or_none()
+            if file is None or file.is_folder:
+                raise ValueError("Файл не найден")
+            if file.content_hash == content_hash:
+                size, modified = file.size, file.uploaded_at
+                stmt = chunk_query(FileChunkDB, FileChunkDB.file_id == file_id)
+            else:
+                result = await session.execute(
+                    select(FileVersionDB.number, FileVersionDB.size, FileVersionDB.created_at)
+                    .where(FileVersionDB.file_id == file_id, FileVersionDB.content_hash == content_hash)
+                    .order_by(FileVersionDB.number.desc())
+                    .limit(1)
+                )
+                version = result.one_or_none()
+                if version is None:
+                    raise ValueError("Содержимое не найдено")
+                size, modified = version.size, version.created_at
+                stmt = chunk_query(
+                    FileVersionChunkDB,
+                    FileVersionChunkDB.file_id == file_id,
+                    FileVersionChunkDB.number == version.number,
+                )
+            if is_not_modified(if_none_match, if_modified_since, etag_for(content_hash), modified):
+                return not_modified_response(self.cache_headers(content_hash, modified, IMMUTABLE_CACHE))
+            result = await session.execute(stmt)
+            chunks = result.all()
+        return self.build_download(
+            chunks, file.name, size, content_hash, modified, range_header, if_range, cache_control=IMMUTABLE_CACHE,
+        )
+
+    def cache_headers(self, content_hash, modified, cache_control: str = REVALIDATE_CACHE, location=None) -> dict:
+        headers = {"cache-control": cache_control}
+        etag = etag_for(content_hash)
+        last_modified = http_date(modified)
+        if etag:
+            headers["etag"] = etag
+        if last_modified:
+            headers["last-modified"] = last_modified
+        if location:
+            # адрес, по которому это же содержимое можно кэшировать навсегда
+            headers["content-location"] = location
+        return headers
+
+    def build_download(self, chunks, name: str, size: int, content_hash, modified, range_header=None,
+                       if_range=None, cache_control: str = REVALIDATE_CACHE, location=None) -> BlobResponse:
+        headers = self.cache_headers(content_hash, modified, cache_control, location)
+        headers["accept-ranges"] = "bytes"
+        headers["content-disposition"] = content_disposition(name)
+
+        byte_range = None
+        if if_range_matches(if_range, headers.get("etag"), headers.get("last-modified")):
+            byte_range = parse_range(range_header, size)
+        if byte_range is None:
+            segments = select_segments(chunks, 0, size - 1)
+            return BlobResponse(self.blob_store, segments, headers=headers, filename=name)
+        start, end = byte_range
+        headers["content-range"] = f"bytes {start}-{end}/{size}"
+        segments = select_segments(chunks, start, end)
+        return BlobResponse(self.blob_store, segments, status_code=206, headers=headers, filename=name)
+
+    async def delete_file(self, file_id: str, user_id: str):
+        """
+        Moves the file, or the whole folder subtree, to the trash with one UPDATE.
+        Rows and blobs are removed later by the purge worker.
+        """
+        async with SessionLocal() as session:
+            result = await session.execute(
+                select(FileDB.path).where(
+                    FileDB.id == file_id,
+                    FileDB.user_id == user_id,
+                    FileDB.deleted_at.is_(None),
+                )
+            )
+            path = result.scalar_one_or_none()
+            if path is None:
                 raise ValueError("Файл не найден")
-            await session.delete(file)
+            await session.execute(
+                update(FileDB)
+                .where(
+                    FileDB.user_id == user_id,
+                    FileDB.path.startswith(path, autoescape=True),
+                    FileDB.deleted_at.is_(None),
+                )
+                .values(deleted_at=datetime.utcnow(), trash_id=file_id)
+                .execution_options(synchronize_session=False)
+            )
             await session.commit()
@@ -0,0 +1,155 @@
+# app/services/folder_service.py
+from sqlalchemy import select, update, func, literal
+
+from app.file.db import SessionLocal
+from app.file.file import FileItem, FileListResponse, FolderSizeResponse
+from app.file.file_db import FileDB, new_id, child_path
+from app.file.pagination import decode_cursor, apply_keyset, split_page
+
+ROOT_FOLDER = "root"
+
+
+class FolderNotFound(ValueError):
+    def __init__(self):
+        super().__init__("Папка не найдена")
+
+ITEM_COLUMNS = (
+    FileDB.id,
+    FileDB.name,
+    FileDB.size,
+    FileDB.uploaded_at,
+    FileDB.is_folder,
+    FileDB.parent_id,
+)
+
+
+async def resolve_parent_path(session, parent_id, user_id, lock: bool = False) -> str:
+    """
+    Path of the user's live folder. With lock=True the folder row is held FOR
+    SHARE until the caller commits, so it cannot be moved or trashed while
+    children are inserted under the returned path.
+    """
+    if parent_id is None:
+        return "/"
+    stmt = select(FileDB.path).where(
+        FileDB.id == parent_id,
+        FileDB.user_id == user_id,
+        FileDB.is_folder.is_(True),
+        FileDB.deleted_at.is_(None),
+    )
+    if lock:
+        stmt = stmt.with_for_update(read=True)
+    result = await session.execute(stmt)
+    path = result.scalar_one_or_none()
+    if path is None:
+        raise FolderNotFound()
+    return path
+
+
+def to_item(row) -> FileItem:
+    return FileItem(**row._mapping)
+
+
+class FolderService:
+    async def create_folder(self, user_id: str, name: str, parent_id=None) -> FileItem:
+        async with SessionLocal() as session:
+            parent_path = await resolve_parent_path(session, parent_id, user_id, lock=True)
+            folder_id = new_id("folder")
+            folder = FileDB(
+                id=folder_id,
+                name=name,
+                size=0,
+                user_id=user_id,
+                parent_id=parent_id,
+                is_folder=True,
+                path=child_path(parent_path, folder_id),
+            )
+            session.add(folder)
+            await session.commit()
+            await session.refresh(folder)
+        return FileItem(
+            id=folder.id,
+            name=folder.name,
+            size=folder.size,
+            uploaded_at=folder.uploaded_at,
+            is_folder=True,
+            parent_id=folder.parent_id,
+        )
+
+    async def list_children(self, folder_id: str, user_id: str, cursor=None, limit: int = 50) -> FileListResponse:
+        after = decode_cursor(cursor)
+        async with SessionLocal() as session:
+            if folder_id == ROOT_FOLDER:
+                parent_filter = FileDB.parent_id.is_(None)
+            else:
+                await resolve_parent_path(session, folder_id, user_id)
+                parent_filter = FileDB.parent_id == folder_id
+            key = (FileDB.name, FileDB.id)
+            stmt = select(*ITEM_COLUMNS).where(FileDB.user_id == user_id, parent_filter, FileDB.deleted_at.is_(None))
+            result = await session.execute(apply_keyset(stmt, key, after, limit=limit))
+            rows, next_cursor = split_page(result.all(), key, limit)
+        return FileListResponse(items=[to_item(row) for row in rows], next_cursor=next_cursor)
+
+    async def list_tree(self, folder_id: str, user_id: str, cursor=None, limit: int = 50) -> FileListResponse:
+        """
+        Lists the whole subtree in depth-first order: one range scan over the path index.
+        """
+        after = decode_cursor(cursor)
+        async with SessionLocal() as session:
+            prefix = "/" if folder_id == ROOT_FOLDER else await resolve_parent_path(session, folder_id, user_id)
+            key = (FileDB.path,)
+            stmt = select(*ITEM_COLUMNS, FileDB.path).where(
+                FileDB.user_id == user_id,
+                FileDB.path.startswith(prefix, autoescape=True),
+                FileDB.path != prefix,
+                FileDB.deleted_at.is_(None),
+            )
+            result = await session.execute(apply_keyset(stmt, key, after, limit=limit))
+            rows, next_cursor = split_page(result.all(), key, limit)
+        return FileListResponse(items=[to_item(row) for row in rows], next_cursor=next_cursor)
+
+    async def get_folder_size(self, folder_id: str, user_id: str) -> FolderSizeResponse:
+        async with SessionLocal() as session:
+            prefix = "/" if folder_id == ROOT_FOLDER else await resolve_parent_path(session, folder_id, user_id)
+            result = await session.execute(
+                select(
+                    func.coalesce(func.sum(FileDB.size), 0),
+                    func.count().filter(FileDB.is_folder.is_(False)),
+                    func.count().filter(FileDB.is_folder.is_(True)),
+                ).where(
+                    FileDB.user_id == user_id,
+                    FileDB.path.startswith(prefix, autoescape=True),
+                    FileDB.path != prefix,
+                    FileDB.deleted_at.is_(None),
+                )
+            )
+            size, files, folders = result.one()
+        return FolderSizeResponse(id=folder_id, size=size, files=files, folders=folders)
+
+    async def move(self, file_id: str, user_id: str, parent_id=None):
+        async with SessionLocal() as session:
+            result = await session.execute(
+                select(FileDB.path).where(
+                    FileDB.id == file_id,
+                    FileDB.user_id == user_id,
+                    FileDB.deleted_at.is_(None),
+                )
+            )
+            old_path = result.scalar_one_or_none()
+            if old_path is None:
+                raise ValueError("Файл не найден")
+            parent_path = await resolve_parent_path(session, parent_id, user_id)
+            if parent_path.startswith(old_path):
+                raise ValueError("Нельзя переместить папку внутрь самой себя")
+            new_path = child_path(parent_path, file_id)
+            # всё поддерево (включая лежащее в корзине) переносится одним UPDATE: меняется только префикс пути
+            await session.execute(
+                update(FileDB)
+                .where(FileDB.user_id == user_id, FileDB.path.startswith(old_path, autoescape=True))
+                .values(path=literal(new_path) + func.substr(FileDB.path, len(old_path) + 1))
+                .execution_options(synchronize_session=False)
+            )
+            await session.execute(
+                update(FileDB).where(FileDB.id == file_id).values(parent_id=parent_id)
+            )
+            await session.commit()
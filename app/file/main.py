@@ -1,7 +1,9 @@
 # app/main.py
+import asyncio
 import logging
 import os
 import sys
+from contextlib import asynccontextmanager
 
 from fastapi import FastAPI
 from prometheus_fastapi_instrumentator import Instrumentator
@@ -12,7 +14,14 @@ from opentelemetry.sdk.trace import TracerProvider
 from opentelemetry.sdk.trace.export import BatchSpanProcessor
 from opentelemetry.instrumentation.fastapi import FastAPIInstrumentor
 
+from app.file.cleanup_service import CleanupService, run_cleanup_loop
+from app.file.content_store import ContentStore, run_gc_loop
+from app.file.db import create_extensions
+from app.file.dependencies import start_auth_sync
 from app.file.file_router import file_router
+from app.file.preview_pipeline import get_preview_pipeline, run_preview_workers
+from app.file.upload_validation import UploadSizeLimitMiddleware
+from app.file.version_service import VersionService, run_version_prune_loop
 
 
 def configure_logging(service_name: str) -> None:
@@ -45,7 +54,31 @@ service_name = os.getenv("SERVICE_NAME", "file-service")
 configure_logging(service_name)
 tracer_provider = configure_tracing(service_name)
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    try:
+        await create_extensions()
+    except Exception:
+        logging.getLogger(__name__).exception("Creating database extensions failed")
+    tasks = [
+        asyncio.create_task(run_gc_loop(ContentStore())),
+        asyncio.create_task(run_cleanup_loop(CleanupService())),
+        asyncio.create_task(run_version_prune_loop(VersionService())),
+        asyncio.create_task(run_preview_workers(get_preview_pipeline())),
+        *await start_auth_sync(),
+    ]
+    yield
+    for task in tasks:
+        task.cancel()
+
+
+app = FastAPI(lifespan=lifespan)
+# однофайловые загрузки отсекаются по Content-Length ещё до чтения тела
+app.add_middleware(
+    UploadSizeLimitMiddleware,
+    paths=[r"/api/files/upload", r"/api/files/uploads/[^/]+/parts/\d+", r"/api/files/[^/]+/delta"],
+)
 FastAPIInstrumentor.instrument_app(app, tracer_provider=tracer_provider)
 Instrumentator().instrument(app).expose(app)
 
@@ -0,0 +1,50 @@
+# app/file/pagination.py
+import base64
+import json
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import literal, tuple_
+
+
+def encode_cursor(values) -> str:
+    raw = json.dumps(values, default=str, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: Optional[str]):
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        return json.loads(raw)
+    except ValueError:
+        raise ValueError("Некорректный курсор")
+
+
+def _restore(column, value):
+    if value is not None and column.type.python_type is datetime:
+        return datetime.fromisoformat(value)
+    return value
+
+
+def apply_keyset(stmt, columns, after=None, descending: bool = False, limit: int = 50):
+    """
+    Orders by the key columns and continues after the decoded cursor values.
+    One extra row is fetched to tell whether another page exists.
+    """
+    if after:
+        if len(after) != len(columns):
+            raise ValueError("Некорректный курсор")
+        key = tuple_(*columns)
+        bound = tuple_(*[literal(_restore(c, v), c.type) for c, v in zip(columns, after)])
+        stmt = stmt.where(key < bound if descending else key > bound)
+    order = [c.desc() for c in columns] if descending else list(columns)
+    return stmt.order_by(*order).limit(limit + 1)
+
+
+def split_page(rows, columns, limit: int):
+    if len(rows) <= limit:
+        return rows, None
+    last = rows[limit - 1]._mapping
+    return rows[:limit], encode_cursor([last[c.key] for c in columns])
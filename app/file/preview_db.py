@@ -0,0 +1,18 @@
+# app/models/preview_db.py
+from sqlalchemy import Column, String, BigInteger, DateTime
+from datetime import datetime
+
+from app.file.db import Base
+
+
+# Превью зависят только от содержимого, поэтому одинаковые файлы делят одно превью
+class PreviewDB(Base):
+    __tablename__ = "previews"
+    content_hash = Column(String(64), primary_key=True)
+    kind = Column(String, primary_key=True)  # "thumbnail" или "text"
+    # у неудавшегося рендера нет блоба: строка только запоминает ошибку, пока содержимое не сменится
+    storage_key = Column(String, nullable=True)
+    media_type = Column(String, nullable=True)
+    size = Column(BigInteger, nullable=True)
+    error = Column(String, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
@@ -0,0 +1,196 @@
+# app/file/preview_pipeline.py
+import asyncio
+import logging
+import os
+import time
+from concurrent.futures import BrokenExecutor, ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Optional
+
+from prometheus_client import Counter, Gauge, Histogram
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert
+
+from app.file.blob_store import get_blob_store
+from app.file.compression import read_segment
+from app.file.db import SessionLocal
+from app.file.download import select_segments
+from app.file.preview_db import PreviewDB
+from app.file.previews import KIND_TEXT, KIND_THUMBNAIL, MEDIA_TYPES, preview_kind, render_text, render_thumbnail
+
+PREVIEW_WORKERS = int(os.getenv("PREVIEW_WORKERS", 2))
+PREVIEW_QUEUE_SIZE = int(os.getenv("PREVIEW_QUEUE_SIZE", 256))
+# картинки больше этого не рендерим: их байты целиком уходят в процесс пула
+PREVIEW_MAX_SOURCE = int(os.getenv("PREVIEW_MAX_SOURCE", 32 * 1024 * 1024))
+THUMBNAIL_SIZE = int(os.getenv("THUMBNAIL_SIZE", 256))
+TEXT_PREVIEW_BYTES = int(os.getenv("TEXT_PREVIEW_BYTES", 64 * 1024))
+TEXT_PREVIEW_CHARS = int(os.getenv("TEXT_PREVIEW_CHARS", 4000))
+
+PREVIEW_QUEUE_DEPTH = Gauge("preview_queue_depth", "Preview jobs waiting for a worker")
+PREVIEW_IN_FLIGHT = Gauge("preview_jobs_in_flight", "Preview jobs being rendered")
+PREVIEW_JOBS = Counter("preview_jobs_total", "Preview jobs by kind and outcome", ["kind", "outcome"])
+PREVIEW_RENDER_SECONDS = Histogram(
+    "preview_render_duration_seconds", "Time spent rendering one preview in the process pool", ["kind"]
+)
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class ChunkRef:
+    storage_key: str
+    blob_offset: int
+    length: int
+    codec: Optional[str] = None
+    frames: Optional[bytes] = None
+
+
+@dataclass
+class PreviewJob:
+    content_hash: str
+    kind: str
+    size: int
+    chunks: list  # манифест содержимого: строки с storage_key, blob_offset, length, codec, frames
+
+
+def preview_key(content_hash: str, kind: str) -> str:
+    return f"preview-{kind}-{content_hash}"
+
+
+async def _iter_chunks(data: bytes):
+    yield data
+
+
+def can_preview(kind: Optional[str], size: int) -> bool:
+    if kind is None:
+        return False
+    return kind != KIND_THUMBNAIL or size <= PREVIEW_MAX_SOURCE
+
+
+class PreviewPipeline:
+    """
+    Renders thumbnails and text previews off the event loop. Jobs wait in a
+    bounded queue; there are as many consumers as pool processes, so the pool
+    never holds more than one job per process. Previews are keyed by content
+    hash, so identical content is rendered once.
+    """
+
+    def __init__(self, blob_store=None, workers: int = PREVIEW_WORKERS, queue_size: int = PREVIEW_QUEUE_SIZE,
+                 executor=None):
+        self.blob_store = blob_store or get_blob_store()
+        self.workers = workers
+        self.queue = asyncio.Queue(queue_size)
+        self.executor = executor
+        # хэши в очереди или в работе — повторные задания на то же содержимое не ставятся
+        self.pending = set()
+
+    def enqueue(self, content_hash: Optional[str], name: str, size: int, chunks) -> bool:
+        """
+        Queues a preview job without waiting. Returns False when the file has no
+        preview or the queue is full; the preview is then rendered on first request.
+        """
+        kind = preview_kind(name)
+        if content_hash is None or not can_preview(kind, size):
+            return False
+        if (content_hash, kind) in self.pending:
+            return True
+        try:
+            self.queue.put_nowait(PreviewJob(content_hash, kind, size, list(chunks)))
+        except asyncio.QueueFull:
+            PREVIEW_JOBS.labels(kind, "rejected").inc()
+            return False
+        self.pending.add((content_hash, kind))
+        PREVIEW_JOBS.labels(kind, "queued").inc()
+        PREVIEW_QUEUE_DEPTH.set(self.queue.qsize())
+        return True
+
+    def enqueue_blob(self, name: str, blob) -> bool:
+        return self.enqueue(blob.hash, name, blob.size, [ChunkRef(blob.hash, 0, blob.size, blob.codec, blob.frames)])
+
+    async def _read_source(self, job: PreviewJob) -> bytes:
+        # для текста хватает начала файла
+        limit = min(job.size, TEXT_PREVIEW_BYTES) if job.kind == KIND_TEXT else job.size
+        data = bytearray()
+        for segment in select_segments(job.chunks, 0, limit - 1):
+            async for chunk in read_segment(self.blob_store, *segment):
+                data += chunk
+        return bytes(data)
+
+    async def _render(self, job: PreviewJob, data: bytes) -> bytes:
+        loop = asyncio.get_running_loop()
+        started = time.monotonic()
+        try:
+            if job.kind == KIND_THUMBNAIL:
+                return await loop.run_in_executor(self.executor, render_thumbnail, data, THUMBNAIL_SIZE)
+            return await loop.run_in_executor(self.executor, render_text, data, TEXT_PREVIEW_CHARS)
+        finally:
+            PREVIEW_RENDER_SECONDS.labels(job.kind).observe(time.monotonic() - started)
+
+    async def process(self, job: PreviewJob) -> None:
+        async with SessionLocal() as session:
+            result = await session.execute(
+                select(PreviewDB.kind)
+                .where(PreviewDB.content_hash == job.content_hash, PreviewDB.kind == job.kind)
+            )
+            if result.scalar_one_or_none() is not None:
+                PREVIEW_JOBS.labels(job.kind, "duplicate").inc()
+                return
+        data = await self._read_source(job)
+        try:
+            rendered = await self._render(job, data)
+        except BrokenExecutor:
+            raise
+        except Exception as e:
+            # содержимое не рендерится (битая картинка, не тот формат) — запоминаем это по хэшу,
+            # иначе каждый запрос превью ставил бы его в очередь заново
+            logger.warning("Preview of %s cannot be rendered: %r", job.content_hash, e)
+            await self._save(job, error=type(e).__name__)
+            PREVIEW_JOBS.labels(job.kind, "unrenderable").inc()
+            return
+        storage_key = preview_key(job.content_hash, job.kind)
+        await self.blob_store.write(storage_key, _iter_chunks(rendered))
+        await self._save(job, storage_key=storage_key, media_type=MEDIA_TYPES[job.kind], size=len(rendered))
+        PREVIEW_JOBS.labels(job.kind, "rendered").inc()
+
+    async def _save(self, job: PreviewJob, **values) -> None:
+        async with SessionLocal() as session:
+            await session.execute(
+                insert(PreviewDB)
+                .values(content_hash=job.content_hash, kind=job.kind, **values)
+                .on_conflict_do_nothing()
+            )
+            await session.commit()
+
+    async def worker(self) -> None:
+        while True:
+            job = await self.queue.get()
+            PREVIEW_QUEUE_DEPTH.set(self.queue.qsize())
+            PREVIEW_IN_FLIGHT.inc()
+            try:
+                await self.process(job)
+            except Exception:
+                PREVIEW_JOBS.labels(job.kind, "failed").inc()
+                logger.exception("Preview generation failed")
+            finally:
+                PREVIEW_IN_FLIGHT.dec()
+                self.pending.discard((job.content_hash, job.kind))
+                self.queue.task_done()
+
+
+async def run_preview_workers(pipeline: PreviewPipeline):
+    if pipeline.executor is None:
+        pipeline.executor = ProcessPoolExecutor(max_workers=pipeline.workers)
+    try:
+        await asyncio.gather(*[pipeline.worker() for _ in range(pipeline.workers)])
+    finally:
+        pipeline.executor.shutdown(wait=False, cancel_futures=True)
+
+
+_pipeline: Optional[PreviewPipeline] = None
+
+
+def get_preview_pipeline() -> PreviewPipeline:
+    global _pipeline
+    if _pipeline is None:
+        _pipeline = PreviewPipeline()
+    return _pipeline
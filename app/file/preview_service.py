@@ -0,0 +1,68 @@
+# app/services/preview_service.py
+from sqlalchemy import select
+from starlette.responses import StreamingResponse
+
+from app.file.blob_store import get_blob_store
+from app.file.db import SessionLocal
+from app.file.file_db import FileDB, FileChunkDB
+from app.file.file_service import chunk_query
+from app.file.preview_db import PreviewDB
+from app.file.preview_pipeline import can_preview, get_preview_pipeline
+from app.file.previews import preview_kind
+
+
+class PreviewPending(Exception):
+    def __init__(self, queued: bool):
+        super().__init__("Превью ещё готовится" if queued else "Очередь превью переполнена")
+        self.queued = queued
+
+
+class PreviewFailed(Exception):
+    def __init__(self):
+        super().__init__("Не удалось построить превью для этого файла")
+
+
+class PreviewService:
+    def __init__(self, blob_store=None, pipeline=None):
+        self.blob_store = blob_store or get_blob_store()
+        self.pipeline = pipeline or get_preview_pipeline()
+
+    async def get_preview(self, file_id: str, user_id: str) -> StreamingResponse:
+        """
+        Returns the rendered preview, or queues its rendering and raises PreviewPending.
+        Raises PreviewFailed when rendering this content has already failed.
+        """
+        async with SessionLocal() as session:
+            result = await session.execute(
+                select(FileDB.name, FileDB.size, FileDB.content_hash, FileDB.is_folder).where(
+                    FileDB.id == file_id,
+                    FileDB.user_id == user_id,
+                    FileDB.deleted_at.is_(None),
+                )
+            )
+            file = result.one_or_none()
+            if file is None or file.is_folder:
+                raise ValueError("Файл не найден")
+            kind = preview_kind(file.name)
+            if file.content_hash is None or not can_preview(kind, file.size):
+                raise ValueError("Для этого файла нет превью")
+            result = await session.execute(
+                select(PreviewDB).where(PreviewDB.content_hash == file.content_hash, PreviewDB.kind == kind)
+            )
+            preview = result.scalar_one_or_none()
+            if preview is None:
+                # превью ещё нет (очередь была полна или файл загружен до появления превью) — ставим задание
+                result = await session.execute(chunk_query(FileChunkDB, FileChunkDB.file_id == file_id))
+                queued = self.pipeline.enqueue(file.content_hash, file.name, file.size, result.all())
+                raise PreviewPending(queued)
+            if preview.error is not None:
+                raise PreviewFailed()
+        return StreamingResponse(
+            self.blob_store.read(preview.storage_key),
+            media_type=preview.media_type,
+            headers={
+                "content-length": str(preview.size),
+                "etag": f'"{preview.content_hash}-{preview.kind}"',
+                "cache-control": "no-cache",
+            },
+        )
@@ -0,0 +1,47 @@
+# app/file/previews.py
+import io
+import os
+from typing import Optional
+
+from PIL import Image, ImageOps
+
+from app.file.upload_validation import TEXT_TYPES
+
+KIND_THUMBNAIL = "thumbnail"
+KIND_TEXT = "text"
+IMAGE_TYPES = {"jpg", "jpeg", "png", "gif", "bmp", "tif", "tiff", "webp"}
+MEDIA_TYPES = {KIND_THUMBNAIL: "image/webp", KIND_TEXT: "text/plain; charset=utf-8"}
+# защита от «декомпрессионных бомб»: картинки больше стольких пикселей не рендерим
+MAX_IMAGE_PIXELS = 50_000_000
+
+
+def preview_kind(filename: Optional[str]) -> Optional[str]:
+    extension = os.path.splitext(filename or "")[1][1:].lower()
+    if extension in IMAGE_TYPES:
+        return KIND_THUMBNAIL
+    if extension in TEXT_TYPES:
+        return KIND_TEXT
+    return None
+
+
+# функции ниже выполняются в отдельных процессах пула, поэтому принимают и возвращают только bytes
+
+def render_thumbnail(data: bytes, size: int) -> bytes:
+    Image.MAX_IMAGE_PIXELS = MAX_IMAGE_PIXELS
+    with Image.open(io.BytesIO(data)) as image:
+        # JPEG-декодер сразу уменьшает картинку кратно 1/8, не раскрывая её полностью
+        image.draft("RGB", (size, size))
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((size, size))
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA" if "transparency" in image.info else "RGB")
+        output = io.BytesIO()
+        image.save(output, "WEBP", quality=80)
+    return output.getvalue()
+
+
+def render_text(data: bytes, chars: int) -> bytes:
+    # последний символ мог обрезаться на границе прочитанного куска
+    text = data.decode("utf-8", errors="replace").rstrip("\ufffd")
+    text = text.replace("\r\n", "\n").replace("\r", "\n")[:chars]
+    return text.encode("utf-8")
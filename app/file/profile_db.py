@@ -0,0 +1,12 @@
+from sqlalchemy import Column, Integer, ForeignKey
+from sqlalchemy.dialects.postgresql import UUID
+
+from app.file.db import Base
+
+
+class ProfileDB(Base):
+    __tablename__ = "profiles"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), unique=True, nullable=False)
+    storage_used = Column(Integer, default=0)
+    storage_limit = Column(Integer, default=2147483647)
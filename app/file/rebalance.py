@@ -0,0 +1,37 @@
+# app/file/rebalance.py
+import argparse
+import asyncio
+
+from sqlalchemy import select, func
+
+from app.file.blob_store import BLOB_STORE_REPLICAS, BLOB_STORE_ROOTS, StripedBlobStore
+from app.file.content_store import GC_LOCK_ID
+from app.file.db import engine
+
+
+async def main() -> None:
+    """
+    Rebalances striped blob storage after disks were added or replaced:
+    python -m app.file.rebalance --roots /mnt/d1,/mnt/d2,/mnt/d3 --replicas 2
+    """
+    parser = argparse.ArgumentParser(description="Rebalance striped blob storage")
+    parser.add_argument("--roots", default=",".join(BLOB_STORE_ROOTS))
+    parser.add_argument("--replicas", type=int, default=BLOB_STORE_REPLICAS)
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+
+    store = StripedBlobStore([root for root in args.roots.split(",") if root], args.replicas)
+    # пока блобы переезжают между дисками, сборщик мусора их не удаляет: блокировка ждёт
+    # завершения идущих проходов GC и держится на отдельном соединении до конца ребалансировки
+    async with engine.connect() as conn:
+        await conn.execute(select(func.pg_advisory_lock(GC_LOCK_ID)))
+        try:
+            stats = await store.rebalance(dry_run=args.dry_run)
+        finally:
+            await conn.execute(select(func.pg_advisory_unlock(GC_LOCK_ID)))
+            await conn.commit()
+    print(f"copied={stats.copied} removed={stats.removed} under_replicated={stats.under_replicated}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,199 @@
+# app/file/s3_client.py
+import hashlib
+import hmac
+import os
+import re
+from datetime import datetime, timezone
+from typing import Optional
+from urllib.parse import quote
+from xml.etree import ElementTree
+
+import httpx
+
+S3_ENDPOINT = os.getenv("S3_ENDPOINT", "http://localhost:9000")
+S3_BUCKET = os.getenv("S3_BUCKET", "cloud-storage")
+S3_REGION = os.getenv("S3_REGION", "us-east-1")
+S3_ACCESS_KEY = os.getenv("S3_ACCESS_KEY", "")
+S3_SECRET_KEY = os.getenv("S3_SECRET_KEY", "")
+S3_PREFIX = os.getenv("S3_PREFIX", "blobs/")
+S3_MAX_CONNECTIONS = int(os.getenv("S3_MAX_CONNECTIONS", 32))
+S3_TIMEOUT = float(os.getenv("S3_TIMEOUT", 60))
+
+UNSIGNED_PAYLOAD = "UNSIGNED-PAYLOAD"
+CONTENT_RANGE = re.compile(r"bytes (\d+)-(\d+)/(\d+)")
+
+
+class S3Error(Exception):
+    def __init__(self, status_code: int, body: str = ""):
+        super().__init__(f"S3 responded with {status_code}: {body[:200]}")
+        self.status_code = status_code
+
+
+def _hmac(key: bytes, message: str) -> bytes:
+    return hmac.new(key, message.encode("utf-8"), hashlib.sha256).digest()
+
+
+def _encode(value: str, safe: str = "-_.~") -> str:
+    return quote(value, safe=safe)
+
+
+def canonical_query(params: dict) -> str:
+    return "&".join(
+        _encode(str(name)) + "=" + _encode(str(value)) for name, value in sorted(params.items())
+    )
+
+
+def sign_v4(method: str, path: str, params: dict, headers: dict, payload_hash: str,
+            access_key: str, secret_key: str, region: str, amz_date: str) -> str:
+    """
+    Returns the AWS Signature Version 4 Authorization header for a request
+    whose headers (all of them get signed) already include host and x-amz-date.
+    """
+    date = amz_date[:8]
+    scope = f"{date}/{region}/s3/aws4_request"
+    signed = {name.lower(): " ".join(str(value).split()) for name, value in headers.items()}
+    signed_headers = ";".join(sorted(signed))
+    canonical_request = "\n".join([
+        method,
+        path,
+        canonical_query(params),
+        "".join(f"{name}:{signed[name]}\n" for name in sorted(signed)),
+        signed_headers,
+        payload_hash,
+    ])
+    string_to_sign = "\n".join([
+        "AWS4-HMAC-SHA256",
+        amz_date,
+        scope,
+        hashlib.sha256(canonical_request.encode("utf-8")).hexdigest(),
+    ])
+    key = _hmac(("AWS4" + secret_key).encode("utf-8"), date)
+    for part in (region, "s3", "aws4_request"):
+        key = _hmac(key, part)
+    signature = hmac.new(key, string_to_sign.encode("utf-8"), hashlib.sha256).hexdigest()
+    return (f"AWS4-HMAC-SHA256 Credential={access_key}/{scope}, "
+            f"SignedHeaders={signed_headers}, Signature={signature}")
+
+
+def _xml_text(body: bytes, tag: str) -> Optional[str]:
+    root = ElementTree.fromstring(body)
+    for element in root.iter():
+        if element.tag.rsplit("}", 1)[-1] == tag:
+            return element.text
+    return None
+
+
+class S3Client:
+    """
+    Minimal S3 API client (path-style addressing, SigV4) over one pooled
+    httpx connection pool. Works with AWS S3, MinIO and other compatible stores.
+    """
+
+    def __init__(self, endpoint: str = S3_ENDPOINT, bucket: str = S3_BUCKET, region: str = S3_REGION,
+                 access_key: str = S3_ACCESS_KEY, secret_key: str = S3_SECRET_KEY, prefix: str = S3_PREFIX,
+                 max_connections: int = S3_MAX_CONNECTIONS, transport=None):
+        self.endpoint = endpoint.rstrip("/")
+        self.bucket = bucket
+        self.region = region
+        self.access_key = access_key
+        self.secret_key = secret_key
+        self.prefix = prefix
+        self.host = httpx.URL(self.endpoint).netloc.decode("ascii")
+        self.client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            timeout=httpx.Timeout(S3_TIMEOUT),
+            transport=transport,
+        )
+
+    def object_path(self, key: str) -> str:
+        return "/" + _encode(self.bucket) + "/" + _encode(self.prefix + key, safe="-_.~/")
+
+    async def request(self, method: str, key: str, params: Optional[dict] = None, headers: Optional[dict] = None,
+                      content: Optional[bytes] = None, ok=(200,)) -> httpx.Response:
+        params = params or {}
+        path = self.object_path(key)
+        amz_date = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+        headers = {
+            "host": self.host,
+            "x-amz-date": amz_date,
+            "x-amz-content-sha256": UNSIGNED_PAYLOAD,
+            **(headers or {}),
+        }
+        headers["authorization"] = sign_v4(
+            method, path, params, headers, UNSIGNED_PAYLOAD,
+            self.access_key, self.secret_key, self.region, amz_date,
+        )
+        query = canonical_query(params)
+        url = self.endpoint + path + ("?" + query if query else "")
+        response = await self.client.request(method, url, headers=headers, content=content)
+        if response.status_code not in ok:
+            if response.status_code == 404 and method in ("GET", "HEAD"):
+                raise FileNotFoundError(key)
+            raise S3Error(response.status_code, response.text)
+        return response
+
+    async def put_object(self, key: str, data: bytes) -> None:
+        await self.request("PUT", key, content=data)
+
+    async def get_range(self, key: str, start: int, end: int):
+        """
+        Reads the inclusive byte range; returns (data, object size) or None when
+        the range starts past the end of the object.
+        """
+        response = await self.request("GET", key, headers={"range": f"bytes={start}-{end}"}, ok=(200, 206, 416))
+        if response.status_code == 416:
+            return None
+        if response.status_code == 200:
+            # сервер проигнорировал Range и отдал объект целиком
+            return response.content[start:end + 1], len(response.content)
+        match = CONTENT_RANGE.match(response.headers.get("content-range", ""))
+        if match is None:
+            raise S3Error(response.status_code, "missing Content-Range")
+        return response.content, int(match.group(3))
+
+    async def head_object(self, key: str) -> int:
+        response = await self.request("HEAD", key)
+        return int(response.headers["content-length"])
+
+    async def delete_object(self, key: str) -> None:
+        await self.request("DELETE", key, ok=(200, 204, 404))
+
+    async def copy_object(self, key: str, new_key: str) -> None:
+        source = self.object_path(key)
+        response = await self.request("PUT", new_key, headers={"x-amz-copy-source": source})
+        # CopyObject может вернуть 200 с ошибкой в теле
+        if b"<Error>" in response.content:
+            raise S3Error(response.status_code, response.text)
+
+    async def create_multipart_upload(self, key: str) -> str:
+        response = await self.request("POST", key, params={"uploads": ""})
+        return _xml_text(response.content, "UploadId")
+
+    async def upload_part(self, key: str, upload_id: str, number: int, data: bytes) -> str:
+        response = await self.request("PUT", key, params={"partNumber": number, "uploadId": upload_id}, content=data)
+        return response.headers["etag"]
+
+    async def upload_part_copy(self, key: str, upload_id: str, number: int, source_key: str,
+                               start: int, end: int) -> str:
+        response = await self.request(
+            "PUT", key,
+            params={"partNumber": number, "uploadId": upload_id},
+            headers={
+                "x-amz-copy-source": self.object_path(source_key),
+                "x-amz-copy-source-range": f"bytes={start}-{end}",
+            },
+        )
+        return _xml_text(response.content, "ETag")
+
+    async def complete_multipart_upload(self, key: str, upload_id: str, etags: dict) -> None:
+        parts = "".join(
+            f"<Part><PartNumber>{number}</PartNumber><ETag>{etags[number]}</ETag></Part>"
+            for number in sorted(etags)
+        )
+        body = f"<CompleteMultipartUpload>{parts}</CompleteMultipartUpload>".encode("utf-8")
+        response = await self.request("POST", key, params={"uploadId": upload_id}, content=body)
+        if b"<Error>" in response.content:
+            raise S3Error(response.status_code, response.text)
+
+    async def abort_multipart_upload(self, key: str, upload_id: str) -> None:
+        await self.request("DELETE", key, params={"uploadId": upload_id}, ok=(200, 204, 404))
@@ -0,0 +1,59 @@
+# app/services/search_service.py
+from sqlalchemy import select, func, case, cast, union_all, Float, literal
+
+from app.file.access_db import AccessDB
+from app.file.db import SessionLocal
+from app.file.file import FileSearchItem, FileSearchResponse
+from app.file.file_db import FileDB
+from app.file.pagination import decode_cursor, apply_keyset, split_page
+
+SEARCH_NAME = func.lower(FileDB.name)
+
+
+def normalize_query(query: str) -> str:
+    # так же, как в индексе: lower(name); пробелы по краям и повторные пробелы не значимы
+    return " ".join(query.split()).lower()
+
+
+class SearchService:
+    def _branch(self, query: str, scope, shared: bool):
+        rank = cast(func.similarity(SEARCH_NAME, query), Float) + case(
+            (SEARCH_NAME == query, 2.0),
+            (SEARCH_NAME.startswith(query, autoescape=True), 1.0),
+            else_=0.0,
+        )
+        return select(
+            FileDB.id,
+            FileDB.name,
+            FileDB.size,
+            FileDB.uploaded_at,
+            FileDB.is_folder,
+            FileDB.parent_id,
+            literal(shared).label("shared"),
+            rank.label("rank"),
+        ).where(scope, FileDB.deleted_at.is_(None), SEARCH_NAME.contains(query, autoescape=True))
+
+    async def search(self, user_id: str, query: str, cursor=None, limit: int = 20) -> FileSearchResponse:
+        """
+        Substring search over the user's own files and files shared with them.
+        Exact names rank first, then prefixes, then by trigram similarity.
+        """
+        query = normalize_query(query)
+        if not query:
+            raise ValueError("Пустой поисковый запрос")
+        after = decode_cursor(cursor)
+        owned = self._branch(query, FileDB.user_id == user_id, False)
+        # права выдаются на отдельные файлы; semi-join не даёт дублей при нескольких записях доступа
+        shared = self._branch(query, FileDB.id.in_(
+            select(AccessDB.file_id).where(AccessDB.user_id == user_id)
+        ), True).where(FileDB.user_id != user_id)
+        hits = union_all(owned, shared).subquery("hits")
+        key = (hits.c.rank, hits.c.id)
+        stmt = apply_keyset(select(hits), key, after, descending=True, limit=limit)
+        async with SessionLocal() as session:
+            result = await session.execute(stmt)
+            rows, next_cursor = split_page(result.all(), key, limit)
+        return FileSearchResponse(
+            items=[FileSearchItem(**row._mapping) for row in rows],
+            next_cursor=next_cursor,
+        )
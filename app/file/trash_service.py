@@ -0,0 +1,109 @@
+# app/services/trash_service.py
+import os
+from datetime import datetime
+
+from sqlalchemy import select, update, delete
+
+from app.file.access_db import AccessDB
+from app.file.content_store import ContentStore
+from app.file.db import SessionLocal
+from app.file.file import TrashItem, TrashListResponse
+from app.file.file_db import FileDB, FileChunkDB
+from app.file.folder_service import ITEM_COLUMNS, resolve_parent_path
+from app.file.pagination import decode_cursor, apply_keyset, split_page
+from app.file.version_db import FileVersionChunkDB
+
+PURGE_BATCH_SIZE = int(os.getenv("TRASH_PURGE_BATCH_SIZE", 500))
+# часы (UTC), в которые разрешена очистка, например "1-6"; пусто — в любое время
+PURGE_HOURS = os.getenv("TRASH_PURGE_HOURS", "")
+
+
+def in_purge_window(now: datetime, hours: str = PURGE_HOURS) -> bool:
+    if not hours:
+        return True
+    start, _, end = hours.partition("-")
+    start, end = int(start), int(end or start)
+    if start <= end:
+        return start <= now.hour <= end
+    return now.hour >= start or now.hour <= end
+
+
+class TrashService:
+    def __init__(self, blob_store=None):
+        self.content_store = ContentStore(blob_store)
+
+    async def list_trash(self, user_id: str, cursor=None, limit: int = 50) -> TrashListResponse:
+        key = (FileDB.deleted_at, FileDB.id)
+        stmt = select(*ITEM_COLUMNS, FileDB.deleted_at).where(
+            FileDB.user_id == user_id,
+            FileDB.trash_id == FileDB.id,
+        )
+        stmt = apply_keyset(stmt, key, decode_cursor(cursor), descending=True, limit=limit)
+        async with SessionLocal() as session:
+            result = await session.execute(stmt)
+            rows, next_cursor = split_page(result.all(), key, limit)
+        return TrashListResponse(items=[TrashItem(**row._mapping) for row in rows], next_cursor=next_cursor)
+
+    async def restore(self, file_id: str, user_id: str):
+        async with SessionLocal() as session:
+            result = await session.execute(
+                select(FileDB.parent_id).where(
+                    FileDB.id == file_id,
+                    FileDB.user_id == user_id,
+                    FileDB.trash_id == file_id,
+                )
+            )
+            row = result.one_or_none()
+            if row is None:
+                raise ValueError("Файл не найден в корзине")
+            try:
+                await resolve_parent_path(session, row.parent_id, user_id)
+            except ValueError:
+                raise ValueError("Родительская папка удалена")
+            await session.execute(
+                update(FileDB)
+                .where(FileDB.trash_id == file_id, FileDB.user_id == user_id)
+                .values(deleted_at=None, trash_id=None)
+                .execution_options(synchronize_session=False)
+            )
+            await session.commit()
+
+    async def purge_batch(self, cutoff: datetime, batch_size: int = PURGE_BATCH_SIZE) -> list:
+        """
+        Hard-deletes one batch of rows trashed before the cutoff in its own transaction
+        and returns their (user_id, size). Blobs are only released here; the blob GC
+        reclaims them.
+        """
+        async with SessionLocal() as session:
+            result = await session.execute(
+                select(FileDB.id)
+                .where(FileDB.deleted_at < cutoff)
+                .limit(batch_size)
+                .with_for_update(skip_locked=True)
+            )
+            file_ids = result.scalars().all()
+            if not file_ids:
+                return []
+            result = await session.execute(
+                delete(FileChunkDB).where(FileChunkDB.file_id.in_(file_ids)).returning(FileChunkDB.storage_key)
+            )
+            storage_keys = result.scalars().all()
+            # версии удаляются каскадом, но ссылки их чанков на блобы нужно отпустить явно
+            result = await session.execute(
+                delete(FileVersionChunkDB)
+                .where(FileVersionChunkDB.file_id.in_(file_ids))
+                .returning(FileVersionChunkDB.storage_key)
+            )
+            storage_keys += result.scalars().all()
+            await self.content_store.release(session, storage_keys)
+            # у access нет каскада, выданные на файл права удаляем вместе с ним
+            await session.execute(delete(AccessDB).where(AccessDB.file_id.in_(file_ids)))
+            result = await session.execute(
+                delete(FileDB)
+                .where(FileDB.id.in_(file_ids))
+                .returning(FileDB.user_id, FileDB.size)
+                .execution_options(synchronize_session=False)
+            )
+            purged = result.all()
+            await session.commit()
+        return purged
@@ -0,0 +1,25 @@
+# app/models/upload_session_db.py
+from sqlalchemy import Column, String, Integer, BigInteger, DateTime, ForeignKey
+from sqlalchemy.dialects.postgresql import UUID
+import uuid
+from datetime import datetime
+
+from app.file.db import Base
+
+
+class UploadSessionDB(Base):
+    __tablename__ = "upload_sessions"
+    id = Column(String, primary_key=True, default=lambda: "upload-" + str(uuid.uuid4()))
+    name = Column(String, nullable=False)
+    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=False)
+    parent_id = Column(String, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+
+
+class UploadPartDB(Base):
+    __tablename__ = "upload_parts"
+    session_id = Column(String, ForeignKey("upload_sessions.id", ondelete="CASCADE"), primary_key=True)
+    part_number = Column(Integer, primary_key=True)
+    size = Column(BigInteger, nullable=False)
+    content_hash = Column(String(64), nullable=False)
+    storage_key = Column(String, nullable=False)
@@ -0,0 +1,205 @@
+# app/services/upload_session_service.py
+import hashlib
+from datetime import datetime
+
+from sqlalchemy import select, update, delete
+from sqlalchemy.dialects.postgresql import insert
+
+from app.file.content_store import ContentStore
+from app.file.db import SessionLocal
+from app.file.file import FileUploadResponse, UploadPartItem, UploadSessionResponse
+from app.file.file_db import FileDB, FileChunkDB, new_id, child_path
+from app.file.folder_service import resolve_parent_path
+from app.file.upload_session_db import UploadSessionDB, UploadPartDB
+from app.file.versions import find_by_name, archive_current
+
+
+def parts_hash(hashes) -> str:
+    """
+    Content hash of a file assembled from upload parts: sha256 over the parts'
+    sha256 digests in order. Each part is hashed while it streams in, so
+    completing a session never reads the content back.
+    """
+    digest = hashlib.sha256()
+    for part_hash in hashes:
+        digest.update(bytes.fromhex(part_hash))
+    return digest.hexdigest()
+
+
+class UploadSessionService:
+    def __init__(self, blob_store=None):
+        self.content_store = ContentStore(blob_store)
+
+    async def _get_session(self, session, session_id: str, user_id: str, lock: bool = False) -> UploadSessionDB:
+        stmt = select(UploadSessionDB).where(
+            UploadSessionDB.id == session_id,
+            UploadSessionDB.user_id == user_id,
+        )
+        if lock:
+            # блокировка строки сессии упорядочивает запись частей, сборку и отмену
+            stmt = stmt.with_for_update()
+        result = await session.execute(stmt)
+        upload = result.scalar_one_or_none()
+        if upload is None:
+            raise ValueError("Сессия загрузки не найдена")
+        return upload
+
+    async def _get_parts(self, session, session_id: str) -> list[UploadPartDB]:
+        result = await session.execute(
+            select(UploadPartDB)
+            .where(UploadPartDB.session_id == session_id)
+            .order_by(UploadPartDB.part_number)
+        )
+        return list(result.scalars().all())
+
+    async def create_session(self, user_id: str, name: str, parent_id=None) -> UploadSessionResponse:
+        upload = UploadSessionDB(id=new_id("upload"), name=name, user_id=user_id, parent_id=parent_id)
+        async with SessionLocal() as session:
+            await resolve_parent_path(session, parent_id, user_id)
+            session.add(upload)
+            await session.commit()
+            await session.refresh(upload)
+        return self._to_response(upload, [])
+
+    async def get_session(self, session_id: str, user_id: str) -> UploadSessionResponse:
+        async with SessionLocal() as session:
+            upload = await self._get_session(session, session_id, user_id)
+            parts = await self._get_parts(session, session_id)
+        return self._to_response(upload, parts)
+
+    async def upload_part(self, session_id: str, part_number: int, user_id: str, chunks,
+                          policy=None) -> UploadPartItem:
+        async with SessionLocal() as session:
+            upload = await self._get_session(session, session_id, user_id)
+            if policy is not None:
+                # тип определяется по началу файла, то есть по первой части
+                chunks = policy.guard(chunks, upload.name, check_type=part_number == 1)
+            # не держим соединение с БД, пока принимаем тело части
+            await session.commit()
+
+            blob = await self.content_store.put(session, chunks)
+            try:
+                # сессию могли уже собрать или отменить, пока принималось тело части
+                await self._get_session(session, session_id, user_id, lock=True)
+                result = await session.execute(
+                    select(UploadPartDB.content_hash).where(
+                        UploadPartDB.session_id == session_id,
+                        UploadPartDB.part_number == part_number,
+                    )
+                )
+                previous_hash = result.scalar_one_or_none()
+                # повторная отправка той же части заменяет предыдущую
+                stmt = insert(UploadPartDB).values(
+                    session_id=session_id,
+                    part_number=part_number,
+                    size=blob.size,
+                    content_hash=blob.hash,
+                    storage_key=blob.hash,
+                )
+                stmt = stmt.on_conflict_do_update(
+                    index_elements=[UploadPartDB.session_id, UploadPartDB.part_number],
+                    set_={
+                        "size": stmt.excluded.size,
+                        "content_hash": stmt.excluded.content_hash,
+                        "storage_key": stmt.excluded.storage_key,
+                    },
+                )
+                await session.execute(stmt)
+                if previous_hash:
+                    await self.content_store.release(session, [previous_hash])
+                await session.commit()
+            except Exception:
+                await self.content_store.discard(blob)
+                raise
+        return UploadPartItem(part_number=part_number, size=blob.size, sha256=blob.hash)
+
+    async def complete(self, session_id: str, user_id: str, policy=None) -> FileUploadResponse:
+        async with SessionLocal() as session:
+            upload = await self._get_session(session, session_id, user_id, lock=True)
+            parts = await self._get_parts(session, session_id)
+            if not parts:
+                raise ValueError("Не загружено ни одной части")
+            numbers = [part.part_number for part in parts]
+            if numbers != list(range(1, len(parts) + 1)):
+                missing = sorted(set(range(1, numbers[-1] + 1)) - set(numbers))
+                raise ValueError("Отсутствуют части: " + ", ".join(map(str, missing)))
+
+            # части становятся чанками файла как есть, без склейки блобов и без повторного чтения
+            content_hash = parts_hash([part.content_hash for part in parts])
+            parent_path = await resolve_parent_path(session, upload.parent_id, user_id, lock=True)
+            stored_size, codec = await self.content_store.describe(session, [part.content_hash for part in parts])
+            size = sum(part.size for part in parts)
+            if policy is not None:
+                policy.check_size(size)
+            uploaded_at = datetime.utcnow()
+            existing = await find_by_name(session, upload.user_id, upload.parent_id, [upload.name])
+            if upload.name in existing:
+                # файл с таким именем уже есть в папке — собранный файл становится его новой версией
+                file_id = existing[upload.name]
+                await archive_current(session, [file_id])
+                await session.execute(
+                    update(FileDB).where(FileDB.id == file_id).values(
+                        size=size,
+                        content_hash=content_hash,
+                        stored_size=stored_size,
+                        codec=codec,
+                        uploaded_at=uploaded_at,
+                    )
+                )
+            else:
+                file_id = new_id("file")
+                session.add(FileDB(
+                    id=file_id,
+                    name=upload.name,
+                    size=size,
+                    uploaded_at=uploaded_at,
+                    user_id=upload.user_id,
+                    parent_id=upload.parent_id,
+                    content_hash=content_hash,
+                    stored_size=stored_size,
+                    codec=codec,
+                    path=child_path(parent_path, file_id),
+                ))
+            session.add_all([
+                FileChunkDB(
+                    file_id=file_id,
+                    seq=seq,
+                    storage_key=part.storage_key,
+                    blob_offset=0,
+                    length=part.size,
+                )
+                for seq, part in enumerate(parts)
+            ])
+            # ссылки частей переходят к чанкам файла, поэтому сессия должна исчезнуть ровно один раз
+            result = await session.execute(delete(UploadPartDB).where(UploadPartDB.session_id == session_id))
+            if result.rowcount != len(parts):
+                raise ValueError("Сессия загрузки не найдена")
+            result = await session.execute(delete(UploadSessionDB).where(UploadSessionDB.id == session_id))
+            if result.rowcount != 1:
+                raise ValueError("Сессия загрузки не найдена")
+            await session.commit()
+        return FileUploadResponse(id=file_id, name=upload.name, size=size, uploaded_at=uploaded_at)
+
+    async def abort(self, session_id: str, user_id: str):
+        async with SessionLocal() as session:
+            await self._get_session(session, session_id, user_id, lock=True)
+            result = await session.execute(
+                delete(UploadPartDB).where(UploadPartDB.session_id == session_id).returning(UploadPartDB.storage_key)
+            )
+            await self.content_store.release(session, result.scalars().all())
+            result = await session.execute(delete(UploadSessionDB).where(UploadSessionDB.id == session_id))
+            if result.rowcount != 1:
+                raise ValueError("Сессия загрузки не найдена")
+            await session.commit()
+
+    def _to_response(self, upload: UploadSessionDB, parts: list[UploadPartDB]) -> UploadSessionResponse:
+        return UploadSessionResponse(
+            session_id=upload.id,
+            name=upload.name,
+            parent_id=upload.parent_id,
+            created_at=upload.created_at,
+            parts=[
+                UploadPartItem(part_number=part.part_number, size=part.size, sha256=part.content_hash)
+                for part in parts
+            ],
+        )
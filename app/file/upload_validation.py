@@ -0,0 +1,217 @@
+# app/file/upload_validation.py
+import logging
+import re
+from dataclasses import dataclass
+from typing import AsyncIterator, Optional
+
+import httpx
+from fastapi import HTTPException
+from starlette.responses import JSONResponse
+
+from app.file.config_client import get_config_client
+
+# запас на заголовки multipart поверх самого файла
+MULTIPART_OVERHEAD = 64 * 1024
+
+# сигнатуры форматов и расширения, которые им соответствуют
+SIGNATURES = (
+    (b"%PDF-", {"pdf"}),
+    (b"\x89PNG\r\n\x1a\n", {"png"}),
+    (b"\xff\xd8\xff", {"jpg", "jpeg"}),
+    (b"GIF87a", {"gif"}),
+    (b"GIF89a", {"gif"}),
+    (b"BM", {"bmp"}),
+    (b"II*\x00", {"tif", "tiff"}),
+    (b"MM\x00*", {"tif", "tiff"}),
+    (b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1", {"doc", "xls", "ppt", "msg"}),  # OLE2
+    (b"{\\rtf", {"rtf"}),
+    (b"\x1f\x8b", {"gz", "tgz"}),
+    (b"\x28\xb5\x2f\xfd", {"zst"}),
+    (b"BZh", {"bz2"}),
+    (b"\xfd7zXZ\x00", {"xz"}),
+    (b"7z\xbc\xaf\x27\x1c", {"7z"}),
+    (b"Rar!\x1a\x07", {"rar"}),
+    (b"ID3", {"mp3"}),
+    (b"\xff\xfb", {"mp3"}),
+    (b"OggS", {"ogg", "oga", "ogv", "opus"}),
+    (b"fLaC", {"flac"}),
+    (b"\x1aE\xdf\xa3", {"mkv", "webm"}),
+)
+# zip-контейнеры различаем по первым записям архива
+ZIP_CONTAINERS = (
+    (b"word/", {"docx"}),
+    (b"xl/", {"xlsx"}),
+    (b"ppt/", {"pptx"}),
+    (b"mimetypeapplication/vnd.oasis.opendocument.text", {"odt"}),
+    (b"mimetypeapplication/vnd.oasis.opendocument.spreadsheet", {"ods"}),
+    (b"mimetypeapplication/epub+zip", {"epub"}),
+    (b"META-INF/MANIFEST.MF", {"jar"}),
+    (b"AndroidManifest.xml", {"apk"}),
+)
+# текст по сигнатуре не отличить, поэтому для него доверяем расширению из этого списка
+TEXT_TYPES = {"txt", "csv", "tsv", "md", "json", "xml", "html", "htm", "svg", "yaml", "yml", "log", "ini"}
+
+logger = logging.getLogger(__name__)
+
+
+class FileTooLarge(ValueError):
+    def __init__(self, limit: int):
+        super().__init__(f"Файл больше допустимых {limit} байт")
+        self.limit = limit
+
+
+class FileTypeNotAllowed(ValueError):
+    def __init__(self):
+        super().__init__("Тип файла не разрешён")
+
+
+def _extension(filename: Optional[str]) -> Optional[str]:
+    if not filename or "." not in filename:
+        return None
+    return filename.rsplit(".", 1)[1].lower()
+
+
+def _looks_like_text(head: bytes) -> bool:
+    if b"\x00" in head:
+        return False
+    try:
+        # последний символ мог разрезаться границей чанка
+        head.decode("utf-8")
+    except UnicodeDecodeError as e:
+        return e.start >= len(head) - 3
+    return True
+
+
+def detect_types(head: bytes, filename: Optional[str] = None) -> set:
+    """
+    Extensions that the content may have, judging by its first bytes. For text,
+    which has no signature, the claimed extension is accepted if it is a text one.
+    """
+    for signature, types in SIGNATURES:
+        if head.startswith(signature):
+            return types
+    if head.startswith(b"PK\x03\x04"):
+        for marker, types in ZIP_CONTAINERS:
+            if marker in head[:4096]:
+                return types
+        return {"zip"}
+    if head[4:8] == b"ftyp":
+        return {"mp4", "m4a", "m4v", "mov", "heic", "avif"}
+    if head.startswith(b"RIFF"):
+        return {b"WEBP": {"webp"}, b"WAVE": {"wav"}, b"AVI ": {"avi"}}.get(head[8:12], set())
+    if _looks_like_text(head[:4096]):
+        extension = _extension(filename)
+        return {"txt", extension} if extension in TEXT_TYPES else {"txt"}
+    return set()
+
+
+@dataclass(frozen=True)
+class UploadPolicy:
+    max_file_size: int = 0  # 0 — без ограничения
+    allowed_types: frozenset = frozenset()  # пусто — любые типы
+
+    @classmethod
+    def from_config(cls, config: dict) -> "UploadPolicy":
+        allowed = {re.sub(r"^\.", "", str(item)).lower() for item in config.get("allowed_file_types") or []}
+        return cls(int(config.get("max_file_size") or 0), frozenset(allowed))
+
+    def check_size(self, size: Optional[int]) -> None:
+        if self.max_file_size > 0 and size is not None and size > self.max_file_size:
+            raise FileTooLarge(self.max_file_size)
+
+    def check_type(self, head: bytes, filename: Optional[str] = None) -> None:
+        if self.allowed_types and not detect_types(head, filename) & self.allowed_types:
+            raise FileTypeNotAllowed()
+
+    async def guard(self, chunks, filename: Optional[str] = None, check_type: bool = True) -> AsyncIterator[bytes]:
+        """
+        Passes the upload through, checking the type on the first chunk and
+        aborting as soon as the byte count goes over the limit.
+        """
+        size = 0
+        first = True
+        async for chunk in chunks:
+            if first and check_type:
+                self.check_type(chunk, filename)
+            first = False
+            size += len(chunk)
+            self.check_size(size)
+            yield chunk
+        if first and check_type:
+            self.check_type(b"", filename)
+
+
+async def get_upload_policy() -> UploadPolicy:
+    # настройки берутся из локальной копии конфигурации, обращения к сервису — раз в TTL
+    try:
+        config = await get_config_client().get_config()
+    except httpx.HTTPError:
+        logger.exception("Config service is unavailable")
+        raise HTTPException(status_code=503, detail="Сервис конфигурации недоступен")
+    return UploadPolicy.from_config(config)
+
+
+class UploadSizeLimitMiddleware:
+    """
+    Rejects single-file uploads by Content-Length before the body is read and
+    cuts off bodies that keep streaming past the limit. In both cases the 413
+    is sent by the middleware itself, whatever the endpoint makes of the
+    interrupted body.
+    """
+
+    def __init__(self, app, paths):
+        self.app = app
+        self.paths = [re.compile(path) for path in paths]
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in ("POST", "PUT") \
+                or not any(path.fullmatch(scope["path"]) for path in self.paths):
+            await self.app(scope, receive, send)
+            return
+        try:
+            policy = await get_upload_policy()
+        except HTTPException as e:
+            await JSONResponse({"detail": e.detail}, status_code=e.status_code)(scope, receive, send)
+            return
+        if policy.max_file_size <= 0:
+            await self.app(scope, receive, send)
+            return
+
+        limit = policy.max_file_size + MULTIPART_OVERHEAD
+        content_length = dict(scope["headers"]).get(b"content-length")
+        if content_length is not None and content_length.isdigit() and int(content_length) > limit:
+            response = JSONResponse({"detail": str(FileTooLarge(policy.max_file_size))}, status_code=413)
+            await response(scope, receive, send)
+            return
+
+        received = 0
+        exceeded = False
+        started = False
+
+        async def limited_receive():
+            nonlocal received, exceeded
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    exceeded = True
+            if exceeded:
+                raise FileTooLarge(policy.max_file_size)
+            return message
+
+        async def guarded_send(message):
+            nonlocal started
+            # обработчик мог превратить оборванное тело в 500 или ошибку элемента — такой ответ заменяем на 413
+            if exceeded and not started:
+                return
+            started = started or message["type"] == "http.response.start"
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, guarded_send)
+        except Exception:
+            if not exceeded or started:
+                raise
+        if exceeded and not started:
+            response = JSONResponse({"detail": str(FileTooLarge(policy.max_file_size))}, status_code=413)
+            await response(scope, receive, send)
@@ -0,0 +1,36 @@
+# app/models/version_db.py
+from sqlalchemy import Column, String, Integer, BigInteger, DateTime, ForeignKey, ForeignKeyConstraint
+from datetime import datetime
+
+from app.file.db import Base
+
+
+# Прошлое содержимое файла; текущее лежит в files/file_chunks
+class FileVersionDB(Base):
+    __tablename__ = "file_versions"
+    file_id = Column(String, ForeignKey("files.id", ondelete="CASCADE"), primary_key=True)
+    number = Column(Integer, primary_key=True)
+    size = Column(BigInteger, nullable=False)
+    content_hash = Column(String(64), nullable=True)
+    stored_size = Column(BigInteger, nullable=True)
+    codec = Column(String, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+
+
+# Чанки версии ссылаются на те же блобы, что и у соседних версий: неизменённые диапазоны не копируются
+class FileVersionChunkDB(Base):
+    __tablename__ = "file_version_chunks"
+    file_id = Column(String, primary_key=True)
+    number = Column(Integer, primary_key=True)
+    seq = Column(Integer, primary_key=True)
+    storage_key = Column(String, nullable=False)
+    blob_offset = Column(BigInteger, nullable=False, default=0)
+    length = Column(BigInteger, nullable=False)
+
+    __table_args__ = (
+        ForeignKeyConstraint(
+            ["file_id", "number"],
+            ["file_versions.file_id", "file_versions.number"],
+            ondelete="CASCADE",
+        ),
+    )
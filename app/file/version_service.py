@@ -0,0 +1,186 @@
+# app/services/version_service.py
+import asyncio
+import logging
+import os
+from datetime import datetime, timedelta
+
+from sqlalchemy import select, insert, update, delete, func, or_, tuple_
+
+from app.file.blob_db import BlobDB
+from app.file.db import SessionLocal
+from app.file.file import FileUploadResponse, FileVersionItem, FileVersionListResponse
+from app.file.file_db import FileDB, FileChunkDB
+from app.file.file_service import FileService
+from app.file.version_db import FileVersionDB, FileVersionChunkDB
+from app.file.versions import archive_current
+
+# политика хранения: сколько последних версий держать и сколько дней; 0 — ограничение выключено
+VERSIONS_KEEP = int(os.getenv("FILE_VERSIONS_KEEP", 20))
+VERSIONS_KEEP_DAYS = int(os.getenv("FILE_VERSIONS_KEEP_DAYS", 0))
+PRUNE_INTERVAL = int(os.getenv("VERSION_PRUNE_INTERVAL", 3600))
+PRUNE_BATCH_SIZE = int(os.getenv("VERSION_PRUNE_BATCH_SIZE", 500))
+PRUNE_PAUSE = float(os.getenv("VERSION_PRUNE_PAUSE", 1.0))
+
+logger = logging.getLogger(__name__)
+
+
+class VersionService:
+    def __init__(self, blob_store=None):
+        self.file_service = FileService(blob_store)
+        self.content_store = self.file_service.content_store
+
+    async def _get_file(self, session, file_id: str, user_id: str, lock: bool = False):
+        stmt = select(FileDB.id, FileDB.name, FileDB.version).where(
+            FileDB.id == file_id,
+            FileDB.user_id == user_id,
+            FileDB.is_folder.is_(False),
+            FileDB.deleted_at.is_(None),
+        )
+        if lock:
+            stmt = stmt.with_for_update()
+        result = await session.execute(stmt)
+        file = result.one_or_none()
+        if file is None:
+            raise ValueError("Файл не найден")
+        return file
+
+    async def _get_version(self, session, file_id: str, number: int) -> FileVersionDB:
+        result = await session.execute(
+            select(FileVersionDB).where(FileVersionDB.file_id == file_id, FileVersionDB.number == number)
+        )
+        version = result.scalar_one_or_none()
+        if version is None:
+            raise ValueError("Версия не найдена")
+        return version
+
+    async def list_versions(self, file_id: str, user_id: str) -> FileVersionListResponse:
+        async with SessionLocal() as session:
+            file = await self._get_file(session, file_id, user_id)
+            result = await session.execute(
+                select(
+                    FileVersionDB.number, FileVersionDB.size, FileVersionDB.content_hash, FileVersionDB.created_at
+                )
+                .where(FileVersionDB.file_id == file_id)
+                .order_by(FileVersionDB.number.desc())
+            )
+            rows = result.all()
+        return FileVersionListResponse(
+            id=file.id,
+            current_version=file.version,
+            items=[FileVersionItem(**row._mapping) for row in rows],
+        )
+
+    async def download_version(self, file_id: str, number: int, user_id: str, range_header=None, if_range=None):
+        async with SessionLocal() as session:
+            file = await self._get_file(session, file_id, user_id)
+            version = await self._get_version(session, file_id, number)
+            result = await session.execute(
+                select(
+                    FileVersionChunkDB.storage_key, FileVersionChunkDB.blob_offset,
+                    FileVersionChunkDB.length, BlobDB.codec, BlobDB.frames,
+                )
+                .join(BlobDB, BlobDB.hash == FileVersionChunkDB.storage_key, isouter=True)
+                .where(FileVersionChunkDB.file_id == file_id, FileVersionChunkDB.number == number)
+                .order_by(FileVersionChunkDB.seq)
+            )
+            chunks = result.all()
+        return self.file_service.build_download(
+            chunks, file.name, version.size, version.content_hash, version.created_at, range_header, if_range
+        )
+
+    async def restore_version(self, file_id: str, number: int, user_id: str) -> FileUploadResponse:
+        """
+        Makes an old version current again. The current content is kept as a new
+        version, so restoring never loses data.
+        """
+        async with SessionLocal() as session:
+            file = await self._get_file(session, file_id, user_id, lock=True)
+            version = await self._get_version(session, file_id, number)
+            await archive_current(session, [file_id])
+            result = await session.execute(
+                insert(FileChunkDB).from_select(
+                    ["file_id", "seq", "storage_key", "blob_offset", "length"],
+                    select(
+                        FileVersionChunkDB.file_id, FileVersionChunkDB.seq, FileVersionChunkDB.storage_key,
+                        FileVersionChunkDB.blob_offset, FileVersionChunkDB.length,
+                    ).where(FileVersionChunkDB.file_id == file_id, FileVersionChunkDB.number == number),
+                ).returning(FileChunkDB.storage_key)
+            )
+            # чанки теперь есть и у версии, и у текущего содержимого — на каждый нужна своя ссылка
+            await self.content_store.retain(session, result.scalars().all())
+            uploaded_at = datetime.utcnow()
+            await session.execute(
+                update(FileDB).where(FileDB.id == file_id).values(
+                    size=version.size,
+                    content_hash=version.content_hash,
+                    stored_size=version.stored_size,
+                    codec=version.codec,
+                    uploaded_at=uploaded_at,
+                )
+            )
+            await session.commit()
+        return FileUploadResponse(id=file_id, name=file.name, size=version.size, uploaded_at=uploaded_at)
+
+    async def prune_batch(self, keep: int = VERSIONS_KEEP, keep_days: int = VERSIONS_KEEP_DAYS,
+                          batch_size: int = PRUNE_BATCH_SIZE) -> int:
+        """
+        Deletes one batch of versions outside the retention policy in its own
+        transaction and releases their blobs.
+        """
+        ranked = select(
+            FileVersionDB.file_id,
+            FileVersionDB.number,
+            FileVersionDB.created_at,
+            func.row_number().over(
+                partition_by=FileVersionDB.file_id, order_by=FileVersionDB.number.desc()
+            ).label("rank"),
+        ).subquery()
+        conditions = []
+        if keep > 0:
+            conditions.append(ranked.c.rank > keep)
+        if keep_days > 0:
+            conditions.append(ranked.c.created_at < datetime.utcnow() - timedelta(days=keep_days))
+        if not conditions:
+            return 0
+        expired = select(ranked.c.file_id, ranked.c.number).where(or_(*conditions)).limit(batch_size)
+        key = tuple_(FileVersionDB.file_id, FileVersionDB.number)
+        async with SessionLocal() as session:
+            result = await session.execute(
+                select(FileVersionDB.file_id, FileVersionDB.number)
+                .where(key.in_(expired))
+                .with_for_update(skip_locked=True)
+            )
+            versions = [tuple(row) for row in result.all()]
+            if not versions:
+                return 0
+            result = await session.execute(
+                delete(FileVersionChunkDB)
+                .where(tuple_(FileVersionChunkDB.file_id, FileVersionChunkDB.number).in_(versions))
+                .returning(FileVersionChunkDB.storage_key)
+            )
+            await self.content_store.release(session, result.scalars().all())
+            await session.execute(
+                delete(FileVersionDB).where(key.in_(versions)).execution_options(synchronize_session=False)
+            )
+            await session.commit()
+        return len(versions)
+
+    async def prune(self, keep: int = VERSIONS_KEEP, keep_days: int = VERSIONS_KEEP_DAYS) -> int:
+        pruned = 0
+        while True:
+            count = await self.prune_batch(keep, keep_days)
+            pruned += count
+            if count == 0:
+                return pruned
+            await asyncio.sleep(PRUNE_PAUSE)
+
+
+async def run_version_prune_loop(version_service: VersionService, interval: int = PRUNE_INTERVAL):
+    while True:
+        try:
+            pruned = await version_service.prune()
+            if pruned:
+                logger.info("Pruned %s file versions", pruned)
+        except Exception:
+            logger.exception("Version pruning failed")
+        await asyncio.sleep(interval)
@@ -0,0 +1,63 @@
+# app/file/versions.py
+from sqlalchemy import select, insert, update, delete
+
+from app.file.file_db import FileDB, FileChunkDB
+from app.file.version_db import FileVersionDB, FileVersionChunkDB
+
+
+async def find_by_name(session, user_id, parent_id, names) -> dict:
+    """
+    Locks the live files with the given names in a folder and maps name -> id;
+    uploads under those names become new versions instead of new files.
+    """
+    parent_filter = FileDB.parent_id.is_(None) if parent_id is None else FileDB.parent_id == parent_id
+    result = await session.execute(
+        select(FileDB.id, FileDB.name)
+        .where(
+            FileDB.user_id == user_id,
+            parent_filter,
+            FileDB.name.in_(names),
+            FileDB.is_folder.is_(False),
+            FileDB.deleted_at.is_(None),
+        )
+        .order_by(FileDB.uploaded_at.desc())
+        .with_for_update()
+    )
+    existing = {}
+    for row in result.all():
+        existing.setdefault(row.name, row.id)
+    return existing
+
+
+async def archive_current(session, file_ids) -> None:
+    """
+    Turns the current content of the files into their next version rows. Chunk
+    rows move together with the blob references they hold, so nothing is copied.
+    """
+    await session.execute(
+        insert(FileVersionDB).from_select(
+            ["file_id", "number", "size", "content_hash", "stored_size", "codec", "created_at"],
+            select(
+                FileDB.id, FileDB.version, FileDB.size, FileDB.content_hash,
+                FileDB.stored_size, FileDB.codec, FileDB.uploaded_at,
+            ).where(FileDB.id.in_(file_ids)),
+        )
+    )
+    await session.execute(
+        insert(FileVersionChunkDB).from_select(
+            ["file_id", "number", "seq", "storage_key", "blob_offset", "length"],
+            select(
+                FileChunkDB.file_id, FileDB.version, FileChunkDB.seq,
+                FileChunkDB.storage_key, FileChunkDB.blob_offset, FileChunkDB.length,
+            )
+            .join(FileDB, FileDB.id == FileChunkDB.file_id)
+            .where(FileChunkDB.file_id.in_(file_ids)),
+        )
+    )
+    await session.execute(delete(FileChunkDB).where(FileChunkDB.file_id.in_(file_ids)))
+    await session.execute(
+        update(FileDB)
+        .where(FileDB.id.in_(file_ids))
+        .values(version=FileDB.version + 1)
+        .execution_options(synchronize_session=False)
+    )
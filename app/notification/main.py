@@ -2,6 +2,7 @@
 import logging
 import os
 import sys
+from contextlib import asynccontextmanager
 
 from fastapi import FastAPI
 from prometheus_fastapi_instrumentator import Instrumentator
@@ -13,6 +14,7 @@ from opentelemetry.sdk.trace.export import BatchSpanProcessor
 from opentelemetry.instrumentation.fastapi import FastAPIInstrumentor
 
 from app.notification.notification_router import notification_router
+from app.notification.dependencies import start_auth_sync
 
 
 def configure_logging(service_name: str) -> None:
@@ -45,7 +47,16 @@ service_name = os.getenv("SERVICE_NAME", "notification-service")
 configure_logging(service_name)
 tracer_provider = configure_tracing(service_name)
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    tasks = await start_auth_sync()
+    yield
+    for task in tasks:
+        task.cancel()
+
+
+app = FastAPI(lifespan=lifespan)
 FastAPIInstrumentor.instrument_app(app, tracer_provider=tracer_provider)
 Instrumentator().instrument(app).expose(app)
 